@@ -0,0 +1,204 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 01:50
+@Desc    : 作手老严 3 倍量回踩策略多日期向量化回测
+           原 废弃策略/k_line_rule_three_times_backtracking.py 一次只算一个 target_return_dt：每次 read_sql 90 天数据，
+           再逐只股票用 group.iloc[idx] 往回走最多 50 根，回测一年要整套跑几百遍；
+           这里一次读入区间全部 K 线（本地列式存储），按 code, dt 排成一条数组预先算好每根 K 线的
+           「前 5 日均量 / 是否 3 倍放量阳线 / 放量后 3 天内的最大量 K 线及其实体上沿」，
+           再按回看距离 k = 3..50 循环（而不是按日期、按股票循环），每一步对全部 (股票, 日期) 同时判断，
+           取距离最近的满足条件的放量日，最后附上入选后 N 个交易日的收益
+策略（与原实现一致，target 为回测日）：
+    1. 放量日在 target 前第 3~50 根 K 线内，且在 target 前 90 个自然日内；从近往远找，取第一个满足全部条件的
+    2. 放量日：成交量 > 前 5 日均量 × 3 且收阳
+    3. 放量日后 3 根内若有更大量，以最大量那根为基准，否则以放量日为基准；基准价 = max(开盘, 收盘)
+    4. target 收盘 >= 基准价，且放量日与 target 之间的收盘价都不超过基准价
+    5. target 成交量 >= 基准 K 线成交量 × 0.67
+    原实现的前 5 日均量只在 90 天查询窗口内滚动（窗口前 5 根为空），这里用完整历史计算
+用法：
+    python -m src.backtest.three_times 2025-10-01 2026-09-30
+"""
+import os
+import sys
+import time
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from src.utils import constants, kline_store, volume_break
+
+# 策略参数
+MIN_GAP_BARS = 3
+MAX_GAP_BARS = 50
+WINDOW_DAYS = 90
+PRE_VOL_WINDOW = 5
+VOL_MULTIPLIER = 3
+FOLLOW_BARS = 3
+RETURN_VOL_RATIO = 0.67
+
+# 入选后的持有天数（交易日），收益按回测日收盘买入、第 N 个交易日收盘卖出计算
+FORWARD_DAYS = (1, 3, 5, 10)
+# 为计算远期收益多读的自然日
+_FORWARD_PAD_DAYS = 30
+
+_LOAD_COLUMNS = ['dt', 'code', 'stock_name', 'price_open', 'price_close', 'trade_amount']
+
+
+def load_history(start_dt, end_dt):
+    """
+    读取回测所需的全部 K 线：回测区间 + 前 90 天回看 + 后 30 天远期收益
+    与原策略一致剔除科创板（688）、北交所（920）和 ST
+    """
+    load_start = (pd.to_datetime(start_dt) - timedelta(days=WINDOW_DAYS + 30)).strftime("%Y-%m-%d")
+    load_end = (pd.to_datetime(end_dt) + timedelta(days=_FORWARD_PAD_DAYS)).strftime("%Y-%m-%d")
+    df = kline_store.load_kline(load_start, load_end, columns=_LOAD_COLUMNS, exclude_st=True)
+    return df[~df['code'].str.startswith(('688', '920'))].reset_index(drop=True)
+
+
+def _shift(arr, group, k, fill):
+    """组内向前看 k 根（arr[i + k]），跨股票或越界处填 fill"""
+    out = np.full(len(arr), fill, dtype=arr.dtype)
+    if k < len(arr):
+        same = group[k:] == group[:-k]
+        out[:-k] = np.where(same, arr[k:], fill)
+    return out
+
+
+def precompute(df):
+    """
+    按 code, dt 有序的 K 线 → 回测用的数组
+    :return: dict，键为 df（排好序的 K 线）、group、pos、dt、open、close、volume、
+             pre_avg（前 5 日均量）、is_break（3 倍放量阳线）、base_price（基准价）、base_volume（基准 K 线成交量）
+    """
+    df, group, _, pos, volume = volume_break.prepare(df, 'Volume')
+    open_ = df['Open'].to_numpy(dtype='float64')
+    close = df['Close'].to_numpy(dtype='float64')
+
+    # 前 5 日均量 = 上一根 K 线的含当日 5 日均量（pos >= 1 时上一根一定是同一只股票）
+    mean = volume_break.rolling_mean(volume, pos, PRE_VOL_WINDOW)
+    pre_avg = np.where(pos >= 1, np.r_[np.nan, mean[:-1]], np.nan)
+    is_break = (volume > VOL_MULTIPLIER * pre_avg) & (close > open_)
+
+    # 放量后 FOLLOW_BARS 根内的最大量 K 线（并列取最早一根，空值不参与比较）
+    vol_filled = np.where(np.isnan(volume), -np.inf, volume)
+    follow = np.column_stack([_shift(vol_filled, group, j, -np.inf) for j in range(1, FOLLOW_BARS + 1)])
+    follow_arg = follow.argmax(axis=1)
+    use_follow = follow.max(axis=1) > volume
+    base = np.arange(len(volume)) + np.where(use_follow, follow_arg + 1, 0)
+    base_price = np.fmax(open_[base], close[base])
+
+    return {
+        'df': df,
+        'group': group,
+        'pos': pos,
+        'dt': df['dt'].to_numpy().astype('datetime64[D]'),
+        'open': open_,
+        'close': close,
+        'volume': volume,
+        'pre_avg': pre_avg,
+        'is_break': is_break,
+        'base_price': base_price,
+        'base_volume': volume[base],
+    }
+
+
+def backtest(start_dt, end_dt, df=None):
+    """
+    对 [start_dt, end_dt] 内每个交易日执行策略
+    :param df: 已读好的 K 线（load_history 的结果），默认按区间读取
+    :return: (picks, summary)
+        picks: 每个回测日的入选明细 target_dt, code, stock_name, break_dt, break_volume, pre5d_avg,
+               base_price, close, ret_1d / ret_3d / ...（小数，0.1 = 10%）
+        summary: 按回测日汇总的入选数、平均收益、胜率（收益 > 0 的比例）
+    """
+    start = time.time()
+    df = load_history(start_dt, end_dt) if df is None else df
+    a = precompute(df)
+    group, pos, dt, close, volume = a['group'], a['pos'], a['dt'], a['close'], a['volume']
+
+    # 只在回测区间内的 K 线上找信号
+    rows = np.flatnonzero((dt >= np.datetime64(str(start_dt)[:10])) & (dt <= np.datetime64(str(end_dt)[:10])))
+    earliest = dt[rows] - np.timedelta64(WINDOW_DAYS, 'D')
+    ret_close = close[rows]
+    ret_volume = volume[rows]
+    hit = np.full(len(rows), -1, dtype='int64')
+
+    # k = 2 时区间为 [r-1, r-1]，之后每步把 r-k+1 并入「放量日与回测日之间」的收盘价最大值（空值忽略）
+    mid_max = close[np.maximum(rows - 1, 0)]
+    for k in range(MIN_GAP_BARS, MAX_GAP_BARS + 1):
+        mid_max = np.fmax(mid_max, close[np.maximum(rows - k + 1, 0)])
+        idx = np.maximum(rows - k, 0)
+        base_price = a['base_price'][idx]
+        ok = (
+            (hit < 0)
+            & (pos[rows] >= k)
+            & (dt[idx] >= earliest)
+            & a['is_break'][idx]
+            & ~(ret_close < base_price)
+            & ~(mid_max > base_price)
+            & ~(ret_volume < a['base_volume'][idx] * RETURN_VOL_RATIO)
+        )
+        hit[ok] = idx[ok]
+
+    found = hit >= 0
+    r, b = rows[found], hit[found]
+    src = a['df']
+    picks = pd.DataFrame({
+        'target_dt': pd.to_datetime(dt[r]),
+        'code': src['code'].to_numpy()[r],
+        'stock_name': src['stock_name'].to_numpy()[r],
+        'break_dt': pd.to_datetime(dt[b]),
+        'break_volume': volume[b],
+        'pre5d_avg': a['pre_avg'][b],
+        'base_price': a['base_price'][b],
+        'close': close[r],
+    })
+    for n in FORWARD_DAYS:
+        future = _shift(close, group, n, np.nan)[r]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            picks[f"ret_{n}d"] = np.where(close[r] > 0, future / close[r] - 1, np.nan)
+    picks = picks.sort_values(['target_dt', 'code'], ignore_index=True)
+
+    summary = summarize(picks, dt[rows])
+    print(f"✅ 3 倍量回测完成：{str(start_dt)[:10]} ~ {str(end_dt)[:10]} 共 {summary.shape[0]} 个交易日、"
+          f"{len(picks)} 条入选，耗时 {time.time() - start:.2f}s")
+    return picks, summary
+
+
+def summarize(picks, trade_dts=None):
+    """按回测日汇总：入选数、各持有期平均收益与胜率；trade_dts 给出时没有入选的交易日也保留（入选数为 0）"""
+    agg = {'picks': ('code', 'size')}
+    for n in FORWARD_DAYS:
+        col = f"ret_{n}d"
+        agg[f"avg_{col}"] = (col, 'mean')
+        agg[f"win_{n}d"] = (col, lambda s: (s.dropna() > 0).mean() if s.notna().any() else np.nan)
+    summary = picks.groupby('target_dt').agg(**agg)
+    if trade_dts is not None:
+        summary = summary.reindex(pd.to_datetime(np.unique(trade_dts)))
+        summary['picks'] = summary['picks'].fillna(0).astype('int64')
+    summary.index.name = 'target_dt'
+    return summary.reset_index()
+
+
+def export(picks, summary, start_dt, end_dt, out_dir=None):
+    """入选明细和按日汇总写成 CSV（Excel 直接打开不乱码）"""
+    out_dir = out_dir or constants.backtest_dir
+    os.makedirs(out_dir, exist_ok=True)
+    tag = f"{str(start_dt)[:10]}_{str(end_dt)[:10]}"
+    picks_path = os.path.join(out_dir, f"three_times_picks_{tag}.csv")
+    summary_path = os.path.join(out_dir, f"three_times_summary_{tag}.csv")
+    picks.to_csv(picks_path, index=False, encoding='utf-8-sig')
+    summary.to_csv(summary_path, index=False, encoding='utf-8-sig')
+    print(f"✅ 回测结果已写出：{picks_path}、{summary_path}")
+    return picks_path, summary_path
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("用法：python -m src.backtest.three_times <开始日期> <结束日期>")
+    else:
+        picks, summary = backtest(sys.argv[1], sys.argv[2])
+        export(picks, summary, sys.argv[1], sys.argv[2])
+        print(summary.drop(columns=['target_dt']).mean(numeric_only=True).round(4).to_string())
@@ -0,0 +1,213 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 22:30
+@Desc    : MySQL 批量导入：各 ETL 统一入口
+           优先走 LOAD DATA LOCAL INFILE（DataFrame 先落成临时 TSV，由服务端整文件解析），
+           服务端未开启 local_infile 时自动退回大批量多行 INSERT（pymysql executemany 会把
+           INSERT ... VALUES 合并成多行语句），不再用 to_sql(chunksize=1000) 逐批构造 SQL
+"""
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from src.utils import constants, db
+
+# 多行 INSERT 每批行数（pymysql 会再按 max_allowed_packet 切分语句）
+INSERT_BATCH_ROWS = 20000
+
+# LOAD DATA LOCAL 被客户端 / 服务端拒绝时的错误码，遇到这些退回多行 INSERT
+_INFILE_DISABLED_ERRORS = (1148, 2068, 3948, 3950)
+
+
+def create_bulk_engine(db_config=None, **kwargs):
+    """
+    允许 LOAD DATA LOCAL INFILE 的引擎（pymysql 默认不开 local_infile）
+    默认库且没有额外参数时直接返回进程级共享引擎（utils/db.py），不再每次调用都新建连接池
+    """
+    if (db_config is None or db_config == constants.db_config) and not kwargs:
+        return db.get_engine()
+    return db.create(db_config, **kwargs)
+
+
+def _table_name(table, schema):
+    return f"`{schema}`.`{table}`" if schema else f"`{table}`"
+
+
+def _column_list(columns):
+    return ", ".join(f"`{c}`" for c in columns)
+
+
+def _error_code(e):
+    orig = getattr(e, "orig", e)
+    args = getattr(orig, "args", ())
+    return args[0] if args and isinstance(args[0], int) else None
+
+
+def _load_infile(conn, path, table, schema, targets, delimiter="\t", enclosed_by=None, ignore_lines=0,
+                 line_end="\n", set_clause=""):
+    """targets: 文件各列对应的表字段（已加反引号）或 @变量"""
+    # Windows 路径里的反斜杠在 SQL 字符串中是转义符，统一换成 /
+    path = os.path.abspath(path).replace("\\", "/")
+    enclosed = f"OPTIONALLY ENCLOSED BY '{enclosed_by}'" if enclosed_by else ""
+    delimiter = delimiter.replace("\t", "\\t")
+    line_end = line_end.replace("\r", "\\r").replace("\n", "\\n")
+    sql = (
+        f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {_table_name(table, schema)} "
+        f"CHARACTER SET utf8mb4 "
+        f"FIELDS TERMINATED BY '{delimiter}' {enclosed} "
+        f"LINES TERMINATED BY '{line_end}' "
+        f"IGNORE {ignore_lines} LINES "
+        f"({', '.join(targets)}) {set_clause}"
+    )
+    return conn.execute(text(sql)).rowcount
+
+
+def _insert_multi(conn, df, table, schema):
+    """多行 INSERT：直接用底层 DBAPI 游标 executemany，与外层事务共用同一连接"""
+    columns = list(df.columns)
+    sql = (
+        f"INSERT INTO {_table_name(table, schema)} ({_column_list(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    # NaN / NaT 转成 None 写入 NULL，numpy 标量转成 python 原生类型
+    values = df.astype(object).where(pd.notna(df), None).values.tolist()
+    cursor = conn.connection.cursor()
+    try:
+        for i in range(0, len(values), INSERT_BATCH_ROWS):
+            cursor.executemany(sql, values[i:i + INSERT_BATCH_ROWS])
+    finally:
+        cursor.close()
+    return len(values)
+
+
+# LOAD DATA 默认 ESCAPED BY '\\'：文本里的反斜杠、制表符（字段分隔）、换行（行分隔）都要转义，
+# 否则股票名称等文本字段里出现这些字符时整行错位；反斜杠必须最先转义
+_TSV_ESCAPES = (("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r"))
+
+
+def _escape_text(s):
+    """文本列按 LOAD DATA 规则转义，空值保持为空（由 na_rep 写成 \\N）"""
+    mask = s.notna()
+    if not mask.any():
+        return s
+    text_values = s[mask].astype(str)
+    for raw, escaped in _TSV_ESCAPES:
+        text_values = text_values.str.replace(raw, escaped, regex=False)
+    out = s.astype(object).copy()
+    out[mask] = text_values
+    return out
+
+
+def _write_tsv(df, path):
+    """
+    写成 LOAD DATA 默认格式的 TSV：文本列转义，NULL 写 \\N（文本里原样的 "\\N" 因反斜杠已转义，仍按字符串导入），
+    不加引号（QUOTE_NONE），字段里的双引号原样写出
+    """
+    text_cols = [c for c in df.columns if df[c].dtype == object or pd.api.types.is_string_dtype(df[c].dtype)]
+    if text_cols:
+        df = df.assign(**{c: _escape_text(df[c]) for c in text_cols})
+    df.to_csv(path, sep="\t", na_rep="\\N", header=False, index=False, lineterminator="\n", encoding="utf-8",
+              quoting=csv.QUOTE_NONE)
+
+
+def load_dataframe(conn, df, table, schema="stock", method="auto"):
+    """
+    DataFrame 批量写入 MySQL（只追加，不建表；删除旧分区等由调用方在同一事务内完成）
+    :param conn: SQLAlchemy Connection（引擎需由 create_bulk_engine 创建才能走 LOAD DATA）
+    :param df: 列名与目标表字段一致
+    :param table: 表名
+    :param schema: 库名
+    :param method: auto 优先 LOAD DATA、失败退回多行 INSERT / infile / multi
+    :return: 写入行数
+    """
+    if df is None or df.empty:
+        return 0
+    start = time.time()
+    df = df.replace([np.inf, -np.inf], np.nan)
+
+    if method in ("auto", "infile"):
+        fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=".tsv")
+        os.close(fd)
+        try:
+            _write_tsv(df, path)
+            rows = _load_infile(conn, path, table, schema, [f"`{c}`" for c in df.columns])
+            print(f"⚡ LOAD DATA 导入 {_table_name(table, schema)} {rows} 行，耗时 {time.time() - start:.2f}s")
+            return rows
+        except Exception as e:
+            if method == "infile" or _error_code(e) not in _INFILE_DISABLED_ERRORS:
+                raise
+            print(f"ℹ️  服务端未开启 local_infile（{_error_code(e)}），改用多行 INSERT")
+        finally:
+            os.remove(path)
+
+    rows = _insert_multi(conn, df, table, schema)
+    print(f"⚡ 多行 INSERT 导入 {_table_name(table, schema)} {rows} 行，耗时 {time.time() - start:.2f}s")
+    return rows
+
+
+def load_csv(conn, csv_path, table, columns, schema="stock", delimiter=",", enclosed_by='"',
+             skip_header=True, encoding="utf-8-sig", method="auto", chunk_rows=200000):
+    """
+    CSV 文件批量写入 MySQL（akshare 历史数据等大文件），替代手写的 LOAD DATA LOCAL INFILE 语句
+    :param columns: CSV 各列依次对应的表字段，不需要的列写 None 跳过
+    :param chunk_rows: 退回多行 INSERT 时按块读 CSV，避免一次性读入内存
+    :return: 写入行数
+    """
+    start = time.time()
+
+    if method in ("auto", "infile") and encoding.lower().replace("-", "") in ("utf8", "utf8sig"):
+        # Windows 下 pandas 写出的 CSV 行尾是 \r\n
+        with open(csv_path, "rb") as f:
+            line_end = "\r\n" if f.readline().endswith(b"\r\n") else "\n"
+        # 先读进 @变量，空串转 NULL（否则数值列会被写成 0）
+        targets = [f"@c{i}" for i in range(len(columns))]
+        set_clause = "SET " + ", ".join(f"`{c}` = NULLIF(@c{i}, '')" for i, c in enumerate(columns) if c)
+        try:
+            # 带 BOM 的 utf-8-sig 文件：BOM 在表头行里，跳过表头即可
+            rows = _load_infile(conn, csv_path, table, schema, targets,
+                                delimiter=delimiter, enclosed_by=enclosed_by, ignore_lines=1 if skip_header else 0,
+                                line_end=line_end, set_clause=set_clause)
+            print(f"⚡ LOAD DATA 导入 {csv_path} → {_table_name(table, schema)} {rows} 行，耗时 {time.time() - start:.2f}s")
+            return rows
+        except Exception as e:
+            if method == "infile" or _error_code(e) not in _INFILE_DISABLED_ERRORS:
+                raise
+            print(f"ℹ️  服务端未开启 local_infile（{_error_code(e)}），改用多行 INSERT")
+
+    names = [c if c else f"_skip{i}" for i, c in enumerate(columns)]
+    keep = [c for c in columns if c]
+    rows = 0
+    reader = pd.read_csv(csv_path, sep=delimiter, header=0 if skip_header else None, names=names,
+                         encoding=encoding, dtype=str, chunksize=chunk_rows, keep_default_na=False, na_values=[""])
+    for chunk in reader:
+        rows += _insert_multi(conn, chunk[keep], table, schema)
+    print(f"⚡ 多行 INSERT 导入 {csv_path} → {_table_name(table, schema)} {rows} 行，耗时 {time.time() - start:.2f}s")
+    return rows
+
+
+def load_akshare_history_csv(csv_path, engine=None):
+    """
+    akshare 历史日线 CSV（get_stock_detail_from_akshare.py 产出）导入 stock_detail
+    CSV 列：dt, stock_code, stock_name, price_open, price_close, price_highest, price_lowest,
+            trade, trade_amount, amplitude, rise, amount_increase_decrease, turnover_rate
+    """
+    engine = engine or create_bulk_engine()
+    columns = ['dt', 'code', 'stock_name', 'price_open', 'price_close', 'price_highest', 'price_lowest',
+               'trade', 'trade_amount', 'amplitude', 'rise', 'amount_increase_decrease', 'turnover_rate']
+    with engine.begin() as conn:
+        return load_csv(conn, csv_path, 'stock_detail', columns)
+
+
+if __name__ == '__main__':
+    # 用法：python -m src.etl.bulk_loader <akshare 导出的 csv 路径>
+    if len(sys.argv) < 2:
+        print("用法：python -m src.etl.bulk_loader <csv 路径>")
+    else:
+        load_akshare_history_csv(sys.argv[1])
@@ -1,9 +1,10 @@
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import datetime
 import warnings
 
 from src.utils import constants
+from src.etl import bulk_loader
 
 # 将同花顺下载的 xlsx 文件写入到 stock_detail 表
 
@@ -128,12 +129,8 @@ def import_xls_to_section_detail(xls_file_path, dt, db_config):
 
     # 4. 连接 MySQL 执行导入（先 truncate，再写入）
     try:
-        # 构建 SQLAlchemy 引擎
-        engine_url = (
-            f"mysql+pymysql://{db_config['user']}:{db_config['password']}@"
-            f"{db_config['host']}:{db_config['port']}/{db_config['database']}?charset=utf8mb4"
-        )
-        engine = create_engine(engine_url, pool_size=10, pool_recycle=3600)
+        # 构建 SQLAlchemy 引擎（开启 local_infile，批量导入走 LOAD DATA）
+        engine = bulk_loader.create_bulk_engine(db_config)
 
         with engine.connect() as conn:
             # 开启事务，保证操作原子性
@@ -145,14 +142,7 @@ def import_xls_to_section_detail(xls_file_path, dt, db_config):
                 print(f"🗑️  已删除 stock.section_detail 表 {dt} 数据")
 
                 # 步骤2：批量写入数据
-                df_final.to_sql(
-                    name='section_detail',
-                    con=conn,
-                    schema='stock',
-                    if_exists='append',
-                    index=False,
-                    chunksize=1000  # 分批写入，避免大数据量超时
-                )
+                bulk_loader.load_dataframe(conn, df_final, 'section_detail', schema='stock')
                 print(f"✅ 成功导入 {len(df_final)} 条数据到 stock.section_detail")
                 # 提交事务
                 trans.commit()
@@ -1,12 +1,15 @@
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import datetime
 import warnings
 
-from src.utils import constants
+from src.utils import constants, kline_store, feature_store
+from src.etl import bulk_loader, screen_eval
 
 # 将同花顺下载的 xlsx 文件写入到 stock_detail 表
 # 将同花顺下载的 xlsx 文件写入到 dim_stock_tag 表
+# stock_detail 入库成功后同步写入本地列式 K 线存储（utils/kline_store.py），再增量更新日频特征存储（utils/feature_store.py）
+# 批量写表统一走 etl/bulk_loader.py（LOAD DATA LOCAL INFILE，不可用时退回多行 INSERT）
 
 warnings.filterwarnings('ignore')  # 忽略Excel读取的无关警告
 
@@ -119,12 +122,8 @@ def import_xls_to_stock_detail_tmp(xls_file_path, dt, db_config):
 
     # 4. 连接 MySQL 执行导入（先 truncate，再写入）
     try:
-        # 构建 SQLAlchemy 引擎
-        engine_url = (
-            f"mysql+pymysql://{db_config['user']}:{db_config['password']}@"
-            f"{db_config['host']}:{db_config['port']}/{db_config['database']}?charset=utf8mb4"
-        )
-        engine = create_engine(engine_url, pool_size=10, pool_recycle=3600)
+        # 构建 SQLAlchemy 引擎（开启 local_infile，批量导入走 LOAD DATA）
+        engine = bulk_loader.create_bulk_engine(db_config)
 
         with engine.connect() as conn:
             # 开启事务，保证操作原子性
@@ -136,14 +135,7 @@ def import_xls_to_stock_detail_tmp(xls_file_path, dt, db_config):
                 print("🗑️  已清空 stock.stock_detail_tmp 表")
 
                 # 步骤2：批量写入数据
-                df_final.to_sql(
-                    name='stock_detail_tmp',
-                    con=conn,
-                    schema='stock',
-                    if_exists='append',
-                    index=False,
-                    chunksize=1000  # 分批写入，避免大数据量超时
-                )
+                bulk_loader.load_dataframe(conn, df_final, 'stock_detail_tmp', schema='stock')
                 print(f"✅ 成功导入 {len(df_final)} 条数据到 stock.stock_detail_tmp")
 
                 # 步骤3：删除 stock.stock_detail 表 dt 的数据
@@ -184,12 +176,42 @@ def import_xls_to_stock_detail_tmp(xls_file_path, dt, db_config):
                 # 失败回滚
                 trans.rollback()
                 raise e
+
+            # 步骤5：同步本地列式 K 线存储（看板统一从本地存储读 K 线）
+            try:
+                df_day = pd.read_sql(text("select * from stock.stock_detail where dt=:dt"), conn, params={"dt": dt})
+                rows = kline_store.write_partition(dt, df_day)
+                print(f"✅ 成功同步本地 K 线存储 dt={dt}，共 {rows} 行")
+            except Exception as e:
+                print(f"⚠️  同步本地 K 线存储失败（可执行 utils/kline_store.py 回填）：{str(e)}")
+            else:
+                # 步骤6：由昨天的特征状态递推当天的 MA / 量均 / N 日涨幅 / 连涨连跌 / ATR
+                try:
+                    feature_store.update(dt)
+                except Exception as e:
+                    print(f"⚠️  更新日频特征存储失败（可执行 python -m src.utils.feature_store 补算）：{str(e)}")
+                # 步骤7：新一天的行情到了，增量评估各看板近 10 个交易日的入选表现
+                try:
+                    screen_eval.evaluate(engine)
+                except Exception as e:
+                    print(f"⚠️  评估看板入选表现失败（可执行 python -m src.etl.screen_eval 补算）：{str(e)}")
             finally:
                 conn.close()
     except Exception as e:
         print(f"❌ 写入MySQL失败：{str(e)}")
         return
 
+def infer_exchange(code):
+    """按 6 位代码前缀推断交易所：60/68/90 沪市，00/30/20 深市，其余（4/8/92 开头）北交所"""
+    if not isinstance(code, str):
+        return None
+    if code.startswith(('60', '68', '90')):
+        return 'SH'
+    if code.startswith(('00', '30', '20')):
+        return 'SZ'
+    return 'BJ'
+
+
 def import_xls_to_dim_stock_tag(xls_file_path, dt, db_config):
     """
     将 Table.xls 的指定字段导入 MySQL 表 stock.stock_detail_tmp
@@ -241,13 +263,17 @@ def import_xls_to_dim_stock_tag(xls_file_path, dt, db_config):
             if mysql_col not in df_clean.columns:
                 df_clean[mysql_col] = None
 
+        # 股票代码统一为 6 位数字 + 交易所列（SZ000001 / 000001.SZ → 000001 + SZ）
+        # 各看板按 code 主键等值关联，不再在 join 条件里做 replace(lower(code))
+        raw_code = df_clean['code'].astype(str).str.strip().str.upper()
+        df_clean['code'] = raw_code.str.extract(r'(\d{6})', expand=False)
+        df_clean['exchange'] = raw_code.str.extract(r'(SH|SZ|BJ)', expand=False)
+        df_clean['exchange'] = df_clean['exchange'].fillna(df_clean['code'].map(infer_exchange))
+        df_clean = df_clean.dropna(subset=['code']).drop_duplicates(subset=['code'], keep='first')
+
         # 按 MySQL 表字段顺序整理最终数据
-        final_mysql_cols = ['code', 'industry', 'industry_detail']
+        final_mysql_cols = ['code', 'exchange', 'industry', 'industry_detail']
         df_final = df_clean[final_mysql_cols].copy()
-
-        # 数据类型适配（关键！避免写入MySQL时报类型错误）
-        # 股票代码转为字符串（防止00开头代码丢失前导0）
-        df_final['code'] = df_final['code'].astype(str).str.strip()
         print(f"✅ 数据清洗完成，待导入 {len(df_final)} 行有效数据")
     except Exception as e:
         print(f"❌ 数据清洗失败：{str(e)}")
@@ -255,12 +281,8 @@ def import_xls_to_dim_stock_tag(xls_file_path, dt, db_config):
 
     # 4. 连接 MySQL 执行导入（先 truncate，再写入）
     try:
-        # 构建 SQLAlchemy 引擎
-        engine_url = (
-            f"mysql+pymysql://{db_config['user']}:{db_config['password']}@"
-            f"{db_config['host']}:{db_config['port']}/{db_config['database']}?charset=utf8mb4"
-        )
-        engine = create_engine(engine_url, pool_size=10, pool_recycle=3600)
+        # 构建 SQLAlchemy 引擎（开启 local_infile，批量导入走 LOAD DATA）
+        engine = bulk_loader.create_bulk_engine(db_config)
 
         with engine.connect() as conn:
             # 开启事务，保证操作原子性
@@ -272,14 +294,7 @@ def import_xls_to_dim_stock_tag(xls_file_path, dt, db_config):
                 print("🗑️  已清空 stock.dim_stock_tag 表")
 
                 # 步骤2：批量写入数据
-                df_final.to_sql(
-                    name='dim_stock_tag',
-                    con=conn,
-                    schema='stock',
-                    if_exists='append',
-                    index=False,
-                    chunksize=1000  # 分批写入，避免大数据量超时
-                )
+                bulk_loader.load_dataframe(conn, df_final, 'dim_stock_tag', schema='stock')
                 print(f"✅ 成功导入 {len(df_final)} 条数据到 stock.dim_stock_tag")
                 # 提交事务
                 trans.commit()
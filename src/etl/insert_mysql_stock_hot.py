@@ -4,10 +4,11 @@
 @Time    : 20:00
 @Desc    : 每日热榜 top 100
 """
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from datetime import datetime
 
 from src.utils import constants
+from src.etl import bulk_loader
 
 
 def insert_mysql_stock_hot(dt, raw_str, db_config):
@@ -24,11 +25,7 @@ def insert_mysql_stock_hot(dt, raw_str, db_config):
         })
 
     # 3. 数据库连接（替换成你自己的MySQL账号信息）
-    engine_url = (
-        f"mysql+pymysql://{db_config['user']}:{db_config['password']}@"
-        f"{db_config['host']}:{db_config['port']}/{db_config['database']}?charset=utf8mb4"
-    )
-    engine = create_engine(engine_url, pool_size=10, pool_recycle=3600)
+    engine = bulk_loader.create_bulk_engine(db_config)
 
     with engine.connect() as conn:
         # 开启事务，保证操作原子性
@@ -43,14 +40,7 @@ def insert_mysql_stock_hot(dt, raw_str, db_config):
             df = pd.DataFrame(code_list)
 
             # 步骤2：批量写入数据
-            df.to_sql(
-                name='dim_stock_hot',
-                con=conn,
-                schema='stock',
-                if_exists='append',
-                index=False,
-                chunksize=1000  # 分批写入，避免大数据量超时
-            )
+            bulk_loader.load_dataframe(conn, df, 'dim_stock_hot', schema='stock')
             print(f"✅ 成功导入 {len(df)} 条数据到 stock.dim_stock_hot")
             # 提交事务
             trans.commit()
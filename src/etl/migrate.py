@@ -0,0 +1,308 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 23:00
+@Desc    : 表结构迁移工具（版本化 DDL + 执行器 + EXPLAIN 索引检查）
+           迁移脚本放在 src/sql/migrations，文件名 V<版本号>__<说明>.sql / .py，按版本号顺序执行一次，
+           已执行的版本记录在 schema_migrations 表；.py 迁移需提供 upgrade(conn)
+用法：
+    python -m src.etl.migrate              执行未应用的迁移 + 补齐分区 + EXPLAIN 检查
+    python -m src.etl.migrate status       查看迁移状态
+    python -m src.etl.migrate baseline 1   把 <=1 的版本标记为已执行（已手工执行过 create_table.sql 中的变更时用）
+    python -m src.etl.migrate partitions   补齐 stock_detail 未来月份分区
+    python -m src.etl.migrate explain      检查各看板实际查询是否命中索引 / 分区裁剪，未通过时退出码为 1
+"""
+import hashlib
+import importlib.util
+import os
+import re
+import sys
+import time
+from datetime import date
+
+import pandas as pd
+from sqlalchemy import text
+
+from src.etl import bulk_loader
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'migrations')
+_FILE_PATTERN = re.compile(r'^V(\d+)__(.+)\.(sql|py)$')
+
+# 分区至少提前建好的月数，超出部分落到 pmax
+PARTITION_MONTHS_AHEAD = 3
+
+
+# -------------------- 迁移脚本发现与执行 --------------------
+def discover_migrations():
+    """返回 [(version, name, path)]，按版本号升序"""
+    migrations = []
+    for file_name in os.listdir(MIGRATIONS_DIR):
+        m = _FILE_PATTERN.match(file_name)
+        if m:
+            migrations.append((int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, file_name)))
+    migrations.sort()
+    versions = [v for v, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"迁移版本号重复：{versions}")
+    return migrations
+
+
+def _checksum(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _ensure_history_table(conn):
+    conn.execute(text("""
+        create table if not exists schema_migrations (
+            version int not null primary key comment '迁移版本号',
+            name varchar(200) comment '迁移说明',
+            checksum char(40) comment '脚本内容 sha1',
+            applied_at datetime comment '执行时间',
+            duration_ms int comment '耗时（毫秒）'
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """))
+
+
+def applied_versions(conn):
+    _ensure_history_table(conn)
+    rows = conn.execute(text("select version, checksum from schema_migrations")).fetchall()
+    return {int(r[0]): r[1] for r in rows}
+
+
+def _split_sql(sql):
+    """按行尾分号拆分语句，忽略 -- 注释行"""
+    statements, buf = [], []
+    for line in sql.splitlines():
+        if line.strip().startswith('--') or not line.strip():
+            continue
+        buf.append(line)
+        if line.rstrip().endswith(';'):
+            statements.append('\n'.join(buf).rstrip().rstrip(';'))
+            buf = []
+    if buf:
+        statements.append('\n'.join(buf))
+    return statements
+
+
+def _run_migration(conn, path):
+    if path.endswith('.sql'):
+        with open(path, 'r', encoding='utf-8') as f:
+            for stmt in _split_sql(f.read()):
+                conn.execute(text(stmt))
+        return
+    spec = importlib.util.spec_from_file_location(f"migration_{os.path.basename(path)[:-3]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(conn)
+
+
+def upgrade(engine, target=None):
+    """
+    按版本号顺序执行未应用的迁移
+    MySQL 的 DDL 会隐式提交，无法整体回滚，所以每个版本执行成功后立即记录，失败时停在该版本
+    :param target: 只执行到该版本（含），默认全部
+    :return: 本次执行的版本列表
+    """
+    done = []
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+        conn.commit()
+        for version, name, path in discover_migrations():
+            if target is not None and version > target:
+                break
+            if version in applied:
+                if applied[version] and applied[version] != _checksum(path):
+                    print(f"⚠️  V{version:03d} {name} 已执行，但脚本内容已被修改")
+                continue
+            print(f"🚚 执行迁移 V{version:03d} {name} ...")
+            start = time.time()
+            try:
+                _run_migration(conn, path)
+                duration_ms = int((time.time() - start) * 1000)
+                conn.execute(
+                    text("insert into schema_migrations (version, name, checksum, applied_at, duration_ms) "
+                         "values (:v, :n, :c, now(), :d)"),
+                    {"v": version, "n": name, "c": _checksum(path), "d": duration_ms}
+                )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ 迁移 V{version:03d} 失败：{str(e)[:200]}")
+                raise
+            print(f"✅ V{version:03d} 完成，耗时 {duration_ms / 1000:.1f}s")
+            done.append(version)
+    if not done:
+        print("✅ 没有待执行的迁移")
+    return done
+
+
+def baseline(engine, version):
+    """把 <= version 的迁移标记为已执行（不实际执行）"""
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+        for v, name, path in discover_migrations():
+            if v <= version and v not in applied:
+                conn.execute(
+                    text("insert into schema_migrations (version, name, checksum, applied_at, duration_ms) "
+                         "values (:v, :n, :c, now(), 0)"),
+                    {"v": v, "n": name, "c": _checksum(path)}
+                )
+                print(f"📌 V{v:03d} {name} 标记为已执行")
+        conn.commit()
+
+
+def status(engine):
+    with engine.connect() as conn:
+        applied = applied_versions(conn)
+        conn.commit()
+    for version, name, path in discover_migrations():
+        flag = "✅ 已执行" if version in applied else "⏳ 待执行"
+        print(f"V{version:03d} {flag} {name}")
+
+
+# -------------------- stock_detail 月分区 --------------------
+def month_start(d):
+    return date(d.year, d.month, 1)
+
+
+def add_months(d, n):
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def partition_clause(first_month, last_month):
+    """生成 [first_month, last_month] 每月一个分区 + pmax 的分区定义"""
+    parts = []
+    m = month_start(first_month)
+    while m <= last_month:
+        nxt = add_months(m, 1)
+        parts.append(f"partition p{m:%Y%m} values less than ('{nxt:%Y-%m-%d}')")
+        m = nxt
+    parts.append("partition pmax values less than (MAXVALUE)")
+    return ",\n    ".join(parts)
+
+
+def ensure_partitions(conn, table='stock_detail', months_ahead=PARTITION_MONTHS_AHEAD):
+    """把 pmax 拆出未来 months_ahead 个月的分区（表未分区时跳过）"""
+    names = [r[0] for r in conn.execute(text(
+        "select partition_name from information_schema.partitions "
+        "where table_schema = database() and table_name = :t and partition_name is not null "
+        "order by partition_ordinal_position"), {"t": table}).fetchall()]
+    if not names or names[-1] != 'pmax':
+        print(f"ℹ️  {table} 未按月分区，跳过")
+        return 0
+    monthly = [n for n in names if re.match(r'^p\d{6}$', n)]
+    last = date(int(monthly[-1][1:5]), int(monthly[-1][5:7]), 1) if monthly else month_start(date.today())
+    target = add_months(month_start(date.today()), months_ahead)
+    if last >= target:
+        return 0
+    first_new = add_months(last, 1) if monthly else last
+    conn.execute(text(
+        f"alter table {table} reorganize partition pmax into (\n    {partition_clause(first_new, target)}\n)"
+    ))
+    added = (target.year - first_new.year) * 12 + target.month - first_new.month + 1
+    print(f"✅ {table} 新增 {added} 个月分区，已覆盖到 {target:%Y-%m}")
+    return added
+
+
+# -------------------- EXPLAIN 检查 --------------------
+def explain_queries(dt):
+    """
+    各模块实际执行的 stock_detail 查询，直接取模块里的 SQL（改了查询，检查跟着变）
+    :param dt: 交易日 yyyy-MM-dd
+    :return: [(标题, sql, 绑定参数, stock_detail 在计划里的表名 / 别名, 应访问的日期区间 (lo, hi))]，
+             hi 为 None 表示区间上不封顶（一直到 pmax）
+    """
+    from src.etl import streak_rules
+
+    one_day = importlib.import_module("src.k_line_rule_main.k_line_rule_rise_one_day_bs")
+    rise_5 = importlib.import_module("src.k_line_rule_main.k_line_rule_rise_5_upper_15%")
+    hot_top = importlib.import_module("src.k_line_rule.k_line_rule_stock_hot_top100")
+    window_start = streak_rules.window_start(dt)
+    month_ago = (pd.Timestamp(dt) - pd.DateOffset(months=1)).strftime('%Y-%m-%d')
+    return [
+        ("连涨/连跌特征表", streak_rules.FEATURE_SQL, {"start_dt": window_start, "today": dt, "signature": ""},
+         {"stock_detail"}, (window_start, dt)),
+        ("特征窗口数据签名", streak_rules.SIGNATURE_SQL, {"start_dt": window_start, "today": dt},
+         {"stock_detail"}, (window_start, dt)),
+        ("一日持股法", one_day.ONE_DAY_SQL, {"cur_dt": dt}, {"stock_detail"}, (month_ago, None)),
+        ("5日涨幅超15%", rise_5.RISE_5_SQL.format(last_dt=dt), {}, {"s"}, (dt, dt)),
+        ("热榜关联当日行情", hot_top.HOT_TOP_SQL.format(last_dt=dt), {}, {"b"}, (dt, dt)),
+    ]
+
+
+def _partition_bounds(conn, table='stock_detail'):
+    """[(分区名, 下界, 上界)]，上界为 None 表示 MAXVALUE；表未分区时返回 []"""
+    rows = conn.execute(text(
+        "select partition_name, partition_description from information_schema.partitions "
+        "where table_schema = database() and table_name = :t and partition_name is not null "
+        "order by partition_ordinal_position"), {"t": table}).fetchall()
+    bounds, lower = [], None
+    for name, desc in rows:
+        upper = None if str(desc).upper() == 'MAXVALUE' else str(desc).strip("'")[:10]
+        bounds.append((name, lower, upper))
+        lower = upper
+    return bounds
+
+
+def expected_partitions(bounds, lo, hi):
+    """与 [lo, hi] 有交集的分区（hi 为 None 时到最后一个分区）"""
+    return {name for name, lower, upper in bounds
+            if (upper is None or upper > lo) and (hi is None or lower is None or lower <= hi)}
+
+
+def explain_check(engine, dt=None):
+    """
+    对各模块实际执行的 stock_detail 查询做 EXPLAIN：
+    1. 走索引（type 不是 ALL 且用到了 key）
+    2. 分区裁剪：计划访问的分区不超出查询日期区间覆盖的分区（表未分区时跳过）
+    :return: 全部通过返回 True
+    """
+    ok = True
+    with engine.connect() as conn:
+        dt = str(dt or conn.execute(text("select max(dt) from stock_detail")).scalar())[:10]
+        bounds = _partition_bounds(conn)
+        try:
+            queries = explain_queries(dt)
+        except Exception as e:
+            print(f"❌ 加载看板查询失败：{str(e)[:200]}")
+            return False
+        for title, sql, params, tables, (lo, hi) in queries:
+            plan = pd.read_sql(text("explain " + sql.strip().rstrip(';')), conn, params=params)
+            rows = plan[plan["table"].isin(tables)]
+            if rows.empty:
+                print(f"❌ {title}: 计划里没有找到 stock_detail（{sorted(tables)}）")
+                ok = False
+                continue
+            expected = expected_partitions(bounds, lo, hi)
+            for _, r in rows.iterrows():
+                hit = r["type"] != "ALL" and r["key"] is not None
+                touched = set(str(r.get("partitions")).split(",")) if r.get("partitions") else set()
+                extra = touched - expected if bounds else set()
+                pruned = not extra
+                ok = ok and hit and pruned
+                print(f"{'✅' if hit and pruned else '❌'} {title}: type={r['type']} key={r['key']} rows={r['rows']} "
+                      f"partitions={len(touched)}/{len(expected) if bounds else '-'} {r.get('Extra') or ''}")
+                if extra:
+                    print(f"   未裁剪的分区：{', '.join(sorted(extra))}")
+    return ok
+
+
+if __name__ == '__main__':
+    engine = bulk_loader.create_bulk_engine()
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    if cmd == 'status':
+        status(engine)
+    elif cmd == 'baseline':
+        baseline(engine, int(sys.argv[2]))
+    elif cmd == 'partitions':
+        with engine.connect() as c:
+            ensure_partitions(c)
+    elif cmd == 'explain':
+        sys.exit(0 if explain_check(engine) else 1)
+    else:
+        upgrade(engine)
+        with engine.connect() as c:
+            ensure_partitions(c)
+        sys.exit(0 if explain_check(engine) else 1)
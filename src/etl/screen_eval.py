@@ -0,0 +1,241 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 02:30
+@Desc    : 看板入选记录与后续表现评估
+           各看板（M 顶、N 颈线、一日持股法、连涨 / 连跌规则…）原来只出当天的 HTML，选出来的股票之后涨没涨没有记录，
+           无法判断哪些规则值得继续跑；现在各看板生成时把入选股票写进 screen_pick，
+           每天收盘后对「还没满 10 个交易日」的入选记录批量计算 1/3/5/10 日收益和 10 日内最大（峰谷）回撤，写进 screen_pick_eval，
+           已满 10 个交易日的记录不再重算，所以每天的计算量只与最近两周的入选数有关
+用法：
+    python -m src.etl.screen_eval                 增量评估 + 输出全部历史的汇总
+    python -m src.etl.screen_eval 2026-01-01      增量评估 + 输出 2026-01-01 之后入选记录的汇总
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from src.etl import bulk_loader
+from src.utils import kline_store
+
+# 持有期（交易日），收益 = 第 N 个交易日收盘 / 买入日收盘 - 1（买入日 = 入选日，停牌时顺延到复牌日）
+HORIZONS = (1, 3, 5, 10)
+MAX_HORIZON = max(HORIZONS)
+
+EVAL_COLUMNS = (['dt', 'screen', 'code', 'entry_dt', 'price_close']
+                + [f"ret_{n}d" for n in HORIZONS]
+                + [f"max_drawdown_{MAX_HORIZON}d", 'bars_after', 'updated_at'])
+
+
+# -------------------- 记录入选 --------------------
+def record_picks(screen, dt, df, engine=None):
+    """
+    记录某个看板某天的入选股票（覆盖同一看板同一天的旧记录）
+    记录失败只打印告警，不影响看板生成
+    :param screen: 看板标识，建议用脚本名 / 规则表名
+    :param dt: 入选交易日
+    :param df: 至少包含 code，可带 stock_name
+    :return: 记录条数
+    """
+    dt = str(dt)[:10]
+    try:
+        engine = engine or bulk_loader.create_bulk_engine()
+        picks = pd.DataFrame({
+            'dt': dt,
+            'screen': screen,
+            'code': df['code'].astype(str).to_numpy(),
+            'stock_name': df['stock_name'].to_numpy() if 'stock_name' in df.columns else None,
+            'created_at': pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }).drop_duplicates('code')
+        with engine.begin() as conn:
+            conn.execute(text("delete from screen_pick where screen = :screen and dt = :dt"),
+                         {"screen": screen, "dt": dt})
+            rows = bulk_loader.load_dataframe(conn, picks, 'screen_pick')
+        print(f"📝 {screen} {dt} 入选记录 {rows} 条")
+        return rows
+    except Exception as e:
+        print(f"⚠️  {screen} 入选记录写入失败：{str(e)[:200]}")
+        return 0
+
+
+def record_from_table(conn, screen, dt, table):
+    """
+    规则结果已经在 MySQL 表里（code, stock_name）时，直接 insert ... select 记录，不经过 DataFrame
+    :param table: 规则表名，或多个规则表名（合并去重后记录）
+    """
+    tables = [table] if isinstance(table, str) else list(table)
+    source = " union ".join(f"select code, stock_name from {t}" for t in tables)
+    conn.execute(text("delete from screen_pick where screen = :screen and dt = :dt"), {"screen": screen, "dt": dt})
+    rows = conn.execute(text(f"""
+        insert into screen_pick (dt, screen, code, stock_name, created_at)
+        select distinct :dt, :screen, code, stock_name, now() from ({source}) t
+    """), {"screen": screen, "dt": dt}).rowcount
+    conn.commit()
+    return rows
+
+
+# -------------------- 评估 --------------------
+def _max_drawdown(entry, high, low, valid):
+    """
+    买入后窗口内的峰谷回撤：每根 K 线的最低价相对此前最高点（买入价与之前各根最高价的最大值）的跌幅，取最小值
+    :param entry: 买入价 (m,)
+    :param high / low: 买入后第 1..N 根 K 线的最高 / 最低价 (m, N)
+    :param valid: 对应位置是否有 K 线 (m, N)
+    :return: (m,)，<= 0；没有后续 K 线或买入价无效时为 NaN
+    """
+    highs = np.maximum.accumulate(np.where(valid, high, -np.inf), axis=1)
+    peak = np.maximum(entry[:, None], np.hstack([np.full((len(entry), 1), -np.inf), highs[:, :-1]]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dd = np.where(valid & (peak > 0), low / peak - 1, np.nan)
+    worst = np.fmin.reduce(dd, axis=1) if dd.shape[1] else np.full(len(entry), np.nan)
+    return np.where(valid.any(axis=1) & (entry > 0), np.minimum(worst, 0), np.nan)
+
+
+def compute_eval(picks, df_k):
+    """
+    向量化计算入选记录的后续表现
+    :param picks: DataFrame[dt, screen, code]，dt 为 datetime
+    :param df_k: 这些股票入选日及之后的 K 线（kline_store.load_kline 结果），至少含 dt, code, Close, High, Low
+    :return: DataFrame，列同 EVAL_COLUMNS
+             入选日停牌的记录顺延到之后第一根 K 线买入（entry_dt 为实际买入日）；
+             入选后行情里已过去 MAX_HORIZON 个交易日仍没有这只股票 K 线（长期停牌 / 退市）的记录标记为无法评估：
+             entry_dt、价格、收益为空，bars_after 记为 MAX_HORIZON，之后不再重查；
+             其余暂时还没有买入 K 线的记录不输出，下次再评估
+    """
+    if picks.empty:
+        return pd.DataFrame(columns=EVAL_COLUMNS)
+    picks = picks.reset_index(drop=True)
+    pick_code = picks['code'].astype(str).to_numpy()
+    pick_day = pd.to_datetime(picks['dt']).to_numpy(dtype='datetime64[D]').astype('int64')
+
+    df_k = df_k.sort_values(['code', 'dt'], kind='stable').reset_index(drop=True)
+    code = df_k['code'].astype(str).to_numpy()
+    day = pd.to_datetime(df_k['dt']).to_numpy(dtype='datetime64[D]').astype('int64')
+    close = df_k['Close'].to_numpy(dtype='float64')
+    high = df_k['High'].to_numpy(dtype='float64')
+    low = df_k['Low'].to_numpy(dtype='float64')
+    n = len(df_k)
+
+    # 买入 K 线：同一股票 dt >= 入选日的第一根，按 (股票序号, 日期) 整数键二分查找
+    codes, code_idx = np.unique(code, return_inverse=True)
+    pick_idx = np.searchsorted(codes, pick_code)
+    known = pick_idx < len(codes)
+    known[known] = codes[pick_idx[known]] == pick_code[known]
+    span = int(day.max()) + 1 if n else 1
+    base = np.searchsorted(code_idx.astype('int64') * span + day, pick_idx.astype('int64') * span + pick_day)
+    entered = known & (base < n)
+    entered[entered] = code_idx[base[entered]] == pick_idx[entered]
+
+    # 买不进的记录：按这批 K 线里出现过的交易日，入选后已过去 MAX_HORIZON 个交易日的标记为无法评估
+    calendar = np.unique(day)
+    days_after = len(calendar) - np.searchsorted(calendar, pick_day, side='right')
+    stale = ~entered & (days_after >= MAX_HORIZON)
+
+    now = pd.Timestamp.now().strftime("%Y-%m-%d %H:%M:%S")
+    base = base[entered]
+    ok = picks[entered].reset_index(drop=True)
+
+    # 买入后第 1..10 根 K 线的下标矩阵，越界或换了股票的位置无效
+    offsets = np.arange(1, MAX_HORIZON + 1)
+    fwd = base[:, None] + offsets[None, :]
+    valid = fwd < n
+    fwd = np.where(valid, fwd, max(n - 1, 0))
+    valid &= code[fwd] == code[base][:, None]
+    bars_after = valid.sum(axis=1)
+
+    entry = close[base]
+    out = pd.DataFrame({
+        'dt': pd.to_datetime(ok['dt']).dt.strftime("%Y-%m-%d"),
+        'screen': ok['screen'].to_numpy(),
+        'code': ok['code'].astype(str).to_numpy(),
+        'entry_dt': pd.to_datetime(day[base], unit='D').strftime("%Y-%m-%d"),
+        'price_close': entry,
+    })
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for h in HORIZONS:
+            fwd_close = np.where(valid[:, h - 1], close[fwd[:, h - 1]], np.nan)
+            out[f"ret_{h}d"] = np.where(entry > 0, fwd_close / entry - 1, np.nan)
+    out[f"max_drawdown_{MAX_HORIZON}d"] = _max_drawdown(entry, high[fwd], low[fwd], valid)
+    out['bars_after'] = bars_after
+    out['updated_at'] = now
+
+    gone = picks[stale]
+    if not gone.empty:
+        gone = pd.DataFrame({
+            'dt': pd.to_datetime(gone['dt']).dt.strftime("%Y-%m-%d").to_numpy(),
+            'screen': gone['screen'].to_numpy(),
+            'code': gone['code'].astype(str).to_numpy(),
+            'bars_after': MAX_HORIZON,
+            'updated_at': now,
+        }).reindex(columns=EVAL_COLUMNS)
+        out = pd.concat([out, gone], ignore_index=True) if len(out) else gone
+    return out[EVAL_COLUMNS]
+
+
+def evaluate(engine=None):
+    """
+    增量评估：只处理还没有评估结果、或后续 K 线不足 10 根的入选记录
+    :return: 本次写入的评估条数
+    """
+    start = time.time()
+    engine = engine or bulk_loader.create_bulk_engine()
+    pending = pd.read_sql(text("""
+        select p.dt, p.screen, p.code
+        from screen_pick p
+        left join screen_pick_eval e on e.screen = p.screen and e.dt = p.dt and e.code = p.code
+        where e.code is null or e.bars_after < :h
+    """), engine, params={"h": MAX_HORIZON})
+    if pending.empty:
+        print("♻️  没有待评估的入选记录")
+        return 0
+
+    pending['dt'] = pd.to_datetime(pending['dt'])
+    df_k = kline_store.load_kline(pending['dt'].min(), codes=pending['code'].unique().tolist(),
+                                  columns=['dt', 'code', 'price_close', 'price_highest', 'price_lowest'])
+    df_eval = compute_eval(pending, df_k)
+
+    with engine.begin() as conn:
+        conn.execute(text("delete from screen_pick_eval where bars_after < :h"), {"h": MAX_HORIZON})
+        rows = bulk_loader.load_dataframe(conn, df_eval, 'screen_pick_eval')
+    print(f"✅ 入选记录评估完成：待评估 {len(pending)} 条，写入 {rows} 条，耗时 {time.time() - start:.2f}s")
+    return rows
+
+
+# -------------------- 汇总 --------------------
+def report(engine=None, start_dt=None):
+    """
+    按看板汇总：入选数、各持有期平均收益和胜率（收益 > 0 的比例，只统计已有该持有期数据的记录）、平均最大回撤
+    :return: DataFrame，按 5 日平均收益从高到低
+    """
+    engine = engine or bulk_loader.create_bulk_engine()
+    cols = ",\n".join(
+        f"        avg(ret_{h}d) as avg_ret_{h}d,\n        avg(ret_{h}d > 0) as win_{h}d" for h in HORIZONS
+    )
+    df = pd.read_sql(text(f"""
+        select
+            screen,
+            count(*) as picks,
+            min(dt) as first_dt,
+            max(dt) as last_dt,
+{cols},
+            avg(max_drawdown_{MAX_HORIZON}d) as avg_max_drawdown
+        from screen_pick_eval
+        where dt >= :start_dt
+        group by screen
+        order by avg_ret_5d desc
+    """), engine, params={"start_dt": str(start_dt or '1970-01-01')[:10]})
+    if df.empty:
+        print("❌ 暂无评估结果")
+        return df
+    print(f"📊 各看板入选表现（{start_dt or '全部历史'} 起）：")
+    print(df.round(4).to_string(index=False))
+    return df
+
+
+if __name__ == '__main__':
+    engine = bulk_loader.create_bulk_engine()
+    evaluate(engine)
+    report(engine, sys.argv[1] if len(sys.argv) > 1 else None)
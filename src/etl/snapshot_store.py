@@ -0,0 +1,176 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 06:40
+@Desc    : 盘中快照增量存储（stock_detail_data_delta，建表见 sql/migrations/V005）
+           原来每 30 秒把全市场 5000+ 只股票的 40 个字段整行写进 stock_detail_data_di，停牌、冷门股、午休期间
+           大部分行与上一轮完全相同，表膨胀得很快，之后做盘中分析也要扫大量重复行；
+           现在内存里保留上一轮的全市场状态，每轮向量化比较后只写有字段变化的股票（新出现的股票也写），
+           每隔 KEYFRAME_SECONDS 写一轮全市场关键帧，任意时刻的全市场状态 = 该时刻之前最近的关键帧之后每只股票的最后一行，
+           重建时最多只读一个关键帧间隔的数据；
+           后台写线程丢弃过数据（积压或写库失败）时，下一轮强制写关键帧，否则之后不再变化的股票在库里一直停在旧值
+用法：
+    store = SnapshotDeltaStore()
+    changed = store.submit(result['diff'])          # 轮询线程里调用，返回本轮有变化的股票
+    state_at('2026-10-19 10:30:00')                 # 重建任意时刻的全市场状态
+"""
+import numpy as np
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+from src.etl.snapshot_writer import SNAPSHOT_FIELDS, TEXT_FIELDS, SnapshotWriter, to_frame
+from src.utils import db
+
+DELTA_TABLE = 'stock_detail_data_delta'
+
+# 关键帧间隔（秒）：越短重建读的行越少，越长写入越少
+KEYFRAME_SECONDS = 30 * 60
+
+# 除代码 f12 外参与比较的字段
+VALUE_FIELDS = [f for f in SNAPSHOT_FIELDS if f != 'f12']
+DELTA_COLUMNS = ['dt', 'ts', 'f12', 'is_keyframe'] + VALUE_FIELDS
+
+
+def changed_mask(prev, cur):
+    """
+    cur 中相对 prev 有任一字段变化（或 prev 中没有）的行
+    :param prev: 上一轮状态，index 为 f12，列为 VALUE_FIELDS
+    :param cur: 本轮快照，index 为 f12，列为 VALUE_FIELDS
+    :return: 与 cur 行对齐的 bool 数组
+    """
+    pos = prev.index.get_indexer(cur.index)
+    old = prev.iloc[np.where(pos >= 0, pos, 0)]
+    num_cols = [c for c in cur.columns if c not in TEXT_FIELDS]
+    a = cur[num_cols].to_numpy(dtype='float64')
+    b = old[num_cols].to_numpy(dtype='float64')
+    same = ((a == b) | (np.isnan(a) & np.isnan(b))).all(axis=1)
+    for col in cur.columns.intersection(TEXT_FIELDS):
+        a, b = cur[col].to_numpy(dtype=object), old[col].to_numpy(dtype=object)
+        same &= (a == b) | (pd.isna(a) & pd.isna(b))
+    return ~same | (pos < 0)
+
+
+class SnapshotDeltaStore:
+    def __init__(self, engine=None, keyframe_seconds=KEYFRAME_SECONDS, writer=None):
+        self.keyframe_seconds = keyframe_seconds
+        self.writer = writer or SnapshotWriter(DELTA_TABLE, engine, fields=DELTA_COLUMNS)
+        self.writer.on_drop = self._writer_dropped
+        # 写线程丢弃数据后置位（只做赋值，跨线程无需加锁），下一轮 submit 写关键帧并清除
+        self._force_keyframe = False
+        # 最新的全市场状态（index 为 f12），盘中其它模块可直接读取
+        self.state = None
+        self._dt = None
+        self._last_keyframe = None
+        self.rows_in = 0
+        self.rows_out = 0
+
+    def submit(self, rows, ts=None):
+        """
+        处理一轮快照：与上一轮比较，把变化的行交给后台线程写库
+        :param rows: 接口 diff 列表或 DataFrame
+        :param ts: 轮询时刻，默认当前时间（精确到秒）
+        :return: 本轮变化的行（index 为 f12，列为 VALUE_FIELDS），关键帧时为全部行
+        """
+        ts = pd.Timestamp(ts or pd.Timestamp.now()).floor('s')
+        cur = to_frame(rows).dropna(subset=['f12']).drop_duplicates('f12', keep='last')
+        cur = cur.set_index(cur['f12'].astype(str))[VALUE_FIELDS]
+        cur.index.name = 'f12'
+
+        # 跨交易日后重新开始，第一轮一定是关键帧
+        if self._dt != ts.date():
+            self._dt, self.state, self._last_keyframe = ts.date(), None, None
+        keyframe = (self.state is None or self._force_keyframe
+                    or (ts - self._last_keyframe).total_seconds() >= self.keyframe_seconds)
+        if keyframe:
+            # 先清除再交给写线程，这一轮关键帧本身写失败时会被重新置位
+            self._force_keyframe = False
+            changed = cur
+            self._last_keyframe = ts
+        else:
+            changed = cur[changed_mask(self.state, cur)]
+
+        # 本轮缺失的股票（个别页抓取失败）保留上一轮的值
+        if self.state is None:
+            self.state = cur
+        else:
+            self.state = pd.concat([self.state[cur.index.get_indexer(self.state.index) < 0], cur])
+
+        self.rows_in += len(cur)
+        self.rows_out += len(changed)
+        if not changed.empty:
+            out = changed.reset_index()
+            out.insert(0, 'dt', ts.strftime('%Y-%m-%d'))
+            out.insert(1, 'ts', ts.strftime('%Y-%m-%d %H:%M:%S'))
+            out.insert(3, 'is_keyframe', int(keyframe))
+            self.writer.submit(out)
+        return changed
+
+    def _writer_dropped(self):
+        self._force_keyframe = True
+
+    def close(self):
+        self.writer.close()
+        if self.rows_in:
+            print(f"📦 快照增量存储：收到 {self.rows_in} 行，写入 {self.rows_out} 行"
+                  f"（{self.rows_out / self.rows_in:.1%}）")
+
+
+# -------------------- 重建 --------------------
+def _code_filter(sql, params, codes):
+    if codes is None:
+        return text(sql)
+    params['codes'] = [str(c) for c in codes]
+    return text(sql + " and f12 in :codes").bindparams(bindparam('codes', expanding=True))
+
+
+def last_keyframe(ts, engine=None):
+    """ts 之前（含）当天最近一轮关键帧的时刻，没有则返回 None"""
+    ts = pd.Timestamp(ts)
+    df = db.read_sql(f"select max(ts) as ts from {DELTA_TABLE} where dt = :dt and is_keyframe = 1 and ts <= :ts",
+                     {"dt": ts.strftime('%Y-%m-%d'), "ts": ts.strftime('%Y-%m-%d %H:%M:%S')}, engine=engine)
+    value = df['ts'].iloc[0] if not df.empty else None
+    return None if value is None or pd.isna(value) else pd.Timestamp(value)
+
+
+def state_at(ts, codes=None, engine=None):
+    """
+    重建 ts 时刻的全市场状态：最近关键帧 ~ ts 之间每只股票的最后一行
+    :param codes: 只重建这些股票，默认全市场
+    :return: DataFrame[ts（该股票最后一次变化的时刻）, SNAPSHOT_FIELDS...]，每只股票一行
+    """
+    ts = pd.Timestamp(ts)
+    keyframe = last_keyframe(ts, engine)
+    if keyframe is None:
+        return pd.DataFrame(columns=['ts'] + SNAPSHOT_FIELDS)
+    params = {"dt": ts.strftime('%Y-%m-%d'), "start": keyframe.strftime('%Y-%m-%d %H:%M:%S'),
+              "end": ts.strftime('%Y-%m-%d %H:%M:%S')}
+    sql = _code_filter(f"select ts, {', '.join(SNAPSHOT_FIELDS)} from {DELTA_TABLE} "
+                       f"where dt = :dt and ts >= :start and ts <= :end", params, codes)
+    df = db.read_sql(sql, params, engine=engine)
+    df = df.sort_values('ts', kind='stable').drop_duplicates('f12', keep='last')
+    return df.sort_values('f12').reset_index(drop=True)
+
+
+def load_deltas(dt, start_ts=None, end_ts=None, codes=None, engine=None):
+    """某个交易日（可限定时间段）的增量行，按 ts 有序，大结果集走服务端游标"""
+    dt = str(dt)[:10]
+    params = {"dt": dt, "start": str(start_ts or f"{dt} 00:00:00"), "end": str(end_ts or f"{dt} 23:59:59")}
+    sql = _code_filter(f"select {', '.join(DELTA_COLUMNS)} from {DELTA_TABLE} "
+                       f"where dt = :dt and ts >= :start and ts <= :end", params, codes)
+    df = db.read_sql_stream(sql, params, engine=engine)
+    return df.sort_values('ts', kind='stable').reset_index(drop=True)
+
+
+def iter_polls(dt, start_ts=None, end_ts=None, engine=None):
+    """
+    按轮询顺序回放某天的增量：每轮产出 (ts, 本轮变化的行)，下游（分钟 K 线、盘中提醒）按增量更新即可，
+    不需要每轮都重建全市场状态
+    """
+    df = load_deltas(dt, start_ts, end_ts, engine=engine)
+    if df.empty:
+        return
+    ts = df['ts'].to_numpy()
+    bounds = np.flatnonzero(ts[1:] != ts[:-1]) + 1
+    for part in np.split(np.arange(len(df)), bounds):
+        rows = df.iloc[part]
+        yield pd.Timestamp(rows['ts'].iloc[0]), rows.set_index('f12')[VALUE_FIELDS]
@@ -0,0 +1,173 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 05:40
+@Desc    : 盘中快照入库：内存缓冲 + 后台写线程
+           get_detail_data.py 每 30 秒拉一次全市场行情，原来 store() 每只股票一次 cursor.execute（每轮 5000+ 次往返），
+           参数用 tuple(item.values()) 拼、依赖接口返回的字段顺序，一轮写入可能比轮询间隔还长，拉取也被卡住；
+           现在轮询线程只把本轮数据放进缓冲队列就返回，后台线程把积压的几轮合并成一个 DataFrame，
+           按字段名对齐后走 bulk_loader.load_dataframe（LOAD DATA，未开 local_infile 时退回多行 INSERT）一次写入
+           数据库变慢时后台每次会合并更多轮，队列满（数据库长时间不可用）时丢弃最旧的一轮并告警，轮询永远不会被写入阻塞；
+           丢弃（队列满或重试后仍失败）时回调 on_drop，增量存储（snapshot_store）据此让下一轮写全量关键帧
+"""
+import queue
+import threading
+import time
+
+import pandas as pd
+
+from src.etl import bulk_loader
+from src.utils import db
+
+# stock_detail_data_di 的字段（东方财富 clist 接口 fields 参数里的字段）
+SNAPSHOT_FIELDS = [
+    'f1', 'f2', 'f3', 'f5', 'f6', 'f8', 'f9', 'f10', 'f12', 'f13', 'f14', 'f20', 'f21', 'f62', 'f63',
+    'f64', 'f65', 'f66', 'f67', 'f68', 'f69', 'f70', 'f71', 'f72', 'f73', 'f74', 'f75', 'f76', 'f77',
+    'f78', 'f79', 'f80', 'f81', 'f82', 'f83', 'f84', 'f85', 'f86', 'f87', 'f184',
+]
+
+# 文本字段（代码、名称），其余 f* 字段都是数值
+TEXT_FIELDS = ('f12', 'f14')
+
+# 缓冲队列最多积压的轮数（30 秒一轮，120 轮约 1 小时）
+MAX_PENDING_POLLS = 120
+
+# 单次写入失败后的重试次数，超过后丢弃这一批并告警
+MAX_WRITE_RETRIES = 3
+
+
+def to_frame(rows, fields=None):
+    """
+    接口返回的 diff 列表 → DataFrame，按字段名取列（缺失字段为空）
+    数值字段统一转成 float64，停牌等无数据时接口返回的 '-' 转成 NULL
+    """
+    fields = fields or SNAPSHOT_FIELDS
+    if isinstance(rows, pd.DataFrame):
+        df = rows.reindex(columns=fields)
+    else:
+        df = pd.DataFrame.from_records(rows, columns=fields)
+    num_cols = [c for c in df.columns if c.startswith('f') and c not in TEXT_FIELDS]
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce').astype('float64')
+    return df
+
+
+class SnapshotWriter:
+    """
+    用法：
+        writer = SnapshotWriter()
+        writer.submit(result['diff'])   # 轮询线程里调用，立即返回
+        ...
+        writer.close()                  # 收盘后写完剩余数据再退出
+    """
+
+    def __init__(self, table='stock_detail_data_di', engine=None, max_pending=MAX_PENDING_POLLS, fields=None,
+                 on_drop=None):
+        """
+        :param on_drop: 有数据被丢弃时调用的无参函数（轮询线程或后台写线程里调用，不能阻塞）
+        """
+        self.table = table
+        self.on_drop = on_drop
+        self.engine = engine or db.get_engine()
+        self.fields = fields or SNAPSHOT_FIELDS
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self.dropped = 0
+        self.written = 0
+        self.last_latency = None
+        self._thread = threading.Thread(target=self._run, name=f"snapshot-writer-{table}", daemon=True)
+        self._thread.start()
+
+    # -------------------- 轮询线程 --------------------
+    def submit(self, rows):
+        """放入一轮快照（接口 diff 列表或 DataFrame），不等待写库"""
+        if self._closed:
+            raise RuntimeError("SnapshotWriter 已关闭")
+        if rows is None or len(rows) == 0:
+            return
+        item = (time.time(), rows)
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                    self.dropped += 1
+                    print(f"⚠️  {self.table} 写入积压，丢弃最旧的一轮快照（累计丢弃 {self.dropped} 轮）")
+                    self._notify_drop()
+                except queue.Empty:
+                    pass
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=None):
+        """等待已提交的快照全部写完（或超时），返回是否写完"""
+        deadline = None if timeout is None else time.time() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.time() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=60):
+        """不再接收新快照，写完剩余数据后结束后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        print(f"✅ {self.table} 快照写入结束：共写入 {self.written} 行，丢弃 {self.dropped} 轮")
+
+    # -------------------- 后台写线程 --------------------
+    def _drain(self):
+        """阻塞取出一轮，再把队列里已积压的全部取出，合并成一次写入"""
+        items = [self._queue.get()]
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _write(self, batch):
+        df = pd.concat([to_frame(rows, self.fields) for _, rows in batch], ignore_index=True)
+        for attempt in range(1, MAX_WRITE_RETRIES + 1):
+            start = time.time()
+            try:
+                with self.engine.begin() as conn:
+                    rows = bulk_loader.load_dataframe(conn, df, self.table)
+                self.written += rows
+                # 从轮询收到数据到写完的延迟（按本批最早一轮计）
+                self.last_latency = time.time() - batch[0][0]
+                if len(batch) > 1:
+                    print(f"ℹ️  {self.table} 合并写入 {len(batch)} 轮积压快照")
+                return
+            except Exception as e:
+                print(f"⚠️  {self.table} 快照写入失败（第 {attempt} 次，{time.time() - start:.2f}s）：{str(e)[:200]}")
+                time.sleep(min(2 ** attempt, 10))
+        print(f"❌ {self.table} 快照写入重试 {MAX_WRITE_RETRIES} 次仍失败，丢弃 {len(df)} 行")
+        self.dropped += len(batch)
+        self._notify_drop()
+
+    def _notify_drop(self):
+        if self.on_drop is None:
+            return
+        try:
+            self.on_drop()
+        except Exception as e:
+            print(f"⚠️  {self.table} 丢弃回调执行失败：{str(e)[:200]}")
+
+    def _run(self):
+        while True:
+            items = self._drain()
+            stop = items[-1] is None
+            batch = [item for item in items if item is not None]
+            try:
+                if batch:
+                    self._write(batch)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+            if stop:
+                return
@@ -0,0 +1,222 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 00:10
+@Desc    : 连涨 / 连跌类规则统一执行器
+           原来 stock_1days_up / 2days_up / 3days_up / 1days_down / 3days_down 各自 truncate 后
+           从写死的起始日期对 stock_detail 跑一遍几乎相同的窗口函数（row_number + rn - rn_up 找连续段）；
+           现在每个交易日只扫一次 stock_detail 的近期窗口，把每只股票的连涨/连跌天数、N 根 K 线涨幅、市值等
+           物化到 stock_streak_feature，各规则只是对这张特征表的过滤
+用法：
+    python -m src.etl.streak_rules              计算今天的特征表并执行全部规则
+    python -m src.etl.streak_rules 2026-08-14   指定交易日
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from src.etl import bulk_loader, screen_eval
+
+# 特征窗口（自然日），连续段最长按窗口内的 K 线计算，足够覆盖任何实际出现的连涨 / 连跌
+STREAK_WINDOW_DAYS = 120
+
+# 规则表 → 筛选参数
+#   direction: up 连续收阳（收盘 >= 开盘）/ down 连续收阴（收盘 < 开盘），连续段必须延续到当天
+#   min_days: 连续天数下限
+#   exclude_st / exclude_kcb: 剔除 ST / 科创板（688）
+#   min_market_cap: 当日总市值下限（亿）
+#   min_rise_10: 近 10 根 K 线涨幅下限（0.1 = 10%），且需凑齐 10 根
+STREAK_RULES = {
+    "stock_1days_up": {"direction": "up", "min_days": 1, "exclude_st": True, "exclude_kcb": True,
+                       "min_market_cap": 100},
+    "stock_2days_up": {"direction": "up", "min_days": 2, "exclude_st": True, "exclude_kcb": True},
+    "stock_3days_up": {"direction": "up", "min_days": 3, "exclude_st": True, "exclude_kcb": True},
+    "stock_1days_down": {"direction": "down", "min_days": 1, "exclude_st": False, "exclude_kcb": True,
+                         "min_rise_10": 0.1},
+    "stock_3days_down": {"direction": "down", "min_days": 3, "exclude_st": True, "exclude_kcb": True},
+}
+
+# 一次扫描窗口内的 K 线，按 code 聚合出当天的特征（只保留当天有行情的股票）
+# rn_desc = 1 是当天，连续段长度 = 第一根不满足条件的 K 线的 rn_desc - 1（窗口内全部满足时为窗口根数）
+FEATURE_SQL = """
+insert into stock_streak_feature (
+    dt, code, stock_name, price_open, price_close, up_days, down_days, bars,
+    close_5, close_10, close_20, rise_5d, rise_10d, rise_20d,
+    total_market_capitalization, trading_market_capitalization, src_signature, updated_at
+)
+with k as (
+    select
+        dt,
+        code,
+        stock_name,
+        price_open,
+        price_close,
+        total_market_capitalization,
+        trading_market_capitalization,
+        row_number() over (partition by code order by dt desc) as rn_desc,
+        case when price_close >= price_open then 1 else 0 end as is_up
+    from stock_detail
+    where dt >= :start_dt
+        and dt <= :today
+        and price_close is not null
+        and price_open is not null
+),
+agg as (
+    select
+        code,
+        max(case when rn_desc = 1 then dt end) as dt,
+        max(case when rn_desc = 1 then stock_name end) as stock_name,
+        max(case when rn_desc = 1 then price_open end) as price_open,
+        max(case when rn_desc = 1 then price_close end) as price_close,
+        coalesce(min(case when is_up = 0 then rn_desc end), count(*) + 1) - 1 as up_days,
+        coalesce(min(case when is_up = 1 then rn_desc end), count(*) + 1) - 1 as down_days,
+        count(*) as bars,
+        max(case when rn_desc = 5 then price_close end) as close_5,
+        max(case when rn_desc = 10 then price_close end) as close_10,
+        max(case when rn_desc = 20 then price_close end) as close_20,
+        max(case when rn_desc = 1 then total_market_capitalization end) as total_market_capitalization,
+        max(case when rn_desc = 1 then trading_market_capitalization end) as trading_market_capitalization
+    from k
+    group by code
+)
+select
+    dt,
+    code,
+    stock_name,
+    price_open,
+    price_close,
+    up_days,
+    down_days,
+    bars,
+    close_5,
+    close_10,
+    close_20,
+    case when close_5 > 0 then price_close / close_5 - 1 end,
+    case when close_10 > 0 then price_close / close_10 - 1 end,
+    case when close_20 > 0 then price_close / close_20 - 1 end,
+    total_market_capitalization,
+    trading_market_capitalization,
+    :signature,
+    now()
+from agg
+where dt = :today
+"""
+
+
+def window_start(today):
+    return (datetime.strptime(str(today)[:10], "%Y-%m-%d") - timedelta(days=STREAK_WINDOW_DAYS)).strftime("%Y-%m-%d")
+
+
+# 特征窗口的数据签名：行数 + 逐行 crc32 之和，窗口内任一行的价格 / 名称 / 市值变化（如重新导入修正后的行情）都会改变签名
+SIGNATURE_SQL = """
+select
+    count(*) as n,
+    coalesce(sum(crc32(concat_ws('|', code, dt, stock_name, price_open, price_close,
+                                 total_market_capitalization, trading_market_capitalization))), 0) as s
+from stock_detail
+where dt >= :start_dt
+    and dt <= :today
+    and price_close is not null
+    and price_open is not null
+"""
+
+
+def source_signature(conn, today):
+    row = conn.execute(text(SIGNATURE_SQL), {"start_dt": window_start(today), "today": today}).fetchone()
+    return f"{int(row[0])}:{int(row[1])}"
+
+
+def refresh_features(conn, today, force=False):
+    """
+    计算 today 的特征表；特征窗口内 stock_detail 的数据签名与上次计算时一致时直接复用（同一天多个看板只算一次）
+    :param force: 不比较签名，直接重算（流水线在 stock_detail 重新导入后调用）
+    :return: 特征行数
+    """
+    signature = source_signature(conn, today)
+    if not force:
+        row = conn.execute(text(
+            "select count(*), max(src_signature) from stock_streak_feature where dt = :today"
+        ), {"today": today}).fetchone()
+        if row[0] and row[1] == signature:
+            print(f"♻️  stock_streak_feature {today} 已是最新（{row[0]} 只），直接复用")
+            return row[0]
+
+    start = time.time()
+    conn.execute(text("delete from stock_streak_feature where dt = :today"), {"today": today})
+    rows = conn.execute(text(FEATURE_SQL), {"start_dt": window_start(today), "today": today,
+                                            "signature": signature}).rowcount
+    conn.commit()
+    print(f"✅ stock_streak_feature {today} 计算完成：{rows} 只，耗时 {time.time() - start:.2f}s")
+    return rows
+
+
+def _rule_where(direction, min_days, exclude_st=True, exclude_kcb=True, min_market_cap=None, min_rise_10=None):
+    """规则参数 → (where 条件, 绑定参数)"""
+    days_col = "up_days" if direction == "up" else "down_days"
+    where = [f"f.{days_col} >= :min_days"]
+    params = {"min_days": min_days}
+    if exclude_st:
+        where.append("upper(f.stock_name) not like '%ST%'")
+    if exclude_kcb:
+        where.append("f.code not like '688%'")
+    if min_market_cap is not None:
+        where.append("f.total_market_capitalization >= :min_market_cap * 100000000")
+        params["min_market_cap"] = min_market_cap
+    if min_rise_10 is not None:
+        where.append("f.bars >= 10 and f.close_10 > 0 and f.rise_10d > :min_rise_10 and f.price_close > f.close_10")
+        params["min_rise_10"] = min_rise_10
+    return days_col, " and ".join(where), params
+
+
+def run_rule(conn, table, today, **params):
+    """
+    用特征表重建一张规则结果表（结构：code, stock_name, number_of_consecutive_days, industry, industry_detail）
+    :param params: 覆盖 STREAK_RULES[table] 中的参数
+    :return: 入选股票数
+    """
+    days_col, where, bind = _rule_where(**{**STREAK_RULES.get(table, {}), **params})
+    conn.execute(text(f"truncate table {table}"))
+    rows = conn.execute(text(f"""
+        insert into {table} (code, stock_name, number_of_consecutive_days, industry, industry_detail)
+        select
+            f.code,
+            f.stock_name,
+            f.{days_col},
+            dst.industry,
+            dst.industry_detail
+        from stock_streak_feature f
+        left join dim_stock_tag dst on dst.code = f.code
+        where f.dt = :today and {where}
+        order by f.{days_col} desc
+    """), {"today": today, **bind}).rowcount
+    conn.commit()
+    print(f"✅ {table} 入选 {rows} 只")
+    return rows
+
+
+def run_rules(today, rules=None, engine=None, force=False, screen=None, refresh=True):
+    """
+    计算（或复用）当天特征表，再依次执行规则
+    :param rules: {规则表: 覆盖参数}，默认执行 STREAK_RULES 全部规则
+    :param refresh: 是否先检查 / 重算特征表；调度器（run_screens / run_pipeline）已统一刷新过时传 False，
+                    避免每个规则看板再扫一遍特征窗口计算签名
+    :param screen: 看板标识（screen_registry.register 的 name）；给出时把规则结果记为该看板当天的入选记录，
+                   供 etl/screen_eval.py 跟踪后续表现。同一张规则表可能被多个看板以不同参数重建
+                   （如 stock_2days_up / stock_2days_up_options），不能用表名当看板标识
+    :return: {规则表: 入选股票数}
+    """
+    engine = engine or bulk_loader.create_bulk_engine()
+    rules = rules if rules is not None else {table: {} for table in STREAK_RULES}
+    with engine.connect() as conn:
+        if refresh:
+            refresh_features(conn, today, force=force)
+        result = {table: run_rule(conn, table, today, **params) for table, params in rules.items()}
+        if screen:
+            screen_eval.record_from_table(conn, screen, today, list(rules))
+        return result
+
+
+if __name__ == '__main__':
+    run_rules(sys.argv[1] if len(sys.argv) > 1 else datetime.now().strftime("%Y-%m-%d"))
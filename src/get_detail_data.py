@@ -1,14 +1,29 @@
+"""
+盘中全A股行情轮询（30 秒一轮）→ stock_detail_data_delta 增量快照 + 分钟 K 线 + 盘中提醒
+用法（在仓库根目录执行）：python -m src.get_detail_data
+（依赖 src.etl / src.utils 包，不再支持在 src 目录下 python get_detail_data.py 直接运行）
+"""
 import json
 import time
-from threading import Thread
 
 import requests
 from datetime import datetime
 
-from rec import pick_stock_large, pick_stock_huge, do_stock
-from utils.mysql import connect
+from src.etl.snapshot_store import SnapshotDeltaStore
+from src.utils import minute_bars
+from src.utils.intraday_alerts import AlertEngine
 
-cnx = connect()
+# 轮询间隔（秒）
+POLL_SECONDS = 30
+
+# 盘中快照只写有变化的股票（stock_detail_data_delta），由后台线程批量写入，轮询不等待写库
+snapshot_store = None
+
+# 盘中 1 / 5 / 15 分钟 K 线，每轮只更新有变化的股票
+bar_builder = None
+
+# 盘中提醒（N 颈线跌破 / 量比异动 / 主力净流入），每轮只评估有变化的股票，飞书消息由后台线程发送
+alert_engine = None
 
 
 def spider(pz):
@@ -46,23 +61,15 @@ def spider(pz):
     return datas['data']
 
 
-def store(data):
-    with cnx.cursor() as cursor:
-        # 遍历数据列表并插入到数据库表中
-        for item in data:
-            sql = """  
-            INSERT INTO stock_detail_data_di (
-                f1, f2, f3, f5, f6, f8, f9, f10, f12, f13, f14, f20, f21, f62, f63, f64, f65, f66, f67, f68, f69, 
-                f70, f71, f72, f73, f74, f75, f76, f77, f78, f79, f80, f81, f82, f83, f84, f85, f86, f87, f184
-            ) VALUES (
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 
-                %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-            )
-            """
-            cursor.execute(sql, tuple(item.values()))
-
-            # 提交事务
-        cnx.commit()
+def store(data, ts=None):
+    """
+    与上一轮比较后只把有变化的股票放入写入缓冲，立即返回；由后台线程合并成一次 LOAD DATA 写入
+    :return: 本轮有变化的股票（index 为 f12）
+    """
+    global snapshot_store
+    if snapshot_store is None:
+        snapshot_store = SnapshotDeltaStore()
+    return snapshot_store.submit(data, ts)
 
 
 if __name__ == '__main__':
@@ -79,6 +86,9 @@ if __name__ == '__main__':
 
     print(now)
     try:
+        # 盘中重启时先回放当天已入库的快照，分钟 K 线接着累积
+        bar_builder = minute_bars.replay(today, finalize=False)
+        alert_engine = AlertEngine()
         page_size = 2
         while True:
             # 1、需要抓取 data 的时间段
@@ -86,11 +96,17 @@ if __name__ == '__main__':
                 result = spider(page_size)
                 if result['total'] != page_size:
                     page_size = result['total']
-                store(result['diff'])
-                print(f"now_str = {now_str} -> {datetime.now()} finish store, data size is {len(result['diff'])}.")
-                # Thread(target=do_stock).start()
-                # Thread(target=pick_stock_huge).start()
-                time.sleep(30)
+                poll_ts = datetime.now()
+                changed = store(result['diff'], poll_ts)
+                # 先评估提醒再更新分钟 K 线，缩短从拿到数据到发出提醒的时间
+                alerts = alert_engine.on_poll(changed, poll_ts)
+                bar_builder.update(changed, poll_ts)
+                print(f"now_str = {now_str} -> {datetime.now()} finish store, data size is {len(result['diff'])}, "
+                      f"changed = {len(changed)}, pending = {snapshot_store.writer.pending()}, "
+                      f"last write latency = {snapshot_store.writer.last_latency}, "
+                      f"alerts = {len(alerts)}, alert eval ms = {alert_engine.last_eval_ms}.")
+                # 扣掉本轮拉取耗时，保持 30 秒一轮
+                time.sleep(max(0.0, POLL_SECONDS - (datetime.now() - now).total_seconds()))
             # 2、中午休市
             elif now_str > today + suffix_morning and now_str < today + prefix_afternoon:
                 time.sleep(60)
@@ -98,6 +114,12 @@ if __name__ == '__main__':
             # 3、当日结束
             else:
                 break;
+            now = datetime.now()
             now_str = now.strftime("%Y-%m-%d %H:%M:%S")
     finally:
-        cnx.close()
+        if snapshot_store is not None:
+            snapshot_store.close()
+        if bar_builder is not None:
+            bar_builder.finalize()
+        if alert_engine is not None:
+            alert_engine.close()
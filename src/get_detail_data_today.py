@@ -1,21 +1,29 @@
+"""
+收盘后全A股行情快照 → stock_last_record_di
+用法（在仓库根目录执行）：python -m src.get_detail_data_today
+（依赖 src.etl / src.utils 包，不再支持在 src 目录下 python get_detail_data_today.py 直接运行）
+"""
 import json
-import time
 import random
-import http.client  # 新增：导入底层http异常类
-from threading import Thread
+import time
+from datetime import datetime
 
 import requests
-from datetime import datetime
-import pymysql
-from utils.mysql import connect as cnx
+from requests.adapters import HTTPAdapter
 
-# 初始化数据库连接（执行函数，得到连接对象）
-# cnx = get_mysql_conn()
-if not cnx:
-    print("数据库连接失败，程序退出")
-    exit(1)
+from src.etl.snapshot_writer import to_frame
+from src.utils import db, paged_fetch, rate_limit
 
-# -------------------------- 2. 优化请求配置（突破风控） --------------------------
+# 东方财富行情列表接口，限流按 host 生效
+EASTMONEY_HOST = 'push2.eastmoney.com'
+
+# -------------------------- 1. 抓取节奏（礼貌预算） --------------------------
+# 同时在途的请求数上限
+MAX_IN_FLIGHT = 4
+# 平均每秒请求数上限（相邻请求最小间隔约 1 / RATE_PER_SEC 秒）
+RATE_PER_SEC = 2.0
+
+# -------------------------- 2. 请求配置（突破风控） --------------------------
 # 复用会话+完整请求头（模拟真实浏览器）
 session = requests.Session()
 headers = {
@@ -34,18 +42,19 @@ headers = {
     # 'Cookie': '你的东方财富Cookie'
 }
 session.headers.update(headers)
-# 禁用请求连接池（避免连接复用被风控）
-session.adapters.DEFAULT_POOLSIZE = 1
+# keep-alive 连接池与并发数一致，各页复用已建立的连接，不再每页重新握手
+session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=MAX_IN_FLIGHT))
+
+limiter = rate_limit.host_limiter(EASTMONEY_HOST, rate=RATE_PER_SEC, max_concurrency=MAX_IN_FLIGHT)
 
 
-def spider_with_retry(page_num, page_size, fs, max_retry=5):
+def spider(page_num, page_size, fs):
     """
-    修复异常捕获 + 强化重试策略
+    请求一页（不含重试和等待，节奏由限流器控制）
     :param page_num: 页码
     :param page_size: 每页条数（最大100）
     :param fs: 板块筛选参数
-    :param max_retry: 最大重试次数
-    :return: 接口数据/None
+    :return: 接口 data 字段
     """
     fid = 'f62'
     po = 1
@@ -62,97 +71,66 @@ def spider_with_retry(page_num, page_size, fs, max_retry=5):
 
     # 拼接URL（添加随机参数，避免URL固定被风控）
     random_param = random.randint(100000, 999999)
-    url = f'https://push2.eastmoney.com/api/qt/clist/get' \
+    url = f'https://{EASTMONEY_HOST}/api/qt/clist/get' \
           f'?pn={page_num}&pz={page_size}&fid={fid}&po={po}&np={np}&fltt={fltt}&fs={fs}' \
           f'&fields={fields}&_={random_param}'
 
-    retry_count = 0
-    while retry_count < max_retry:
-        try:
-            # 随机延时（2-5秒，模拟人工操作）
-            time.sleep(random.uniform(2, 5))
-            # 发送请求（关闭重定向+强制不使用缓存）
-            response = session.get(
-                url,
-                timeout=20,
-                allow_redirects=False,
-                headers={'Cache-Control': 'no-cache'}
-            )
-            # 处理gzip压缩响应
-            response.encoding = 'utf-8'
-            if response.status_code != 200:
-                raise Exception(f"HTTP状态码异常：{response.status_code}")
-            # 解析JSON
-            datas = json.loads(response.text)
-            return datas.get('data', None)
-        # -------------------------- 修复异常捕获 --------------------------
-        except (requests.exceptions.ConnectionError, http.client.RemoteDisconnected):
-            retry_count += 1
-            delay = random.uniform(3, 6)
-            print(f"第{page_num}页连接断开，{delay}秒后重试第{retry_count}次...")
-            time.sleep(delay)
-        except requests.exceptions.Timeout:
-            retry_count += 1
-            delay = random.uniform(3, 6)
-            print(f"第{page_num}页请求超时，{delay}秒后重试第{retry_count}次...")
-            time.sleep(delay)
-        except Exception as e:
-            retry_count += 1
-            delay = random.uniform(3, 6)
-            print(f"第{page_num}页异常：{str(e)[:50]}，{delay}秒后重试第{retry_count}次...")
-            time.sleep(delay)
-
-    print(f"第{page_num}页请求失败（已重试{max_retry}次），跳过")
-    return None
+    # 关闭重定向+强制不使用缓存
+    response = session.get(url, timeout=20, allow_redirects=False, headers={'Cache-Control': 'no-cache'})
+    response.encoding = 'utf-8'
+    if response.status_code != 200:
+        # 403 / 429 抛 HTTPError，限流器据此退避降速
+        response.raise_for_status()
+        raise Exception(f"HTTP状态码异常：{response.status_code}")
+    data = json.loads(response.text).get('data', None)
+    if page_num == 1 and (not data or 'total' not in data):
+        raise Exception("接口未返回总条数")
+    return data
+
+
+def fetch_all(fs, page_size=100):
+    """
+    先取第 1 页拿到总条数，其余各页并发抓取，按页码顺序合并（同一代码只保留第一次出现）
+    :return: diff 列表，第 1 页失败时返回 None
+    """
+    first_page = paged_fetch.fetch_page(limiter, lambda p: spider(p, page_size, fs), 1)
+    if not first_page:
+        return None
+    total_count = first_page['total']
+    print(f"【成功】总条数：{total_count}")
+
+    max_page = (total_count + page_size - 1) // page_size
+    pages = paged_fetch.fetch_pages(lambda p: spider(p, page_size, fs), range(2, max_page + 1), limiter)
+
+    total_data, seen = [], set()
+    for page_num, page_data in enumerate([first_page] + pages, start=1):
+        if not page_data or not page_data.get('diff'):
+            print(f"第{page_num}页无数据")
+            continue
+        for item in page_data['diff']:
+            if item.get('f12') not in seen:
+                seen.add(item.get('f12'))
+                total_data.append(item)
+    if len(total_data) < total_count:
+        print(f"⚠️  拉取 {len(total_data)} 条，少于总条数 {total_count}（失败页见上方日志）")
+    return total_data
 
 
 def store_batch(data_list):
-    """批量入库（兼容空数据+异常处理）"""
+    """批量入库：按字段名对齐后一次 LOAD DATA（未开 local_infile 时退回多行 INSERT）"""
     if not data_list:
         print("无数据可插入")
-        return
-    if not cnx:
-        print("数据库连接失效，跳过入库")
-        return
-
-    with cnx.cursor() as cursor:
-        sql = """  
-        insert into stock_last_record_di (
-            f1, f2, f3, f5, f6, f8, f9, f10, f12, f13, f14, f20, f21, f62, f63, f64, f65, f66, f67, f68, f69, 
-            f70, f71, f72, f73, f74, f75, f76, f77, f78, f79, f80, f81, f82, f83, f84, f85, f86, f87, f184
-        ) VALUES (
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 
-            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-        )
-        """
-        # 构造参数（补全缺失字段为None）
-        params = []
-        field_list = [f.strip() for f in sql.split('VALUES')[0].split('(')[1].split(')')[0].split(',')]
-        for item in data_list:
-            row = [item.get(f, None) for f in field_list]
-            params.append(tuple(row))
-
-        # 分批插入（每300条提交一次，降低压力）
-        batch_size = 300
-        total_inserted = 0
-        for i in range(0, len(params), batch_size):
-            batch = params[i:i + batch_size]
-            try:
-                cursor.executemany(sql, batch)
-                cnx.commit()
-                total_inserted += len(batch)
-                print(f"已插入{total_inserted}/{len(params)}条数据")
-            except Exception as e:
-                print(f"批量插入失败：{e}")
-                cnx.rollback()
+        return 0
+    total_inserted = db.write_dataframe(to_frame(data_list), 'stock_last_record_di')
     print(f"入库完成，总计插入{total_inserted}条有效数据")
+    return total_inserted
 
 
 # -------------------------- 主程序 --------------------------
 if __name__ == '__main__':
     now = datetime.now()
     now_str = now.strftime("%Y-%m-%d %H:%M:%S")
-    total_data = []
+    start = time.time()
 
     try:
         # 全A股筛选参数（覆盖主板/创业板/科创板/北交所）
@@ -165,56 +143,28 @@ if __name__ == '__main__':
             'm:0+t:7+f:!2'  # 中小板（兼容）
         )
 
-        page_size = 100  # 接口最大每页100条
-        page_num = 1
-        total_count = 0
-
-        # 第一步：获取总条数（带重试）
-        print("【1/3】正在获取全A股总条数...")
-        first_page = spider_with_retry(page_num, page_size, fs)
-        if not first_page or 'total' not in first_page:
+        # 第一步 + 第二步：获取总条数，并发分页拉取
+        print("【1/2】开始分页拉取全A股数据...")
+        total_data = fetch_all(fs)
+        if total_data is None:
             print("获取总条数失败，尝试仅拉取沪市主板...")
             fs = 'm:1+t:2+f:!2'  # 降级策略：只拉沪市
-            first_page = spider_with_retry(page_num, page_size, fs)
-            if not first_page or 'total' not in first_page:
+            total_data = fetch_all(fs)
+            if total_data is None:
                 print("接口请求失败，请检查Cookie/网络后重试")
                 exit(1)
 
-        total_count = first_page['total']
-        print(f"【成功】全A股总条数：{total_count}")
-
-        # 第二步：分页拉取所有数据
-        print("\n【2/3】开始分页拉取数据...")
-        max_page = (total_count // page_size) + 2  # 多算2页，避免漏数
-        while page_num <= max_page and len(total_data) < total_count:
-            print(f"\n----- 拉取第{page_num}/{max_page}页 -----")
-            page_data = spider_with_retry(page_num, page_size, fs)
-            if page_data and 'diff' in page_data and page_data['diff']:
-                batch_data = page_data['diff']
-                total_data.extend(batch_data)
-                print(f"第{page_num}页拉取成功，累计数据：{len(total_data)}条")
-            else:
-                print(f"第{page_num}页无数据")
-
-            page_num += 1
-            # 每页拉取后延长延时（核心：避开风控）
-            time.sleep(random.uniform(3, 7))
-
         # 第三步：批量入库
-        print(f"\n【3/3】开始入库（总计拉取{len(total_data)}条数据）")
-        store_batch(total_data)
+        print(f"\n【2/2】开始入库（总计拉取{len(total_data)}条数据）")
+        total_inserted = store_batch(total_data)
         print(f"\n===== 程序完成 =====")
         print(f"时间：{now_str}")
         print(f"拉取总条数：{len(total_data)}")
-        # print(f"入库总条数：{total_inserted if 'total_inserted' in locals() else 0}")
+        print(f"入库总条数：{total_inserted}")
+        print(f"总耗时：{time.time() - start:.2f}s")
 
     except Exception as e:
         print(f"\n程序执行异常：{e}")
-        if cnx:
-            cnx.rollback()  # 异常时回滚事务
     finally:
         # 关闭资源
         session.close()
-        if cnx and not cnx._closed:
-            cnx.close()
-            print("\n数据库连接已关闭")
\ No newline at end of file
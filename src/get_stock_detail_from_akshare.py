@@ -3,16 +3,42 @@ import pandas as pd
 import time
 import random
 import os
-from datetime import datetime
+import json
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from src.utils import db, rate_limit
+
+# ak.stock_zh_a_hist 实际请求的东方财富历史行情 host，限流按 host 生效
+EASTMONEY_HIST_HOST = 'push2his.eastmoney.com'
+
+# 区间内返回空表时，往前多看多少天来确认是停牌 / 未上市而不是软限流
+EMPTY_PROBE_DAYS = 365
+
 
 class AKShareStockDataFetcher:
-    def __init__(self, output_dir='./akshare_stock_output'):
+    def __init__(self, output_dir='./akshare_stock_output', fetch_fn=None, host=EASTMONEY_HIST_HOST,
+                 max_workers=1, rate_per_sec=2.0, max_concurrency=4, manifest_path=None):
+        """
+        :param fetch_fn: 单只股票历史行情抓取函数 fetch_fn(stock_code, start_date, end_date) -> 中文列名 DataFrame，
+                         默认 ak.stock_zh_a_hist；可替换为请求本地模拟服务的函数，用于验证限流 / 退避逻辑
+        :param host: 限流所属 host，同 host 的抓取共用速率和并发名额
+        :param max_workers: 并发抓取线程数，1 即逐只串行
+        :param rate_per_sec: 每秒请求数上限（被 403/429 拦截后自动下调，恢复后回升到该值）
+        :param max_concurrency: 同一 host 同时在途的请求数上限
+        :param manifest_path: 断点清单文件，记录每只股票已抓取到的日期和状态，默认 output_dir/fetch_manifest.json
+        """
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
+        self.manifest_path = manifest_path or os.path.join(self.output_dir, 'fetch_manifest.json')
+        self.fetch_fn = fetch_fn or self._fetch_from_akshare
+        self.max_workers = max_workers
+        self.limiter = rate_limit.host_limiter(
+            host, rate=rate_per_sec, max_concurrency=min(max_concurrency, max_workers)
+        )
 
         # 字段映射（严格匹配你的表结构）
         self.field_mapping = {
@@ -135,99 +161,257 @@ class AKShareStockDataFetcher:
         # 确保最终数量在5000+左右（可微调步长）
         return stock_list[:5500]  # 限制最大数量，匹配实际A股总数
 
-    def fetch_single_stock_history(self, stock_code, stock_name, start_date, end_date):
-        """获取单只股票数据：逻辑不变，增加代码有效性校验"""
-        if not self.is_valid_a_stock_code(stock_code):
-            return None
+    def _fetch_from_akshare(self, stock_code, start_date, end_date):
+        return ak.stock_zh_a_hist(
+            symbol=stock_code,
+            period="daily",
+            start_date=start_date.replace('-', ''),
+            end_date=end_date.replace('-', ''),
+            adjust="qfq"
+        )
 
-        time.sleep(random.uniform(0.3, 0.8))
-        try:
-            for retry in range(2):
-                try:
-                    df = ak.stock_zh_a_hist(
-                        symbol=stock_code,
-                        period="daily",
-                        start_date=start_date.replace('-', ''),
-                        end_date=end_date.replace('-', ''),
-                        adjust="qfq"
-                    )
-                    if not df.empty:
-                        break
-                except:
-                    time.sleep(random.uniform(0.5, 1.0))
+    def _fetch_raw(self, stock_code, start_date, end_date, max_retry):
+        """
+        在限流器名额内请求区间行情：异常和空表都重试（东方财富软限流时不报错，直接返回空表）
+        :return: 原始 DataFrame；重试用尽仍为空表时返回空表，每次请求都异常时返回 None
+        """
+        df = None
+        for retry in range(max_retry):
+            issued_at = None
+            try:
+                with self.limiter.slot() as issued_at:
+                    result = self.fetch_fn(stock_code, start_date, end_date)
+                if result is not None and not result.empty:
+                    self.limiter.on_success()
+                    return result
+                df = result if result is not None else df
+            except Exception as e:
+                if rate_limit.is_throttled(e):
+                    backoff = self.limiter.on_throttle(issued_at)
+                    print(f"⚠️  {stock_code} 被风控拦截，限速降至 {self.limiter.rate:.2f}/s，暂停 {backoff:.0f}s 后重试")
                     continue
+            time.sleep(random.uniform(0.5, 1.0))
+        return df
 
-            if df.empty:
-                return None
+    def _confirm_empty(self, stock_code, start_date, end_date, max_retry):
+        """
+        区间重试后仍为空表时，再请求 [start_date 前 EMPTY_PROBE_DAYS 天, 今天] 确认：
+        窗口内有数据、但都不在区间内 → 停牌 / 当时未上市，确认区间无数据（返回空表）；
+        窗口内有区间内的数据 → 之前的空表是软限流，返回区间内的行；
+        窗口仍为空或请求失败 → 无法确认，返回 None（记为失败，下次重试）
+        """
+        probe_start = self._shift_day(start_date, -EMPTY_PROBE_DAYS)
+        probe = self._fetch_raw(stock_code, probe_start, datetime.now().strftime('%Y-%m-%d'), max_retry)
+        if probe is None or probe.empty:
+            return None
+        dts = pd.to_datetime(probe['日期']).dt.strftime('%Y-%m-%d')
+        return probe[(dts >= start_date) & (dts <= end_date)]
 
-            df['股票代码'] = stock_code
-            df['名称'] = stock_name
-            df = df.rename(columns=self.field_mapping)
+    def fetch_single_stock_history(self, stock_code, stock_name, start_date, end_date, max_retry=3):
+        """
+        获取单只股票数据：请求节奏由限流器控制，被 403/429 拦截时全局退避后重试
+        :return: DataFrame；确认区间内无数据（停牌 / 未上市）时返回空表；失败或无法确认时返回 None
+        """
+        if not self.is_valid_a_stock_code(stock_code):
+            return None
 
-            target_columns = [
-                'dt', 'stock_code', 'stock_name', 'price_open', 'price_close',
-                'price_highest', 'price_lowest', 'trade', 'trade_amount',
-                'amplitude', 'rise', 'amount_increase_decrease', 'turnover_rate'
-            ]
-            for col in target_columns:
-                if col not in df.columns:
-                    df[col] = None
-            df = df[target_columns]
-            df['dt'] = pd.to_datetime(df['dt']).dt.strftime('%Y-%m-%d')
+        df = self._fetch_raw(stock_code, start_date, end_date, max_retry)
+        if df is None:
+            # 多次重试仍失败
+            return None
+        if df.empty:
+            df = self._confirm_empty(stock_code, start_date, end_date, max_retry)
+            if df is None or df.empty:
+                return df
+
+        df['股票代码'] = stock_code
+        df['名称'] = stock_name
+        df = df.rename(columns=self.field_mapping)
+
+        target_columns = [
+            'dt', 'stock_code', 'stock_name', 'price_open', 'price_close',
+            'price_highest', 'price_lowest', 'trade', 'trade_amount',
+            'amplitude', 'rise', 'amount_increase_decrease', 'turnover_rate'
+        ]
+        for col in target_columns:
+            if col not in df.columns:
+                df[col] = None
+        df = df[target_columns]
+        df['dt'] = pd.to_datetime(df['dt']).dt.strftime('%Y-%m-%d')
 
-            return df
+        return df
 
+    # -------------------- 断点清单 --------------------
+    def _load_manifest(self):
+        """
+        清单结构：{code: {status, last_dt, fetched_from, fetched_to, updated_at}}
+        status: done 已抓取 / empty 确认区间内无数据（停牌 / 未上市） / failed 抓取失败或无法确认（下次重试）
+        fetched_from / fetched_to: 已覆盖的请求区间，之后更早的 start_date 会补抓 fetched_from 之前的部分
+        """
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
         except Exception as e:
-            if "403" in str(e) or "connection" in str(e).lower():
-                print(f"⚠️  {stock_code} 被风控拦截，跳过")
-            return None
+            print(f"⚠️  断点清单读取失败，将全量抓取: {str(e)[:50]}")
+            return {}
+
+    def _save_manifest(self, manifest):
+        # 先写临时文件再替换，中途被杀掉也不会留下半个 json
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def load_covered_by_code(self, engine=None):
+        """stock_detail 中每只股票已入库的 (最早 dt, 最新 dt)，增量抓取只抓这个区间之外的日期"""
+        try:
+            df = db.read_sql("select code, min(dt) as min_dt, max(dt) as max_dt from stock_detail group by code",
+                             engine=engine)
+            print(f"✅ 已读取 stock_detail 中 {len(df)} 只股票的已入库区间")
+            return dict(zip(df['code'].astype(str),
+                            zip(df['min_dt'].astype(str).str[:10], df['max_dt'].astype(str).str[:10])))
+        except Exception as e:
+            print(f"⚠️  读取 stock_detail 已入库区间失败，仅按断点清单续传: {str(e)[:50]}")
+            return {}
+
+    @staticmethod
+    def _shift_day(dt, days):
+        return (datetime.strptime(dt, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+
+    def _plan_fetch(self, stock_list, start_date, end_date, manifest, covered_map):
+        """
+        计算每只股票实际需要抓取的区间，已覆盖区间 = stock_detail 已入库区间与清单 [fetched_from, fetched_to] 合并：
+        [start_date, end_date] 全在已覆盖区间内 → 跳过；
+        只缺后段 → 从已覆盖截止日 + 1 抓到 end_date；
+        缺前段（start_date 早于已覆盖起始日）→ 从 start_date 开始抓，两头都缺时一次抓整个区间，抓回后丢弃已覆盖部分的行
+        :return: [(stock, fetch_start, fetch_end, covered)]，covered 为需要丢弃的已覆盖区间 (lo, hi) 或 None
+        """
+        tasks = []
+        for stock in stock_list:
+            code = stock['stock_code']
+            spans = [covered_map[code]] if code in covered_map else []
+            entry = manifest.get(code)
+            # 旧版清单只记录了 fetched_to，不知道下界，不算已覆盖
+            if entry and entry.get('status') in ('done', 'empty') and entry.get('fetched_from') and entry.get('fetched_to'):
+                spans.append((entry['fetched_from'], entry['fetched_to']))
+            if not spans:
+                tasks.append((stock, start_date, end_date, None))
+                continue
+            lo, hi = min(s[0] for s in spans), max(s[1] for s in spans)
+            if start_date >= lo:
+                fetch_start = max(start_date, self._shift_day(hi, 1))
+                if fetch_start <= end_date:
+                    tasks.append((stock, fetch_start, end_date, None))
+            elif end_date <= hi:
+                tasks.append((stock, start_date, min(end_date, self._shift_day(lo, -1)), None))
+            else:
+                tasks.append((stock, start_date, end_date, (lo, hi)))
+        return tasks
+
+    def _fetch_task(self, task):
+        stock, fetch_start, fetch_end, covered = task
+        df = self.fetch_single_stock_history(stock['stock_code'], stock['stock_name'], fetch_start, fetch_end)
+        if covered is not None and df is not None and not df.empty:
+            # 两头都缺时整段抓回，丢弃已入库 / 已抓过的部分，避免 CSV 里重复
+            df = df[(df['dt'] < covered[0]) | (df['dt'] > covered[1])]
+        return df
+
+    def _iter_fetch(self, tasks):
+        """按完成顺序产出 (task, df)；max_workers > 1 时多线程并发，整体速率仍受限流器约束"""
+        if self.max_workers <= 1:
+            for task in tasks:
+                yield task, self._fetch_task(task)
+            return
 
-    def batch_fetch_and_save(self, start_date, end_date, save_per_n_stocks=50):
-        """批量获取：逻辑不变"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._fetch_task, task): task for task in tasks}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def batch_fetch_and_save(self, start_date, end_date, save_per_n_stocks=50, incremental=True, engine=None):
+        """
+        批量获取：抓取在工作线程中进行，写 CSV 只在主线程
+        断点续传：每批写入 CSV 后同步更新断点清单，中途退出重跑时只抓清单里未完成的股票；
+        incremental=True 时再结合 stock_detail 每只股票已入库的日期区间，只抓缺失的部分
+        """
         stock_list = self.get_all_a_stock_list()
         if not stock_list:
             return
 
+        manifest = self._load_manifest()
+        covered_map = self.load_covered_by_code(engine) if incremental else {}
+        tasks = self._plan_fetch(stock_list, start_date, end_date, manifest, covered_map)
+        print(f"📋 共 {len(stock_list)} 只股票，已是最新跳过 {len(stock_list) - len(tasks)} 只，本次需抓取 {len(tasks)} 只")
+        if not tasks:
+            print("✨ 全部股票已是最新，无需抓取")
+            return
+
         all_data_buffer = []
+        pending = {}  # 本批已抓取、待随 CSV 一起落盘的清单项
         success_count = 0
         fail_count = 0
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        # 同一区间重跑时续写同一个文件，不再每次新建带时间戳的文件
         final_save_path = os.path.join(
             self.output_dir,
-            f'stock_detail_{start_date}_{end_date}_{timestamp}.csv'
+            f'stock_detail_{start_date}_{end_date}.csv'
         )
 
         print(f"\n🚀 开始批量采集，时间范围: {start_date} ~ {end_date}")
+        print(f"⚙️  并发线程: {self.max_workers} | 限速: {self.limiter.rate:.2f} 次/秒")
         print(f"💾 数据将保存至: {final_save_path}")
 
-        for idx, stock in enumerate(stock_list):
+        def flush():
+            if all_data_buffer:
+                self._append_to_csv(all_data_buffer, final_save_path)
+                all_data_buffer.clear()
+            manifest.update(pending)
+            pending.clear()
+            self._save_manifest(manifest)
+
+        start_time = time.time()
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for idx, ((stock, fetch_start, fetch_end, _), df) in enumerate(self._iter_fetch(tasks)):
             code = stock['stock_code']
-            name = stock['stock_name']
-
             if (idx + 1) % 20 == 0:
-                print(f"📊 进度: {idx + 1}/{len(stock_list)} | 成功: {success_count} | 失败: {fail_count}")
-
-            df = self.fetch_single_stock_history(code, name, start_date, end_date)
-
+                print(f"📊 进度: {idx + 1}/{len(tasks)} | 成功: {success_count} | 失败: {fail_count} | "
+                      f"当前限速: {self.limiter.rate:.2f}/s")
+
+            old = manifest.get(code, {})
+            if not old.get('fetched_from'):
+                old = {'last_dt': old.get('last_dt')}
+            # 本次抓取区间与清单原有区间相邻（见 _plan_fetch），合并后仍是一个连续区间
+            covered = {'fetched_from': min(fetch_start, old.get('fetched_from') or fetch_start),
+                       'fetched_to': max(fetch_end, old.get('fetched_to') or fetch_end)}
             if df is not None and not df.empty:
                 all_data_buffer.append(df)
                 success_count += 1
+                pending[code] = {'status': 'done', 'last_dt': max(df['dt'].max(), old.get('last_dt') or ''),
+                                 **covered, 'updated_at': now}
+            elif df is not None or not self.is_valid_a_stock_code(code):
+                # 确认区间内无数据（停牌 / 未上市）或无效代码，视为已覆盖
+                fail_count += 1
+                pending[code] = {'status': 'empty', 'last_dt': old.get('last_dt'), **covered, 'updated_at': now}
             else:
+                # 风控、网络、空表无法确认：不推进已覆盖区间，下次重试
                 fail_count += 1
+                pending[code] = {'status': 'failed', 'last_dt': old.get('last_dt'),
+                                 'fetched_from': old.get('fetched_from'), 'fetched_to': old.get('fetched_to'),
+                                 'updated_at': now}
 
-            if (idx + 1) % save_per_n_stocks == 0 and all_data_buffer:
-                self._append_to_csv(all_data_buffer, final_save_path)
-                all_data_buffer = []
+            if (idx + 1) % save_per_n_stocks == 0:
+                flush()
                 print(f"📦 已分批保存 {idx + 1} 只股票数据")
-                time.sleep(random.uniform(2, 3))
 
-        if all_data_buffer:
-            self._append_to_csv(all_data_buffer, final_save_path)
+        flush()
 
-        print(f"\n✨ 采集任务全部完成！")
+        print(f"\n✨ 采集任务全部完成！耗时 {time.time() - start_time:.1f}s")
         print(f"✅ 成功获取: {success_count} 只")
         print(f"❌ 失败/无数据: {fail_count} 只")
+        print(f"🚧 风控拦截: {self.limiter.throttled_total} 次")
         print(f"💾 最终文件路径: {final_save_path}")
+        print(f"📋 断点清单: {self.manifest_path}")
 
     def _append_to_csv(self, data_buffer, file_path):
         """追加写入CSV：逻辑不变"""
@@ -249,9 +433,11 @@ if __name__ == '__main__':
     START_DATE = '2025-01-01'
     END_DATE = '2026-03-13'
     SAVE_INTERVAL = 50
+    MAX_WORKERS = 8  # 并发线程数
+    RATE_PER_SEC = 4.0  # 每秒请求上限，被风控时自动下调
 
     # 初始化并执行
-    fetcher = AKShareStockDataFetcher(output_dir='./file')
+    fetcher = AKShareStockDataFetcher(output_dir='./file', max_workers=MAX_WORKERS, rate_per_sec=RATE_PER_SEC)
     time.sleep(random.uniform(1, 2))
     fetcher.batch_fetch_and_save(
         start_date=START_DATE,
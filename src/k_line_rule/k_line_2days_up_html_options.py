@@ -1,35 +1,17 @@
 from datetime import datetime
+import os
 import time
 import pandas as pd
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine, text
-from functools import partial
-from concurrent.futures import ProcessPoolExecutor
 
-from src.utils import constants
-
-# ====================== 【只改这里】MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ===================================================================
+from src.etl import streak_rules
+from src.utils import db, kline_store, kline_chart, dashboard_html, screen_registry
 
 # -------------------- 屏蔽警告 + 加速配置 --------------------
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
 
-# 数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
+# 数据库引擎（进程级共享连接池）
+engine = db.get_engine()
 
 
 # -------------------- 一次性加载所有K线数据 --------------------
@@ -41,22 +23,8 @@ def load_all_data():
     if not all_codes:
         return df_up, pd.DataFrame(), {}, {}
 
-    placeholders = ",".join([f"'{c}'" for c in all_codes])
-
-    sql_all_k = f"""
-        SELECT dt, code, price_open AS Open, price_close AS Close,
-               price_highest AS High, price_lowest AS Low, trade_amount AS Volume, rise
-        FROM stock_detail
-        WHERE code IN ({placeholders})
-        ORDER BY code, dt ASC
-    """
-    df_k_all = pd.read_sql(sql_all_k, engine)
-    df_k_all["dt"] = pd.to_datetime(df_k_all["dt"])
-
-    # 只保留最近 3 个月
-    last_date = df_k_all["dt"].max()
-    start_date = last_date - pd.DateOffset(months=3)
-    df_k_all = df_k_all[df_k_all["dt"] >= start_date].copy()
+    # 只保留最近 3 个月，K 线从本地列式存储读取
+    df_k_all = kline_store.load_recent_kline(all_codes, months=3)
 
     # ====================== ✅ 强制修复：平盘 Open == Close → 变红 ======================
     df_k_all.loc[df_k_all["Close"] == df_k_all["Open"], "Close"] += 0.0001
@@ -70,45 +38,10 @@ def load_all_data():
     return df_up, df_k_all, price_map, rise_map
 
 
-# -------------------- A股风格：涨红跌绿 --------------------
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
-
-
-# -------------------- 极快绘图 --------------------
-def fast_plot(df):
-    try:
-        fig, ax = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img}"
-    except:
-        return ""
-
-
-def process_one(code, df_k_all):
-    df = df_k_all[df_k_all["code"] == code].copy()
-    if len(df) < 5:
-        return code, ""
-    df.set_index("dt", inplace=True)
-    return code, fast_plot(df)
-
-
 # -------------------- 并行绘图 --------------------
-def generate_html(today):
+@screen_registry.register("stock_2days_up_options", rules={"stock_2days_up": {"exclude_kcb": False}},
+                          params={"today": screen_registry.TODAY})
+def generate_html(today, html_dir=kline_chart.HTML_DIR):
     df_up, df_k_all, price_map, rise_map = load_all_data()
     if df_up.empty:
         print("⚠️ 没有上涨数据，跳过 HTML 生成")
@@ -117,20 +50,13 @@ def generate_html(today):
     industry_count = df_up["industry"].value_counts().sort_values(ascending=False)
     industries = industry_count.index.tolist()
 
-    stock_image_map = {}
     print("🖼️ 开始批量绘图...")
-
-    with ProcessPoolExecutor(max_workers=14) as executor:
-        fn = partial(process_one, df_k_all=df_k_all)
-        results = list(executor.map(fn, df_up["code"].unique()))
-
-    for code, img in results:
-        stock_image_map[code] = img
+    stock_image_map = kline_chart.render_charts(df_k_all, df_up["code"].unique(), html_dir=html_dir)
 
     print("🌍 生成HTML...")
 
     # HTML 模板 & 样式
-    html = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -187,50 +113,45 @@ def generate_html(today):
                 <div class="tabs">
     '''
 
-    # 行业TAB
-    for i, ind in enumerate(industries):
-        count = industry_count[ind]
-        active = "active" if i == 0 else ""
-        html += f'<button class="tab {active}" id="tab-btn-{i}" onclick="setTab({i})">{ind}(<span class="cnt">{count}</span>)</button>'
-
-    html += '</div></div>'
-
-    # 行业内容区
-    for i, ind in enumerate(industries):
-        show = "active" if i == 0 else ""
-        html += f'<div class="tab-content {show}" id="tab-content-{i}">'
-        for _, r in df_up[df_up["industry"] == ind].iterrows():
-            code = r["code"]
-            img = stock_image_map.get(code, "")
-            if not img: continue
-
-            price = price_map.get(code, "")
-            rise_val = rise_map.get(code, 0.00)
-
-            price_str = f"({price} 元)" if price else ""
-            rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-            rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-
-            title_html = f'{code} {r["stock_name"]}<span class="price">{price_str}</span>{rise_str}'
-
-            # ====================== ✅ 核心改动：主板、创业板、科创板精准分类 ======================
-            if code.startswith(('300', '301')):
-                mkt = "cyb"
-            elif code.startswith('688'):
-                mkt = "kcb"
-            else:
-                mkt = "zb"
-
-            html += f'''
-            <div class="card" data-market="{mkt}">
-                <div class="stock-title">{title_html}</div>
-                <div class="sub">{r["industry_detail"]} | 连续{r["number_of_consecutive_days"]}天</div>
-                <img src="{img}">
-            </div>
-            '''
-        html += "</div>"
+    industry_rows = dashboard_html.group_records(df_up, "industry")
+
+    def iter_cards():
+        # 行业TAB
+        for i, ind in enumerate(industries):
+            active = "active" if i == 0 else ""
+            yield f'<button class="tab {active}" id="tab-btn-{i}" onclick="setTab({i})">{ind}(<span class="cnt">{industry_count[ind]}</span>)</button>'
+        yield '</div></div>'
+
+        # 行业内容区
+        for i, ind in enumerate(industries):
+            show = "active" if i == 0 else ""
+            yield f'<div class="tab-content {show}" id="tab-content-{i}">'
+            for r in industry_rows.get(ind, []):
+                code = r["code"]
+                img = stock_image_map.get(code, "")
+                if not img:
+                    continue
+
+                price_rise = dashboard_html.price_rise_html(price_map.get(code, ""), rise_map.get(code, 0.00), unit=" 元")
+
+                # ====================== ✅ 核心改动：主板、创业板、科创板精准分类 ======================
+                if code.startswith(('300', '301')):
+                    mkt = "cyb"
+                elif code.startswith('688'):
+                    mkt = "kcb"
+                else:
+                    mkt = "zb"
+
+                yield f'''
+                <div class="card" data-market="{mkt}">
+                    <div class="stock-title">{code} {r["stock_name"]}{price_rise}</div>
+                    <div class="sub">{r["industry_detail"]} | 连续{r["number_of_consecutive_days"]}天</div>
+                    {dashboard_html.chart_html(img)}
+                </div>
+                '''
+            yield "</div>"
 
-    html += '''
+    html_tail = '''
         <script>
             let currentColumns = 3;
             let currentMarket = 'all';
@@ -290,77 +211,15 @@ def generate_html(today):
     </body></html>
     '''
 
-    out_file = f"""../html/{today}_连续 2 天上涨股票 K 线图.html"""
-    with open(out_file, "w", encoding="utf-8") as f:
-        f.write(html)
+    out_file = os.path.join(html_dir, f"""{today}_连续 2 天上涨股票 K 线图.html""")
+    dashboard_html.write_html(out_file, html_head, iter_cards(), dashboard_html.chart_script(stock_image_map), html_tail)
 
     print(f"✅ 完成！文件已生成：{out_file}")
 
 
 def update_stock_2days_up(today):
-    # 1. 清空表
-    sql_truncate = "TRUNCATE TABLE stock_2days_up;"
-
-    # 2. 插入数据（移除过滤科创板的限制）
-    sql_insert = f"""
-    insert into stock.stock_2days_up
-    with step1 as (
-        select
-            dt,
-            code,
-            stock_name,
-            price_close,
-            price_open,
-            case when price_close >= price_open then 1 else 0 end as is_up
-        from stock_detail
-        where dt>='2026-03-02'
-            and upper(stock_name) not like '%%ST%%'
-    ),
-    step2 as (
-        select
-            *,
-            row_number() over (partition by code order by dt) as rn,
-            row_number() over (partition by code, is_up order by dt) as rn_up
-        from step1
-    ),
-    step3 as (
-        select
-            code,
-            max(stock_name) as stock_name,
-            count(*) as number_of_consecutive_days,
-            max(dt) as end_dt
-        from step2
-        where is_up = 1
-        group by code, rn - rn_up
-        having count(*) >= 2
-           and max(dt) = '{today}'
-    ),
-    final_result as (
-        select
-            s3.code,
-            s3.stock_name,
-            s3.number_of_consecutive_days,
-            dst.industry,
-            dst.industry_detail
-        from step3 s3
-        left join dim_stock_tag dst
-            on s3.code = replace(replace(lower(dst.code), 'sz', ''), 'sh', '')
-    )
-    select * from final_result
-    order by number_of_consecutive_days desc;
-    """
-
-    with engine.connect() as conn:
-        print("正在清空表 stock_2days_up...")
-        conn.execute(text(sql_truncate))
-
-        print("正在插入连续2天上涨股票数据...")
-        conn.execute(text(sql_insert))
-
-        conn.commit()
-
-    print("✅ SQL执行完成！")
-
+    # 连续 2 天收阳（保留科创板，剔除 ST），基于当天的 stock_streak_feature 筛选
+    streak_rules.run_rules(today, {"stock_2days_up": {"exclude_kcb": False}}, engine=engine, screen="stock_2days_up_options")
 
 if __name__ == "__main__":
     start_time = time.time()
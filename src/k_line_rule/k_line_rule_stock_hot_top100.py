@@ -1,72 +1,19 @@
 from datetime import datetime
+import os
 import time
 import pandas as pd
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine
-from concurrent.futures import ThreadPoolExecutor
 
-from src.utils import constants
-
-# ====================== 【只改这里】MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ===================================================================
+from src.utils import db, kline_store, kline_chart, dashboard_html, screen_registry
 
 # -------------------- 屏蔽警告 + 加速配置 --------------------
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
-
-# -------------------- A股风格：涨红跌绿 --------------------
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
-
-# -------------------- 极快绘图 --------------------
-def fast_plot(df):
-    try:
-        fig, ax = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img}"
-    except:
-        return ""
 
-# ======================================================================================
-# 同花顺热榜TOP个股 HTML 生成
-# ======================================================================================
-def generate_hotstock_html():
-    print("📥 加载同花顺热榜TOP个股数据...")
-    # 获取最新交易日期
-    last_dt = pd.read_sql("SELECT MAX(dt) AS dt FROM stock_detail", engine).iloc[0]["dt"]
+# 数据库引擎（进程级共享连接池）
+engine = db.get_engine()
 
-    # 关联 dim_stock_tag 取出行业、细分行业
-    sql = f"""
+# 热榜关联当日行情，{last_dt} 为最新交易日（migrate.explain_check 也用它检查索引 / 分区裁剪）
+HOT_TOP_SQL = """
     select
         a.seq,
         a.stock_code,
@@ -75,10 +22,23 @@ def generate_hotstock_html():
         c.industry_detail
     from dim_stock_hot a
     left join stock_detail b on a.stock_code = b.code and b.dt = '{last_dt}'
-    left join dim_stock_tag c on REPLACE(REPLACE(LOWER(c.code), 'sz', ''), 'sh', '') = a.stock_code
+    left join dim_stock_tag c on c.code = a.stock_code
     where b.stock_name not like '%%ST%%'
     order by a.seq;
-    """
+"""
+
+
+# ======================================================================================
+# 同花顺热榜TOP个股 HTML 生成
+# ======================================================================================
+@screen_registry.register("stock_hot_top100")
+def generate_hotstock_html(html_dir=kline_chart.HTML_DIR):
+    print("📥 加载同花顺热榜TOP个股数据...")
+    # 获取最新交易日期
+    last_dt = kline_store.latest_dt()
+
+    # 关联 dim_stock_tag 取出行业、细分行业
+    sql = HOT_TOP_SQL.format(last_dt=last_dt)
     df_hot = pd.read_sql(sql, engine)
     if df_hot.empty:
         print("❌ 热榜暂无有效个股数据")
@@ -90,23 +50,8 @@ def generate_hotstock_html():
 
     # 提取代码，批量查询K线
     codes = df_hot["stock_code"].unique().tolist()
-    ph = ",".join([f"'{c}'" for c in codes])
-    k_sql = f"""
-        SELECT dt, code,
-               price_open AS Open, price_close AS Close,
-               price_highest AS High, price_lowest AS Low,
-               trade_amount AS Volume, rise
-        FROM stock_detail
-        WHERE code IN ({ph})
-        ORDER BY code, dt
-    """
-    df_k = pd.read_sql(k_sql, engine)
-    df_k["dt"] = pd.to_datetime(df_k["dt"])
-
     # 保留最近3个月K线
-    end_dt = df_k["dt"].max()
-    start_dt = end_dt - pd.DateOffset(months=3)
-    df_k = df_k[df_k["dt"] >= start_dt].copy()
+    df_k = kline_store.load_recent_kline(codes, months=3)
 
     # 平盘K线强制变红
     df_k.loc[df_k["Close"] == df_k["Open"], "Close"] += 0.0001
@@ -116,23 +61,12 @@ def generate_hotstock_html():
     price_map = last_df["Close"].round(2).to_dict()
     rise_map = last_df["rise"].round(2).to_dict()
 
-    # 多线程绘图
+    # 多进程绘图
     print("🖼️ 开始绘制热榜个股K线...")
-    img_map = {}
-    def plot_one(code):
-        d = df_k[df_k["code"] == code].copy()
-        if len(d) < 5:
-            return code, ""
-        d.set_index("dt", inplace=True)
-        return code, fast_plot(d)
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        res = list(executor.map(plot_one, codes))
-    for c, i in res:
-        img_map[c] = i
+    img_map = kline_chart.render_charts(df_k, codes, html_dir=html_dir)
 
     print("🌍 生成热榜HTML页面...")
-    html = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -179,32 +113,25 @@ def generate_hotstock_html():
     '''
 
     # 循环生成卡片，替换为行业+细分行业
-    for _, r in df_hot.iterrows():
-        code = r["stock_code"]
-        seq = r["seq"]
-        stock_name = r["stock_name"]
-        industry = r["industry"]
-        industry_detail = r["industry_detail"]
-        img = img_map.get(code, "")
-        if not img:
-            continue
-
-        price = price_map.get(code, "")
-        rise_val = rise_map.get(code, 0)
-        price_str = f"({price}元)" if price else ""
-        rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-        rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-
-        # 原固定文字替换为 行业 | 细分行业
-        html += f'''
-        <div class="card">
-            <div class="stock-title">排名{seq} | {code} {stock_name}<span class="price">{price_str}</span>{rise_str}</div>
-            <div class="sub">{industry} | {industry_detail}</div>
-            <img src="{img}">
-        </div>
-        '''
+    def iter_cards():
+        for r in dashboard_html.iter_records(df_hot):
+            code = r["stock_code"]
+            img = img_map.get(code, "")
+            if not img:
+                continue
+
+            price_rise = dashboard_html.price_rise_html(price_map.get(code, ""), rise_map.get(code, 0))
+
+            # 原固定文字替换为 行业 | 细分行业
+            yield f'''
+            <div class="card">
+                <div class="stock-title">排名{r["seq"]} | {code} {r["stock_name"]}{price_rise}</div>
+                <div class="sub">{r["industry"]} | {r["industry_detail"]}</div>
+                {dashboard_html.chart_html(img)}
+            </div>
+            '''
 
-    html += '''
+    html_tail = '''
             </div>
         </div>
         <script>
@@ -228,9 +155,8 @@ def generate_hotstock_html():
     '''
 
     # 输出HTML文件
-    filename = f"../html/{datetime.now().strftime('%Y-%m-%d')}_同花顺热榜TOP个股.html"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html)
+    filename = os.path.join(html_dir, f"{datetime.now().strftime('%Y-%m-%d')}_同花顺热榜TOP个股.html")
+    dashboard_html.write_html(filename, html_head, iter_cards(), dashboard_html.chart_script(img_map), html_tail)
     print(f"✅ 热榜看板完成！文件已生成：{filename}")
 
 
@@ -1,116 +1,56 @@
 from datetime import datetime, timedelta
+import os
+import sys
 import time
 import pandas as pd
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine, text
-from concurrent.futures import ThreadPoolExecutor
 
-from src.utils import constants
-
-# ====================== 【只改这里】MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ===================================================================
+from src.utils import db, kline_store, kline_chart, dashboard_html, feature_store, volume_break, screen_registry
 
 # -------------------- 屏蔽警告 + 加速配置 --------------------
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
-
-# -------------------- A股风格：涨红跌绿 --------------------
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
-
-# -------------------- 极快绘图 --------------------
-def fast_plot(df):
-    try:
-        fig, ax = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img}"
-    except:
-        return ""
-
-def process_one(code, df_k_all):
-    df = df_k_all[df_k_all["code"] == code].copy()
-    if len(df) < 5:
-        return code, ""
-    df.set_index("dt", inplace=True)
-    return code, fast_plot(df)
+
+# 数据库引擎（进程级共享连接池）
+engine = db.get_engine()
+
 
 # ======================================================================================
 # ✅ 新功能：90天内首次成交量3倍放量个股 HTML K线看板
 # 规则：当日成交量 >= 前5日均量*3，取90天区间内第一次满足条件日期
 # ======================================================================================
-def generate_first_volume_break_html():
+@screen_registry.register("k_line_rule_3_times")
+def generate_first_volume_break_html(html_dir=kline_chart.HTML_DIR):
+    """
+    vol_ma5 取自日频特征存储，按每只股票的完整历史递推，90 天窗口前几根 K 线的均量也用到了窗口之前的成交量；
+    原来在 90 天窗口内现算 rolling(5)，窗口前 4 天均量为空、不可能入选，现在这几天也可能成为首次放量日
+    """
     print("📥 开始查询90天内首次放量（量能≥前5日均量3倍）股票...")
 
     # 1. 确定时间区间
-    end_dt = pd.read_sql("SELECT MAX(dt) AS dt FROM stock_detail", engine).iloc[0]["dt"]
+    end_dt = kline_store.latest_dt()
     start_90d = (pd.to_datetime(end_dt) - timedelta(days=90)).strftime("%Y-%m-%d")
 
-    # 2. 拉取90天内所有非ST股票K线数据
-    sql_k_raw = f"""
-        SELECT dt, code, stock_name, trade_amount
-        FROM stock_detail
-        WHERE dt >= '{start_90d}'
-          AND UPPER(stock_name) NOT LIKE '%%ST%%'
-        ORDER BY code, dt ASC
-    """
-    df_raw = pd.read_sql(sql_k_raw, engine)
-    df_raw["dt"] = pd.to_datetime(df_raw["dt"])
+    # 特征存储没跟上 K 线存储（当天更新失败 / 被跳过）时先补齐，否则会静默漏掉最近几天
+    if feature_store.latest_dt() != end_dt:
+        print(f"⚠️  特征存储停在 {feature_store.latest_dt()}，先增量更新到 {end_dt}")
+        feature_store.update(end_dt)
 
-    if df_raw.empty:
+    # 2. 读取90天内所有非ST股票的日频特征（5日均量已由特征存储按日增量算好）
+    df_feat = feature_store.load_features(
+        start_90d, end_dt, columns=["dt", "code", "stock_name", "volume", "vol_ma5"], exclude_st=True
+    )
+
+    if df_feat.empty:
         print("❌ 暂无符合条件股票")
         return
 
-    # 3. 分组计算前5日均量，标记放量信号
-    result_list = []
-    grouped = df_raw.groupby("code")
-
-    for code, g in grouped:
-        g = g.sort_values("dt").reset_index(drop=True)
-        # 滚动5日均量
-        g["vol_ma5"] = g["trade_amount"].rolling(window=5).mean()
-        # 判断放量条件：成交量 >= 5日均量 *3
-        g["is_break"] = g["trade_amount"] >= g["vol_ma5"] * 3
-
-        # 筛选满足条件的行，取最早一条（90天内第一次放量）
-        break_df = g[g["is_break"] == True]
-        if break_df.empty:
-            continue
-        first_break_row = break_df.iloc[0]
-        result_list.append({
-            "code": code,
-            "stock_name": first_break_row["stock_name"],
-            "first_break_dt": first_break_row["dt"].strftime("%Y-%m-%d")
-        })
+    # 3. 放量条件：成交量 >= 5日均量 *3；特征按 code, dt 有序，每只股票保留最早一条（90天内第一次放量）
+    df_break = df_feat[df_feat["volume"] >= df_feat["vol_ma5"] * 3].drop_duplicates("code", keep="first")
+    result_list = [{
+        "code": r["code"],
+        "stock_name": r["stock_name"],
+        "first_break_dt": r["dt"].strftime("%Y-%m-%d")
+    } for r in dashboard_html.iter_records(df_break)]
 
     df_target = pd.DataFrame(result_list)
     if df_target.empty:
@@ -127,17 +67,10 @@ def generate_first_volume_break_html():
             industry,
             industry_detail
         FROM dim_stock_tag
-        WHERE REPLACE(REPLACE(LOWER(code), 'sz', ''), 'sh', '') IN ({ph})
+        WHERE code IN ({ph})
     """
     df_tag = pd.read_sql(sql_tag, engine)
 
-    def clean_code(s):
-        s = str(s).lower()
-        s = s.replace("sz", "").replace("sh", "")
-        return s
-
-    df_tag["code"] = df_tag["code"].apply(clean_code)
-
     df_merge = pd.merge(
         df_target,
         df_tag,
@@ -149,18 +82,7 @@ def generate_first_volume_break_html():
     # 5. 加载K线绘图数据（近3个月，用于绘制K线图）
     k_end = pd.to_datetime(end_dt)
     k_start = k_end - timedelta(days=90)
-    sql_plot_k = f"""
-        SELECT dt, code,
-               price_open AS Open, price_close AS Close,
-               price_highest AS High, price_lowest AS Low,
-               trade_amount AS Volume, rise
-        FROM stock_detail
-        WHERE code IN ({ph})
-          AND dt >= '{k_start.strftime("%Y-%m-%d")}'
-        ORDER BY code, dt ASC
-    """
-    df_k_plot = pd.read_sql(sql_plot_k, engine)
-    df_k_plot["dt"] = pd.to_datetime(df_k_plot["dt"])
+    df_k_plot = kline_store.load_kline(k_start.strftime("%Y-%m-%d"), codes=target_codes)
 
     # =====================【修改重点：一字涨跌停颜色修复逻辑】=====================
     # 区分一字涨停、一字跌停、普通十字星，避免一字跌停误变红
@@ -188,21 +110,9 @@ def generate_first_volume_break_html():
     price_map = last_k["Close"].round(2).to_dict()
     rise_map = last_k["rise"].round(2).to_dict()
 
-    # 6. 多线程批量绘图
+    # 6. 多进程批量绘图
     print("🖼️ 开始绘制K线图...")
-    img_map = {}
-
-    def plot_task(code):
-        sub = df_k_plot[df_k_plot["code"] == code].copy()
-        if len(sub) < 5:
-            return code, ""
-        sub.set_index("dt", inplace=True)
-        return code, fast_plot(sub)
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        res = list(executor.map(plot_task, target_codes))
-    for c, img in res:
-        img_map[c] = img
+    img_map = kline_chart.render_charts(df_k_plot, target_codes, html_dir=html_dir)
 
     # 7. 按行业分组，行业数量排序
     ind_cnt = df_merge["industry"].value_counts().sort_values(ascending=False)
@@ -210,7 +120,7 @@ def generate_first_volume_break_html():
 
     # 8. HTML页面生成
     print("🌍 生成HTML看板...")
-    html = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -258,42 +168,38 @@ def generate_first_volume_break_html():
                 <div class="tabs">
     '''
 
-    # 构建行业Tab按钮
-    for i, ind in enumerate(industries):
-        active = "active" if i == 0 else ""
-        html += f'<button class="tab {active}" onclick="setTab({i})">{ind}({ind_cnt[ind]})</button>'
-    html += '</div></div>'
-
-    # 填充每个行业卡片内容
-    for i, ind in enumerate(industries):
-        active_cls = "active" if i == 0 else ""
-        html += f'<div class="tab-content {active_cls}">'
-        sub_data = df_merge[df_merge["industry"] == ind]
-        for _, row in sub_data.iterrows():
-            code = row["code"]
-            img = img_map.get(code, "")
-            if not img:
-                continue
-
-            price = price_map.get(code, "")
-            rise_val = rise_map.get(code, 0.00)
-            break_day = row["first_break_dt"]
-
-            price_str = f"({price}元)" if price else ""
-            rise_css = "rise-red" if rise_val >= 0 else "rise-green"
-            rise_html = f'<span class="{rise_css}">{rise_val:+.2f}%</span>'
-
-            html += f'''
-            <div class="card">
-                <div class="break-date">🔥首次放量日期：{break_day}</div>
-                <div class="stock-title">{code} {row["stock_name"]}<span class="price">{price_str}</span>{rise_html}</div>
-                <div class="sub">{row["industry_detail"]}</div>
-                <img src="{img}">
-            </div>
-            '''
-        html += "</div>"
-
-    html += '''
+    industry_rows = dashboard_html.group_records(df_merge, "industry")
+
+    def iter_cards():
+        # 构建行业Tab按钮
+        for i, ind in enumerate(industries):
+            active = "active" if i == 0 else ""
+            yield f'<button class="tab {active}" onclick="setTab({i})">{ind}({ind_cnt[ind]})</button>'
+        yield '</div></div>'
+
+        # 填充每个行业卡片内容
+        for i, ind in enumerate(industries):
+            active_cls = "active" if i == 0 else ""
+            yield f'<div class="tab-content {active_cls}">'
+            for row in industry_rows.get(ind, []):
+                code = row["code"]
+                img = img_map.get(code, "")
+                if not img:
+                    continue
+
+                price_rise = dashboard_html.price_rise_html(price_map.get(code, ""), rise_map.get(code, 0.00))
+
+                yield f'''
+                <div class="card">
+                    <div class="break-date">🔥首次放量日期：{row["first_break_dt"]}</div>
+                    <div class="stock-title">{code} {row["stock_name"]}{price_rise}</div>
+                    <div class="sub">{row["industry_detail"]}</div>
+                    {dashboard_html.chart_html(img)}
+                </div>
+                '''
+            yield "</div>"
+
+    html_tail = '''
         <script>
             function changeColumns(col) {
                 let grids = document.querySelectorAll('.tab-content');
@@ -314,18 +220,43 @@ def generate_first_volume_break_html():
     </body></html>
     '''
 
-    save_name = f"../html/{datetime.now().strftime('%Y-%m-%d')}_90天首次3倍放量股票.html"
-    with open(save_name, "w", encoding="utf-8") as fw:
-        fw.write(html)
+    save_name = os.path.join(html_dir, f"{datetime.now().strftime('%Y-%m-%d')}_90天首次3倍放量股票.html")
+    dashboard_html.write_html(save_name, html_head, iter_cards(), dashboard_html.chart_script(img_map), html_tail)
 
     print(f"✅ 文件生成完成！路径：{save_name}")
 
 
+# ======================================================================================
+# 参数扫描：一次评估多组 (均量窗口, 放量倍数)，看各组参数在 90 天内选出多少只股票
+# 用法：python k_line_rule_3_times.py sweep
+# ======================================================================================
+SWEEP_WINDOWS = (3, 5, 10, 20)
+SWEEP_MULTIPLIERS = (1.5, 2, 2.5, 3, 4, 5)
+
+
+def sweep_first_volume_break(windows=SWEEP_WINDOWS, multipliers=SWEEP_MULTIPLIERS, days=90):
+    end_dt = kline_store.latest_dt()
+    start_dt = (pd.to_datetime(end_dt) - timedelta(days=days)).strftime("%Y-%m-%d")
+    df_raw = kline_store.load_kline(start_dt, columns=["dt", "code", "stock_name", "trade_amount"], exclude_st=True)
+    if df_raw.empty:
+        print("❌ 暂无K线数据")
+        return None
+
+    df_sweep = volume_break.sweep(df_raw, windows, multipliers)
+    df_summary = volume_break.sweep_summary(df_sweep)
+    print(f"📊 {start_dt} ~ {end_dt} 首次放量参数扫描（{len(windows)} 个窗口 × {len(multipliers)} 个倍数）：")
+    print(df_summary.to_string(index=False))
+    return df_sweep
+
+
 if __name__ == "__main__":
     start_time = time.time()
 
-    # 执行放量选股看板
-    generate_first_volume_break_html()
+    if len(sys.argv) > 1 and sys.argv[1] == "sweep":
+        sweep_first_volume_break()
+    else:
+        # 执行放量选股看板
+        generate_first_volume_break_html()
 
     end_time = time.time()
     print(f"程序总耗时：{end_time - start_time:.2f} 秒")
\ No newline at end of file
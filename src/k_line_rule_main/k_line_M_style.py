@@ -1,64 +1,17 @@
 from datetime import datetime
+import os
 import time
 import pandas as pd
-import numpy as np
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine
-from concurrent.futures import ThreadPoolExecutor
-from scipy.signal import find_peaks
 
-from src.utils import constants
-
-# ====================== MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ========================================================
+from src.utils import db, kline_store, kline_pattern, kline_chart, dashboard_html, screen_registry
+from src.etl import screen_eval
 
 # -------------------- 屏蔽警告 + 加速配置 --------------------
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
-
-# -------------------- A股风格：涨红跌绿 --------------------
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
-
 
-# -------------------- 极快绘图 --------------------
-def fast_plot(df):
-    try:
-        fig, ax = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img}"
-    except Exception:
-        return ""
+# 数据库引擎（进程级共享连接池）
+engine = db.get_engine()
 
 
 # ======================================================================================
@@ -67,149 +20,67 @@ def fast_plot(df):
 def detect_m_pattern(df_single):
     """
     判断单个股票是否在【最近 3 天内】刚刚到达/跌破 M 顶右侧颈线低位
+    规则见 utils/kline_pattern.m_pattern_arrays，全市场筛选请用 kline_pattern.detect_m_pattern_batch
     返回: (bool, left_peak_price, right_peak_price, neckline_price)
     """
-    if len(df_single) < 60:
-        return False, 0, 0, 0
-
-    df = df_single.sort_values("dt").reset_index(drop=True)
-    highs = df["High"].values
-    volumes = df["Volume"].values
-    closes = df["Close"].values
-    total_len = len(df)
-
-    # 1. 寻峰 (6个月数据下，最小间距设为 7 天，显著性 1.5%)
-    peaks, _ = find_peaks(highs, distance=7, prominence=highs.max() * 0.015)
-
-    if len(peaks) < 2:
-        return False, 0, 0, 0
-
-    # 取最后两个显著波峰 (T1: 左顶, T2: 右顶)
-    p1_idx, p2_idx = peaks[-2], peaks[-1]
-
-    # ------------------------------------------------------------------
-    # 🎯【核心条件 1】右顶 (T2) 必须是最近形成的（发生在最后 7 个交易日内）
-    # ------------------------------------------------------------------
-    if (total_len - 1 - p2_idx) > 7:
-        return False, 0, 0, 0
-
-    # 🎯【核心条件 2】两顶时间间隔合适（8 ~ 90 个交易日，支持大级别 M 顶）
-    peak_interval = p2_idx - p1_idx
-    if not (8 <= peak_interval <= 90):
-        return False, 0, 0, 0
-
-    t1_high = highs[p1_idx]
-    t2_high = highs[p2_idx]
-
-    # 🎯【核心条件 3】两顶高度接近（价差在 3% 以内）
-    if abs(t1_high - t2_high) / max(t1_high, t2_high) > 0.03:
-        return False, 0, 0, 0
-
-    # 🎯【核心条件 4】计算颈线位（两顶之间的最低点）
-    valley_slice = highs[p1_idx:p2_idx]
-    neckline = np.min(valley_slice)
-
-    # 🎯【核心条件 5】量价背离（右顶成交量不能明显超越左顶）
-    v1 = volumes[p1_idx]
-    v2 = volumes[p2_idx]
-    if v2 > v1 * 1.15:
-        return False, 0, 0, 0
-
-    # ------------------------------------------------------------------
-    # 🎯【核心条件 6】锁定“新鲜度”：仅限【最近 3 天内】到达/下破颈线位置
-    # ------------------------------------------------------------------
-    recent_3_closes = closes[-3:]
-
-    # 最近 3 天至少有 1 天收盘价处于 [颈线 * 0.92, 颈线 * 1.01] 临界区
-    is_recently_triggered = any(0.92 * neckline <= c <= 1.01 * neckline for c in recent_3_closes)
-
-    if is_recently_triggered:
-        return True, round(t1_high, 2), round(t2_high, 2), round(neckline, 2)
-
-    return False, 0, 0, 0
+    df = df_single.sort_values("dt")
+    return kline_pattern.m_pattern_arrays(df["High"].values, df["Volume"].values, df["Close"].values)
 
 
 # ======================================================================================
 # ✅ M 顶形态选股 + 按板块 Tab 分类生成 HTML
 # ======================================================================================
-def generate_m_pattern_html(today):
+@screen_registry.register("k_line_M_style", kline_months=6, params={"today": screen_registry.TODAY})
+def generate_m_pattern_html(today, html_dir=kline_chart.HTML_DIR):
 
     print("📥 加载全市场近 6 个月数据，筛选【最近 3 天】触发 M 顶的股票...")
 
-    sql_k = f"""
+    # 1. K 线从本地列式存储读取，行业标签表很小，单独查询后关联
+    df_all = kline_store.load_kline(kline_store.months_before(today, 6), exclude_st=True)
+    sql_tag = """
     select 
-        dt, 
-        s.code, 
-        stock_name,
-        Open, 
-        Close,
-        High, 
-        Low,
-        Volume, 
-        rise,
+        code, 
         industry, 
         industry_detail
-    from (
-        select 
-            dt, 
-            code, 
-            stock_name,
-            price_open as Open, 
-            price_close as Close,
-            price_highest as High, 
-            price_lowest as Low,
-            trade_amount as Volume, 
-            rise
-        from stock_detail
-        where dt >= date_sub('{today}', interval 6 month) and upper(stock_name) not like '%%ST%%'
-    ) s left join (
-        select 
-            replace(replace(lower(code), 'sz', ''), 'sh', '') as code, 
-            industry, 
-            industry_detail
-        from dim_stock_tag
-    ) dst on dst.code = s.code
-    order by s.code, dt;
-
+    from dim_stock_tag
     """
-    df_all = pd.read_sql(sql_k, engine)
+    df_tag = pd.read_sql(sql_tag, engine)
+    df_all = df_all.merge(df_tag, on="code", how="left")
+    df_all[["industry", "industry_detail"]] = df_all[["industry", "industry_detail"]].fillna("")
     if df_all.empty:
         print("❌ 未查到股票 K 线数据")
         return
 
-    df_all["dt"] = pd.to_datetime(df_all["dt"])
     df_all.loc[df_all["Close"] == df_all["Open"], "Close"] += 0.0001
 
-    # 2. 遍历筛选符合 M 形态的个股
+    # 2. 全市场批量识别 M 形态（按 code 只分组一次，不再逐只整表扫描）
     print("🔎 执行 6 个月跨度 & 最近3天临界 M 形态检测算法...")
-    codes = df_all["code"].unique().tolist()
+    df_res, df_all = kline_pattern.detect_m_pattern_batch(df_all)
     m_stocks = []
 
-    for code in codes:
-        sub_df = df_all[df_all["code"] == code]
-        is_m, t1, t2, neck = detect_m_pattern(sub_df)
-        if is_m:
-            last_row = sub_df.iloc[-1]
-
-            # 板块归类
-            board = "主板"
-            if code.startswith("300") or code.startswith("301"):
-                board = "创业板"
-            elif code.startswith("688"):
-                board = "科创板"
-
-            m_stocks.append({
-                "code": code,
-                "stock_name": last_row["stock_name"],
-                "board": board,
-                "price": round(last_row["Close"], 2),
-                "rise": round(last_row["rise"], 2),
-                "industry": last_row["industry"] if last_row["industry"] else "未分类",
-                "industry_detail": last_row["industry_detail"] if last_row["industry_detail"] else "",
-                "t1_price": t1,
-                "t2_price": t2,
-                "neck_price": neck
-            })
+    for r in df_res[df_res["is_hit"]].itertuples(index=False):
+        code, t1, t2, neck = r.code, r.t1_price, r.t2_price, r.neck_price
+        last_row = df_all.iloc[r.last_idx]
+
+        # 板块归类
+        board = "主板"
+        if code.startswith("300") or code.startswith("301"):
+            board = "创业板"
+        elif code.startswith("688"):
+            board = "科创板"
+
+        m_stocks.append({
+            "code": code,
+            "stock_name": last_row["stock_name"],
+            "board": board,
+            "price": round(last_row["Close"], 2),
+            "rise": round(last_row["rise"], 2),
+            "industry": last_row["industry"] if last_row["industry"] else "未分类",
+            "industry_detail": last_row["industry_detail"] if last_row["industry_detail"] else "",
+            "t1_price": t1,
+            "t2_price": t2,
+            "neck_price": neck
+        })
 
     df_m = pd.DataFrame(m_stocks)
     if df_m.empty:
@@ -217,21 +88,12 @@ def generate_m_pattern_html(today):
         return
 
     print(f"🎯 成功捕捉到 {len(df_m)} 只【近 3 天】触发 M 顶临界点的个股！")
+    screen_eval.record_picks("k_line_M_style", df_all["dt"].max(), df_m, engine=engine)
 
-    # 3. 多线程并行绘图
+    # 3. 多进程并行绘图
     print("🖼️ 开始绘制 K 线图...")
-    img_map = {}
     m_codes = df_m["code"].tolist()
-
-    def plot_one(code):
-        d = df_all[df_all["code"] == code].copy()
-        d.set_index("dt", inplace=True)
-        return code, fast_plot(d)
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        res = list(executor.map(plot_one, m_codes))
-    for c, img in res:
-        img_map[c] = img
+    img_map = kline_chart.render_charts(df_all, m_codes, min_bars=1, html_dir=html_dir)
 
     # 4. 板块 TAB 数据划分
     tabs = [
@@ -244,7 +106,7 @@ def generate_m_pattern_html(today):
 
     # 5. 生成 HTML 页面
     print("🌍 正在构建 HTML 页面...")
-    html = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -309,44 +171,40 @@ def generate_m_pattern_html(today):
                 <div class="tabs">
     '''
 
-    # 生成 TAB 按钮
-    for i, t in enumerate(tabs):
-        active = "active" if i == 0 else ""
-        count = len(t["df"])
-        html += f'<button class="tab {active}" onclick="setTab({i})">{t["name"]} ({count})</button>'
-    html += '</div></div>'
-
-    # 生成各 TAB 对应的个股卡片
-    for i, t in enumerate(tabs):
-        active = "active" if i == 0 else ""
-        html += f'<div class="tab-content {active}">'
-        sub_df = t["df"]
-
-        for _, r in sub_df.iterrows():
-            code = r["code"]
-            img = img_map.get(code, "")
-            if not img:
-                continue
-
-            price_str = f"({r['price']}元)"
-            rise_val = r["rise"]
-            rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-            rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-
-            html += f'''
-            <div class="card">
-                <div class="stock-title">{code} {r["stock_name"]}<span class="price">{price_str}</span>{rise_str}</div>
-                <div class="sub">板块: {r["board"]} ｜ 行业: {r["industry"]}</div>
-                <div class="m-info">
-                    M 顶结构: 左顶 {r["t1_price"]} 元 ｜ 右顶 {r["t2_price"]} 元 ｜ 颈线 {r["neck_price"]} 元
+    def iter_cards():
+        # 生成 TAB 按钮
+        for i, t in enumerate(tabs):
+            active = "active" if i == 0 else ""
+            yield f'<button class="tab {active}" onclick="setTab({i})">{t["name"]} ({len(t["df"])})</button>'
+        yield '</div></div>'
+
+        # 生成各 TAB 对应的个股卡片
+        for i, t in enumerate(tabs):
+            active = "active" if i == 0 else ""
+            yield f'<div class="tab-content {active}">'
+
+            for r in dashboard_html.iter_records(t["df"]):
+                code = r["code"]
+                img = img_map.get(code, "")
+                if not img:
+                    continue
+
+                price_rise = dashboard_html.price_rise_html(r["price"], r["rise"])
+
+                yield f'''
+                <div class="card">
+                    <div class="stock-title">{code} {r["stock_name"]}{price_rise}</div>
+                    <div class="sub">板块: {r["board"]} ｜ 行业: {r["industry"]}</div>
+                    <div class="m-info">
+                        M 顶结构: 左顶 {r["t1_price"]} 元 ｜ 右顶 {r["t2_price"]} 元 ｜ 颈线 {r["neck_price"]} 元
+                    </div>
+                    <div class="sub">{r["industry_detail"]}</div>
+                    {dashboard_html.chart_html(img)}
                 </div>
-                <div class="sub">{r["industry_detail"]}</div>
-                <img src="{img}">
-            </div>
-            '''
-        html += "</div>"
+                '''
+            yield "</div>"
 
-    html += '''
+    html_tail = '''
         <script>
             function changeColumns(col) {
                 let grids = document.querySelectorAll('.tab-content');
@@ -367,9 +225,8 @@ def generate_m_pattern_html(today):
     </body></html>
     '''
 
-    filename = f"../html/{datetime.now().strftime('%Y-%m-%d')}_M顶近3天触发股票看板.html"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html)
+    filename = os.path.join(html_dir, f"{datetime.now().strftime('%Y-%m-%d')}_M顶近3天触发股票看板.html")
+    dashboard_html.write_html(filename, html_head, iter_cards(), dashboard_html.chart_script(img_map), html_tail)
     print(f"✅ 完成！文件已生成：{filename}")
 
 
@@ -1,64 +1,17 @@
 from datetime import datetime
+import os
 import time
 import pandas as pd
-import numpy as np
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine
-from concurrent.futures import ThreadPoolExecutor
-from scipy.signal import find_peaks
 
-from src.utils import constants
-
-# ====================== MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ========================================================
+from src.utils import db, kline_store, kline_pattern, kline_chart, dashboard_html, screen_registry
+from src.etl import screen_eval
 
 # -------------------- 屏蔽警告 + 加速配置 --------------------
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
-
-# -------------------- A股风格：涨红跌绿 --------------------
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
-
 
-# -------------------- 极快绘图 --------------------
-def fast_plot(df):
-    try:
-        fig, ax = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img}"
-    except Exception:
-        return ""
+# 数据库引擎（进程级共享连接池）
+engine = db.get_engine()
 
 
 # ======================================================================================
@@ -67,126 +20,66 @@ def fast_plot(df):
 def detect_n_neckline_pattern(df_single):
     """
     判断单个股票是否在【最近 3 天内】股价刚好测试/处于 M 形态的 N 颈线位
+    规则见 utils/kline_pattern.n_neckline_arrays，全市场筛选请用 kline_pattern.detect_n_neckline_batch
     返回: (bool, left_peak_price, right_peak_price, neckline_price)
     """
-    if len(df_single) < 60:
-        return False, 0, 0, 0
-
-    df = df_single.sort_values("dt").reset_index(drop=True)
-    highs = df["High"].values
-    lows = df["Low"].values
-    volumes = df["Volume"].values
-    closes = df["Close"].values
-    total_len = len(df)
-
-    # 1. 寻峰 (6个月数据下，间隔 7 天，显著性 1.5%)
-    peaks, _ = find_peaks(highs, distance=7, prominence=highs.max() * 0.015)
-
-    if len(peaks) < 2:
-        return False, 0, 0, 0
-
-    # 取最后两个显著波峰 (T1: 左顶, T2: 右顶)
-    p1_idx, p2_idx = peaks[-2], peaks[-1]
-
-    # 规则 1: 右顶 (T2) 必须是最近形成的 (发生在最后 7 个交易日内)
-    if (total_len - 1 - p2_idx) > 7:
-        return False, 0, 0, 0
-
-    # 规则 2: 两顶时间间隔合适 (8 ~ 90 个交易日)
-    peak_interval = p2_idx - p1_idx
-    if not (8 <= peak_interval <= 90):
-        return False, 0, 0, 0
-
-    t1_high = highs[p1_idx]
-    t2_high = highs[p2_idx]
-
-    # 规则 3: 两顶空间高度接近 (价差 3% 以内)
-    if abs(t1_high - t2_high) / max(t1_high, t2_high) > 0.03:
-        return False, 0, 0, 0
-
-    # 规则 4: 计算 N 颈线位 (两顶之间的最低价格)
-    valley_slice = lows[p1_idx:p2_idx]
-    neckline = np.min(valley_slice)
-
-    # ------------------------------------------------------------------
-    # 🎯【核心定位】：锁定最近 3 天股价【正好处于 N 颈线位附近】
-    # 满足：近 3 天至少有一天的收盘价或最低价在 [颈线 * 0.98, 颈线 * 1.03]
-    # ------------------------------------------------------------------
-    recent_3_closes = closes[-3:]
-    recent_3_lows = lows[-3:]
-
-    at_neckline = any(
-        (0.98 * neckline <= c <= 1.03 * neckline) or (0.98 * neckline <= l <= 1.03 * neckline)
-        for c, l in zip(recent_3_closes, recent_3_lows)
-    )
-
-    if at_neckline:
-        return True, round(t1_high, 2), round(t2_high, 2), round(neckline, 2)
-
-    return False, 0, 0, 0
+    df = df_single.sort_values("dt")
+    return kline_pattern.n_neckline_arrays(df["High"].values, df["Low"].values, df["Close"].values)
 
 
 # ======================================================================================
 # ✅ N 颈线位股票筛选 + 5 TAB 板块 HTML 看板生成
 # ======================================================================================
-def generate_n_neckline_html():
+@screen_registry.register("k_line_N_style", kline_months=6)
+def generate_n_neckline_html(html_dir=kline_chart.HTML_DIR):
     print("📥 加载全市场近 6 个月数据，筛选【最近 3 天刚好处于 N 颈线位】的股票...")
 
-    # 1. 获取最新日期，取近 6 个月的数据
-    last_dt = pd.read_sql("SELECT MAX(dt) AS dt FROM stock_detail", engine).iloc[0]["dt"]
-
-    sql_k = f"""
+    # 1. 获取最新日期，取近 6 个月的数据（K 线走本地列式存储，行业标签单独关联）
+    last_dt = kline_store.latest_dt()
+    df_all = kline_store.load_kline(kline_store.months_before(last_dt, 6), exclude_st=True)
+    sql_tag = """
         SELECT 
-            s.dt, s.code, s.stock_name,
-            s.price_open AS Open, s.price_close AS Close,
-            s.price_highest AS High, s.price_lowest AS Low,
-            s.trade_amount AS Volume, s.rise,
-            dst.industry, dst.industry_detail
-        FROM stock_detail s
-        LEFT JOIN dim_stock_tag dst 
-            ON REPLACE(REPLACE(LOWER(dst.code), 'sz', ''), 'sh', '') = s.code
-        WHERE s.dt >= DATE_SUB('{last_dt}', INTERVAL 6 MONTH)
-          AND UPPER(s.stock_name) NOT LIKE '%%ST%%'
-        ORDER BY s.code, s.dt
+            code,
+            industry, industry_detail
+        FROM dim_stock_tag
     """
-    df_all = pd.read_sql(sql_k, engine)
+    df_tag = pd.read_sql(sql_tag, engine)
+    df_all = df_all.merge(df_tag, on="code", how="left")
+    df_all[["industry", "industry_detail"]] = df_all[["industry", "industry_detail"]].fillna("")
     if df_all.empty:
         print("❌ 未查到股票 K 线数据")
         return
 
-    df_all["dt"] = pd.to_datetime(df_all["dt"])
     df_all.loc[df_all["Close"] == df_all["Open"], "Close"] += 0.0001
 
-    # 2. 遍历筛选处于 N 颈线位的个股
+    # 2. 全市场批量识别 N 颈线位（按 code 只分组一次，不再逐只整表扫描）
     print("🔎 执行 N 颈线位检测算法...")
-    codes = df_all["code"].unique().tolist()
+    df_res, df_all = kline_pattern.detect_n_neckline_batch(df_all)
     n_stocks = []
 
-    for code in codes:
-        sub_df = df_all[df_all["code"] == code]
-        is_n, t1, t2, neck = detect_n_neckline_pattern(sub_df)
-        if is_n:
-            last_row = sub_df.iloc[-1]
-
-            # 板块归类
-            board = "主板"
-            if code.startswith("300") or code.startswith("301"):
-                board = "创业板"
-            elif code.startswith("688"):
-                board = "科创板"
-
-            n_stocks.append({
-                "code": code,
-                "stock_name": last_row["stock_name"],
-                "board": board,
-                "price": round(last_row["Close"], 2),
-                "rise": round(last_row["rise"], 2),
-                "industry": last_row["industry"] if last_row["industry"] else "未分类",
-                "industry_detail": last_row["industry_detail"] if last_row["industry_detail"] else "",
-                "t1_price": t1,
-                "t2_price": t2,
-                "neck_price": neck
-            })
+    for r in df_res[df_res["is_hit"]].itertuples(index=False):
+        code, t1, t2, neck = r.code, r.t1_price, r.t2_price, r.neck_price
+        last_row = df_all.iloc[r.last_idx]
+
+        # 板块归类
+        board = "主板"
+        if code.startswith("300") or code.startswith("301"):
+            board = "创业板"
+        elif code.startswith("688"):
+            board = "科创板"
+
+        n_stocks.append({
+            "code": code,
+            "stock_name": last_row["stock_name"],
+            "board": board,
+            "price": round(last_row["Close"], 2),
+            "rise": round(last_row["rise"], 2),
+            "industry": last_row["industry"] if last_row["industry"] else "未分类",
+            "industry_detail": last_row["industry_detail"] if last_row["industry_detail"] else "",
+            "t1_price": t1,
+            "t2_price": t2,
+            "neck_price": neck
+        })
 
     df_n = pd.DataFrame(n_stocks)
     if df_n.empty:
@@ -194,21 +87,12 @@ def generate_n_neckline_html():
         return
 
     print(f"🎯 成功捕捉到 {len(df_n)} 只【近 3 天刚好处于 N 颈线位】的标的！")
+    screen_eval.record_picks("k_line_N_style", df_all["dt"].max(), df_n, engine=engine)
 
-    # 3. 多线程并行绘图
+    # 3. 多进程并行绘图
     print("🖼️ 开始绘制 K 线图...")
-    img_map = {}
     n_codes = df_n["code"].tolist()
-
-    def plot_one(code):
-        d = df_all[df_all["code"] == code].copy()
-        d.set_index("dt", inplace=True)
-        return code, fast_plot(d)
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        res = list(executor.map(plot_one, n_codes))
-    for c, img in res:
-        img_map[c] = img
+    img_map = kline_chart.render_charts(df_all, n_codes, min_bars=1, html_dir=html_dir)
 
     # 4. 板块 TAB 数据划分
     tabs = [
@@ -221,7 +105,7 @@ def generate_n_neckline_html():
 
     # 5. 生成 HTML 页面
     print("🌍 正在构建 HTML 页面...")
-    html = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -286,44 +170,40 @@ def generate_n_neckline_html():
                 <div class="tabs">
     '''
 
-    # 生成 TAB 按钮
-    for i, t in enumerate(tabs):
-        active = "active" if i == 0 else ""
-        count = len(t["df"])
-        html += f'<button class="tab {active}" onclick="setTab({i})">{t["name"]} ({count})</button>'
-    html += '</div></div>'
-
-    # 生成各 TAB 对应的个股卡片
-    for i, t in enumerate(tabs):
-        active = "active" if i == 0 else ""
-        html += f'<div class="tab-content {active}">'
-        sub_df = t["df"]
-
-        for _, r in sub_df.iterrows():
-            code = r["code"]
-            img = img_map.get(code, "")
-            if not img:
-                continue
-
-            price_str = f"({r['price']}元)"
-            rise_val = r["rise"]
-            rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-            rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-
-            html += f'''
-            <div class="card">
-                <div class="stock-title">{code} {r["stock_name"]}<span class="price">{price_str}</span>{rise_str}</div>
-                <div class="sub">板块: {r["board"]} ｜ 行业: {r["industry"]}</div>
-                <div class="n-info">
-                    M顶关键点: 左顶 {r["t1_price"]} 元 ｜ 右顶 {r["t2_price"]} 元 ｜ 🎯 颈线位 N: {r["neck_price"]} 元
+    def iter_cards():
+        # 生成 TAB 按钮
+        for i, t in enumerate(tabs):
+            active = "active" if i == 0 else ""
+            yield f'<button class="tab {active}" onclick="setTab({i})">{t["name"]} ({len(t["df"])})</button>'
+        yield '</div></div>'
+
+        # 生成各 TAB 对应的个股卡片
+        for i, t in enumerate(tabs):
+            active = "active" if i == 0 else ""
+            yield f'<div class="tab-content {active}">'
+
+            for r in dashboard_html.iter_records(t["df"]):
+                code = r["code"]
+                img = img_map.get(code, "")
+                if not img:
+                    continue
+
+                price_rise = dashboard_html.price_rise_html(r["price"], r["rise"])
+
+                yield f'''
+                <div class="card">
+                    <div class="stock-title">{code} {r["stock_name"]}{price_rise}</div>
+                    <div class="sub">板块: {r["board"]} ｜ 行业: {r["industry"]}</div>
+                    <div class="n-info">
+                        M顶关键点: 左顶 {r["t1_price"]} 元 ｜ 右顶 {r["t2_price"]} 元 ｜ 🎯 颈线位 N: {r["neck_price"]} 元
+                    </div>
+                    <div class="sub">{r["industry_detail"]}</div>
+                    {dashboard_html.chart_html(img)}
                 </div>
-                <div class="sub">{r["industry_detail"]}</div>
-                <img src="{img}">
-            </div>
-            '''
-        html += "</div>"
+                '''
+            yield "</div>"
 
-    html += '''
+    html_tail = '''
         <script>
             function changeColumns(col) {
                 let grids = document.querySelectorAll('.tab-content');
@@ -344,9 +224,8 @@ def generate_n_neckline_html():
     </body></html>
     '''
 
-    filename = f"../html/{datetime.now().strftime('%Y-%m-%d')}_N颈线位股票看板.html"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html)
+    filename = os.path.join(html_dir, f"{datetime.now().strftime('%Y-%m-%d')}_N颈线位股票看板.html")
+    dashboard_html.write_html(filename, html_head, iter_cards(), dashboard_html.chart_script(img_map), html_tail)
     print(f"✅ 完成！文件已生成：{filename}")
 
 
@@ -7,61 +7,16 @@
 from datetime import datetime
 import time
 import pandas as pd
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine
-from concurrent.futures import ThreadPoolExecutor
 
-from src.utils import constants
-
-# ====================== MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ========================================================
+from src.utils import db, kline_store, kline_chart, dashboard_html
 
 # 屏蔽警告、中文显示配置
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 数据库连接
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
 
-# A股涨红跌绿配色
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
+# 数据库连接（进程级共享连接池）
+engine = db.get_engine()
 
-# 绘图函数
-def fast_plot(df):
-    try:
-        fig, _ = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img_base64}"
-    except Exception:
-        return ""
 
 def generate_custom_html(tag_codes):
     print("📥 读取自定义股票数据...")
@@ -77,7 +32,7 @@ def generate_custom_html(tag_codes):
     all_total_codes = list(set(all_total_codes))
 
     # 获取最新交易日
-    last_dt = pd.read_sql("select max(dt) as dt from stock_detail", engine).iloc[0]["dt"]
+    last_dt = kline_store.latest_dt()
     code_quote = ",".join([f"'{c}'" for c in all_total_codes])
 
     # 查询个股基础信息
@@ -93,7 +48,7 @@ def generate_custom_html(tag_codes):
         dst.industry,
         dst.industry_detail
     from stock_detail s
-    left join dim_stock_tag dst on replace(replace(lower(dst.code), 'sz', ''), 'sh', '') = s.code
+    left join dim_stock_tag dst on dst.code = s.code
     where s.dt = '{last_dt}' and s.code IN ({code_quote})
     """
     df_info = pd.read_sql(sql_info, engine)
@@ -102,27 +57,10 @@ def generate_custom_html(tag_codes):
         return
 
     # 股票信息字典 code -> row
-    stock_row_dict = {row["code"]: row for _, row in df_info.iterrows()}
+    stock_row_dict = {row["code"]: row for row in dashboard_html.iter_records(df_info)}
 
-    # 读取K线数据
-    code_k_quote = ",".join([f"'{c}'" for c in all_total_codes])
-    sql_kline = f"""
-    select 
-        dt, code,
-        price_open as Open, price_close as Close,
-        price_highest as High, price_lowest as Low,
-        trade_amount as Volume, rise
-    from stock_detail
-    where code in ({code_k_quote})
-    order by code, dt
-    """
-    df_k = pd.read_sql(sql_kline, engine)
-    df_k["dt"] = pd.to_datetime(df_k["dt"])
-
-    # 只保留近3个月K线
-    end_date = df_k["dt"].max()
-    start_date = end_date - pd.DateOffset(months=3)
-    df_k = df_k[df_k["dt"] >= start_date].copy()
+    # 读取K线数据，只保留近3个月K线
+    df_k = kline_store.load_recent_kline(all_total_codes, months=3)
     # 平盘K线变红
     df_k.loc[df_k["Close"] == df_k["Open"], "Close"] += 0.0001
 
@@ -131,24 +69,13 @@ def generate_custom_html(tag_codes):
     price_map = latest_k["Close"].round(2).to_dict()
     rise_map = latest_k["rise"].round(2).to_dict()
 
-    # 多线程批量绘图
+    # 多进程批量绘图
     print("🖼️ 绘制K线图...")
-    img_map = {}
-    def single_draw(code):
-        df_sub = df_k[df_k["code"] == code].copy()
-        if len(df_sub) < 5:
-            return code, ""
-        df_sub.set_index("dt", inplace=True)
-        return code, fast_plot(df_sub)
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        result_list = list(executor.map(single_draw, all_total_codes))
-    for c, img_str in result_list:
-        img_map[c] = img_str
+    img_map = kline_chart.render_charts(df_k, all_total_codes)
 
     # 生成HTML页面
     print("🌍 生成HTML文件...")
-    html_template = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -193,45 +120,42 @@ def generate_custom_html(tag_codes):
             <!-- Tab按钮区域 -->
             <div class="tab-group">
     '''
-    # 渲染Tab按钮
-    for idx, tag_name in enumerate(tag_name_list):
-        active_cls = "active" if idx == 0 else ""
-        html_template += f'<button class="tab-btn {active_cls}" onclick="switchTab({idx})">{tag_name}</button>'
-    html_template += '''
+    def iter_cards():
+        # 渲染Tab按钮
+        for idx, tag_name in enumerate(tag_name_list):
+            active_cls = "active" if idx == 0 else ""
+            yield f'<button class="tab-btn {active_cls}" onclick="switchTab({idx})">{tag_name}</button>'
+        yield '''
             </div>
-    '''
-
-    # 渲染每个Tab对应的卡片内容
-    for idx, (tag_name, code_list) in enumerate(tag_codes):
-        active_cls = "active" if idx == 0 else ""
-        html_template += f'<div class="tab-content {active_cls}" id="tab_{idx}">'
-        # 按当前分组内代码顺序渲染
-        for code in code_list:
-            if code not in stock_row_dict:
-                continue
-            row = stock_row_dict[code]
-            img_data = img_map.get(code, "")
-            if not img_data:
-                continue
-            close_price = price_map.get(code, "")
-            today_rise = rise_map.get(code, 0)
-            price_text = f"({close_price}元)" if close_price else ""
-            rise_class = "rise-red" if today_rise >= 0 else "rise-green"
-            rise_text = f'<span class="{rise_class}">{today_rise:+.2f}%</span>'
-
-            html_template += f'''
-            <div class="card">
-                <div class="stock-title">{code} {row["stock_name"]}<span class="price">{price_text}</span>{rise_text}</div>
-                <div class="sub" style="color:red;font-weight:bold;">
-                    5日涨幅: {row["rise_5"]:.2f}% ｜ 10日涨幅: {row["rise_10"]:.2f}% ｜ 15日涨幅: {row["rise_15"]:.2f}%
+        '''
+
+        # 渲染每个Tab对应的卡片内容
+        for idx, (tag_name, code_list) in enumerate(tag_codes):
+            active_cls = "active" if idx == 0 else ""
+            yield f'<div class="tab-content {active_cls}" id="tab_{idx}">'
+            # 按当前分组内代码顺序渲染
+            for code in code_list:
+                if code not in stock_row_dict:
+                    continue
+                row = stock_row_dict[code]
+                img_data = img_map.get(code, "")
+                if not img_data:
+                    continue
+                price_rise = dashboard_html.price_rise_html(price_map.get(code, ""), rise_map.get(code, 0))
+
+                yield f'''
+                <div class="card">
+                    <div class="stock-title">{code} {row["stock_name"]}{price_rise}</div>
+                    <div class="sub" style="color:red;font-weight:bold;">
+                        5日涨幅: {row["rise_5"]:.2f}% ｜ 10日涨幅: {row["rise_10"]:.2f}% ｜ 15日涨幅: {row["rise_15"]:.2f}%
+                    </div>
+                    <div class="sub">{row["industry"]} | {row["industry_detail"]}</div>
+                    {dashboard_html.chart_html(img_data)}
                 </div>
-                <div class="sub">{row["industry"]} | {row["industry_detail"]}</div>
-                <img src="{img_data}">
-            </div>
-            '''
-        html_template += "</div>"
+                '''
+            yield "</div>"
 
-    html_template += '''
+    html_tail = '''
         </div>
         <script>
             // Tab切换
@@ -258,8 +182,7 @@ def generate_custom_html(tag_codes):
     '''
     # 保存文件
     save_path = f"../html/{datetime.now().strftime('%Y-%m-%d')}_分组股票K线.html"
-    with open(save_path, "w", encoding="utf-8") as f:
-        f.write(html_template)
+    dashboard_html.write_html(save_path, html_head, iter_cards(), dashboard_html.chart_script(img_map), html_tail)
     print(f"✅ 生成完成：{save_path}")
 
 if __name__ == "__main__":
@@ -1,74 +1,21 @@
 from datetime import datetime
 
+import os
 import time
 import pandas as pd
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine, text
-from concurrent.futures import ThreadPoolExecutor
 
-from src.utils import constants
-
-# ====================== 【只改这里】MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ===================================================================
+from src.utils import db, kline_store, kline_chart, dashboard_html, screen_registry
 
 # -------------------- 屏蔽警告 + 加速配置 --------------------
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
-
-
-# -------------------- A股风格：涨红跌绿 --------------------
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
-
-
-# -------------------- 极快绘图 --------------------
-def fast_plot(df):
-    try:
-        fig, ax = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img}"
-    except:
-        return ""
-
-def process_one(code, df_k_all):
-    df = df_k_all[df_k_all["code"] == code].copy()
-    if len(df) < 5:
-        return code, ""
-    df.set_index("dt", inplace=True)
-    return code, fast_plot(df)
-
-
-def generate_html():
+
+# 数据库引擎（进程级共享连接池）
+engine = db.get_engine()
+
+
+@screen_registry.register("k_line_rule_core")
+def generate_html(html_dir=kline_chart.HTML_DIR):
     print("📥 加载核心股票数据...")
 
     # ========== 1、定义原始自选固定顺序列表 + 股票对应分类注释映射 ==========
@@ -216,7 +163,7 @@ def generate_html():
             unique_stock_list.append(name)
 
     # 1. 获取最新一天日期
-    last_dt = pd.read_sql("SELECT MAX(dt) AS dt FROM stock_detail", engine).iloc[0]["dt"]
+    last_dt = kline_store.latest_dt()
 
     # 2. 查询指定股票列表，删除末尾 order by，不打乱原生顺序
     sql = f"""
@@ -248,7 +195,7 @@ def generate_html():
             industry,
             industry_detail
         from dim_stock_tag
-    ) dst on replace(replace(lower(dst.code), 'sz', ''), 'sh', '') = s.code
+    ) dst on dst.code = s.code
     """
 
     df = pd.read_sql(sql, engine)
@@ -264,23 +211,8 @@ def generate_html():
 
     # 3. 加载这些股票的K线
     codes = df["code"].unique().tolist()
-    ph = ",".join([f"'{c}'" for c in codes])
-    k_sql = f"""
-        SELECT dt, code,
-               price_open AS Open, price_close AS Close,
-               price_highest AS High, price_lowest AS Low,
-               trade_amount AS Volume, rise
-        FROM stock_detail
-        WHERE code IN ({ph})
-        ORDER BY code, dt
-    """
-    df_k = pd.read_sql(k_sql, engine)
-    df_k["dt"] = pd.to_datetime(df_k["dt"])
-
     # 保留最近3个月K线
-    end_dt = df_k["dt"].max()
-    start_dt = end_dt - pd.DateOffset(months=3)
-    df_k = df_k[df_k["dt"] >= start_dt].copy()
+    df_k = kline_store.load_recent_kline(codes, months=3)
 
     # 平盘K线变红
     df_k.loc[df_k["Close"] == df_k["Open"], "Close"] += 0.0001
@@ -290,28 +222,16 @@ def generate_html():
     price_map = last_df["Close"].round(2).to_dict()
     rise_map = last_df["rise"].round(2).to_dict()
 
-    # 4. 多线程绘图
+    # 4. 多进程绘图
     print("🖼️ 开始绘制 K 线...")
-    img_map = {}
-
-    def plot_one(code):
-        d = df_k[df_k["code"] == code].copy()
-        if len(d) < 5:
-            return code, ""
-        d.set_index("dt", inplace=True)
-        return code, fast_plot(d)
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        res = list(executor.map(plot_one, codes))
-    for c, i in res:
-        img_map[c] = i
+    img_map = kline_chart.render_charts(df_k, codes, html_dir=html_dir)
 
     # ---------------------- 按代码分三大板块，板块内部保留原始自选顺序 ----------------------
     main_board = []    # 主板
     growth = []         # 创业板300/301
     star = []           # 科创板688
-    all_stock = df.to_dict("records") # 全部股票列表，顺序不变
-    for _, row in df.iterrows():
+    all_stock = list(dashboard_html.iter_records(df)) # 全部股票列表，顺序不变
+    for row in all_stock:
         code = row["code"]
         if code.startswith("688"):
             star.append(row)
@@ -327,7 +247,7 @@ def generate_html():
 
     # 6. 生成HTML，新增【全部个股】Tab
     print("🌍 生成HTML...")
-    html = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -402,126 +322,55 @@ def generate_html():
             <!-- 全部个股容器（默认显示） -->
             <div class="tab-content active" id="all">
     '''
-    # 填充全部个股卡片（完整原始自选顺序）
-    for r in all_stock:
-        code = r["code"]
-        stock_name = r["stock_name"]
-        img = img_map.get(code, "")
-        if not img:
-            continue
-        price = price_map.get(code, "")
-        rise_val = rise_map.get(code, 0)
-        price_str = f"({price}元)" if price else ""
-        rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-        rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-        # 取出#注释分类
-        tag_text = stock_tag_map.get(stock_name, "")
-        tag_html = f'<span style="color:#2f80ed; font-weight:bold;">{tag_text}</span>'
-        line_text = f"{tag_html} | {r['industry']} | {r['industry_detail']}"
-        html += f'''
-        <div class="card">
-            <div class="stock-title">{code} {stock_name}<span class="price">{price_str}</span>{rise_str}</div>
-            <div class="sub" style="color:red; font-weight:bold;">
-                5日涨幅: {r["rise_5"]:.2f}% ｜ 10日涨幅: {r["rise_10"]:.2f}% ｜ 15日涨幅: {r["rise_15"]:.2f}%
+    def iter_cards(rows):
+        for r in rows:
+            code = r["code"]
+            stock_name = r["stock_name"]
+            img = img_map.get(code, "")
+            if not img:
+                continue
+            price_rise = dashboard_html.price_rise_html(price_map.get(code, ""), rise_map.get(code, 0))
+            # 取出#注释分类
+            tag_text = stock_tag_map.get(stock_name, "")
+            tag_html = f'<span style="color:#2f80ed; font-weight:bold;">{tag_text}</span>'
+            line_text = f"{tag_html} | {r['industry']} | {r['industry_detail']}"
+            yield f'''
+            <div class="card">
+                <div class="stock-title">{code} {stock_name}{price_rise}</div>
+                <div class="sub" style="color:red; font-weight:bold;">
+                    5日涨幅: {r["rise_5"]:.2f}% ｜ 10日涨幅: {r["rise_10"]:.2f}% ｜ 15日涨幅: {r["rise_15"]:.2f}%
+                </div>
+                <div class="sub">{line_text}</div>
+                {dashboard_html.chart_html(img)}
             </div>
-            <div class="sub">{line_text}</div>
-            <img src="{img}">
-        </div>
-        '''
-    html += '''
+            '''
+
+    def iter_body():
+        # 填充全部个股卡片（完整原始自选顺序）
+        yield from iter_cards(all_stock)
+        yield '''
             </div>
 
             <!-- 主板容器 -->
             <div class="tab-content" id="main">
-    '''
-    # 填充主板卡片
-    for r in main_board:
-        code = r["code"]
-        stock_name = r["stock_name"]
-        img = img_map.get(code, "")
-        if not img:
-            continue
-        price = price_map.get(code, "")
-        rise_val = rise_map.get(code, 0)
-        price_str = f"({price}元)" if price else ""
-        rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-        rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-        tag_text = stock_tag_map.get(stock_name, "")
-        tag_html = f'<span style="color:#2f80ed; font-weight:bold;">{tag_text}</span>'
-        line_text = f"{tag_html} | {r['industry']} | {r['industry_detail']}"
-        html += f'''
-        <div class="card">
-            <div class="stock-title">{code} {stock_name}<span class="price">{price_str}</span>{rise_str}</div>
-            <div class="sub" style="color:red; font-weight:bold;">
-                5日涨幅: {r["rise_5"]:.2f}% ｜ 10日涨幅: {r["rise_10"]:.2f}% ｜ 15日涨幅: {r["rise_15"]:.2f}%
-            </div>
-            <div class="sub">{line_text}</div>
-            <img src="{img}">
-        </div>
         '''
-    html += '''
+        yield from iter_cards(main_board)
+        yield '''
             </div>
 
             <!-- 创业板容器 -->
             <div class="tab-content" id="cy">
-    '''
-    # 填充创业板卡片
-    for r in growth:
-        code = r["code"]
-        stock_name = r["stock_name"]
-        img = img_map.get(code, "")
-        if not img:
-            continue
-        price = price_map.get(code, "")
-        rise_val = rise_map.get(code, 0)
-        price_str = f"({price}元)" if price else ""
-        rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-        rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-        tag_text = stock_tag_map.get(stock_name, "")
-        tag_html = f'<span style="color:#2f80ed; font-weight:bold;">{tag_text}</span>'
-        line_text = f"{tag_html} | {r['industry']} | {r['industry_detail']}"
-        html += f'''
-        <div class="card">
-            <div class="stock-title">{code} {stock_name}<span class="price">{price_str}</span>{rise_str}</div>
-            <div class="sub" style="color:red; font-weight:bold;">
-                5日涨幅: {r["rise_5"]:.2f}% ｜ 10日涨幅: {r["rise_10"]:.2f}% ｜ 15日涨幅: {r["rise_15"]:.2f}%
-            </div>
-            <div class="sub">{line_text}</div>
-            <img src="{img}">
-        </div>
         '''
-    html += '''
+        yield from iter_cards(growth)
+        yield '''
             </div>
 
             <!-- 科创板容器 -->
             <div class="tab-content" id="kc">
-    '''
-    # 填充科创板卡片
-    for r in star:
-        code = r["code"]
-        stock_name = r["stock_name"]
-        img = img_map.get(code, "")
-        if not img:
-            continue
-        price = price_map.get(code, "")
-        rise_val = rise_map.get(code, 0)
-        price_str = f"({price}元)" if price else ""
-        rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-        rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-        tag_text = stock_tag_map.get(stock_name, "")
-        tag_html = f'<span style="color:#2f80ed; font-weight:bold;">{tag_text}</span>'
-        line_text = f"{tag_html} | {r['industry']} | {r['industry_detail']}"
-        html += f'''
-        <div class="card">
-            <div class="stock-title">{code} {stock_name}<span class="price">{price_str}</span>{rise_str}</div>
-            <div class="sub" style="color:red; font-weight:bold;">
-                5日涨幅: {r["rise_5"]:.2f}% ｜ 10日涨幅: {r["rise_10"]:.2f}% ｜ 15日涨幅: {r["rise_15"]:.2f}%
-            </div>
-            <div class="sub">{line_text}</div>
-            <img src="{img}">
-        </div>
         '''
-    html += '''
+        yield from iter_cards(star)
+
+    html_tail = '''
             </div>
         </div>
 
@@ -553,15 +402,14 @@ def generate_html():
         </script>
     </body></html>
     '''
-    # 填充板块数量占位符
-    html = html.replace("{all_cnt}", str(all_cnt))
-    html = html.replace("{main_cnt}", str(main_cnt))
-    html = html.replace("{growth_cnt}", str(growth_cnt))
-    html = html.replace("{star_cnt}", str(star_cnt))
-
-    filename = f"../html/{datetime.now().strftime('%Y-%m-%d')}_核心股票 K 线看板.html"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html)
+    # 填充板块数量占位符（只在页头里）
+    html_head = html_head.replace("{all_cnt}", str(all_cnt))
+    html_head = html_head.replace("{main_cnt}", str(main_cnt))
+    html_head = html_head.replace("{growth_cnt}", str(growth_cnt))
+    html_head = html_head.replace("{star_cnt}", str(star_cnt))
+
+    filename = os.path.join(html_dir, f"{datetime.now().strftime('%Y-%m-%d')}_核心股票 K 线看板.html")
+    dashboard_html.write_html(filename, html_head, iter_body(), dashboard_html.chart_script(img_map), html_tail)
     print(f"✅ 完成！文件已生成：{filename}")
 
 if __name__ == "__main__":
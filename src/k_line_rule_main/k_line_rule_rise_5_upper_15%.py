@@ -1,83 +1,20 @@
 from datetime import datetime
 
+import os
 import time
 import pandas as pd
-import mplfinance as mpf
-import matplotlib.pyplot as plt
 import warnings
-from io import BytesIO
-import base64
-from sqlalchemy import create_engine, text
-from concurrent.futures import ThreadPoolExecutor
 
-from src.utils import constants
-
-# ====================== 【只改这里】MySQL 配置 ======================
-MYSQL_HOST = constants.db_config['host']
-MYSQL_USER = constants.db_config['user']
-MYSQL_PASSWORD = constants.db_config['password']
-MYSQL_DB = constants.db_config['database']
-# ===================================================================
+from src.utils import db, kline_store, kline_chart, dashboard_html, screen_registry
 
 # -------------------- 屏蔽警告 + 加速配置 --------------------
 warnings.filterwarnings("ignore")
-plt.set_loglevel("error")
-plt.rcParams['figure.max_open_warning'] = 0
-plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 数据库引擎
-engine = create_engine(
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}?charset=utf8mb4"
-)
-
-
-# -------------------- A股风格：涨红跌绿 --------------------
-mc = mpf.make_marketcolors(
-    up='r',
-    down='g',
-    edge='inherit',
-    wick='inherit',
-    volume='inherit'
-)
-s_style = mpf.make_mpf_style(marketcolors=mc, gridstyle='')
-
-
-# -------------------- 极快绘图 --------------------
-def fast_plot(df):
-    try:
-        fig, ax = mpf.plot(
-            df, type="candle", volume=True, style=s_style,
-            figratio=(10, 5), figscale=0.7,
-            returnfig=True
-        )
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight", dpi=80)
-        buf.seek(0)
-        img = base64.b64encode(buf.read()).decode()
-        plt.close(fig)
-        return f"data:image/png;base64,{img}"
-    except:
-        return ""
-
-def process_one(code, df_k_all):
-    df = df_k_all[df_k_all["code"] == code].copy()
-    if len(df) < 5:
-        return code, ""
-    df.set_index("dt", inplace=True)
-    return code, fast_plot(df)
-
-# ======================================================================================
-# ✅【新增】5日涨幅 > 15% 股票策略 + HTML 生成（完全复用你的逻辑）
-# ======================================================================================
-def generate_rise5_html():
-    print("📥 加载 5日涨幅超15% 股票数据...")
 
-    # 1. 获取最新一天日期
-    last_dt = pd.read_sql("SELECT MAX(dt) AS dt FROM stock_detail", engine).iloc[0]["dt"]
+# 数据库引擎（进程级共享连接池）
+engine = db.get_engine()
 
-    # 2. 查询 rise_5 > 15% 股票 + 关联行业
-    sql = f"""
+# 选股 SQL，{last_dt} 为最新交易日（migrate.explain_check 也用它检查索引 / 分区裁剪）
+RISE_5_SQL = """
         SELECT
             s.code,
             s.stock_name,
@@ -90,13 +27,27 @@ def generate_rise5_html():
             dst.industry_detail
         FROM stock_detail s
         LEFT JOIN dim_stock_tag dst
-            ON REPLACE(REPLACE(LOWER(dst.code), 'sz', ''), 'sh', '') = s.code
+            ON dst.code = s.code
         WHERE s.dt = '{last_dt}'
           AND s.rise_5 >= 15
           AND s.code NOT LIKE '688%%'
           AND UPPER(s.stock_name) NOT LIKE '%%ST%%'
         ORDER BY s.rise_5 DESC
-    """
+"""
+
+
+# ======================================================================================
+# ✅【新增】5日涨幅 > 15% 股票策略 + HTML 生成（完全复用你的逻辑）
+# ======================================================================================
+@screen_registry.register("k_line_rule_rise_5_upper_15")
+def generate_rise5_html(html_dir=kline_chart.HTML_DIR):
+    print("📥 加载 5日涨幅超15% 股票数据...")
+
+    # 1. 获取最新一天日期
+    last_dt = kline_store.latest_dt()
+
+    # 2. 查询 rise_5 > 15% 股票 + 关联行业
+    sql = RISE_5_SQL.format(last_dt=last_dt)
     df = pd.read_sql(sql, engine)
     if df.empty:
         print("❌ 暂无 5日涨幅超15% 的股票")
@@ -104,23 +55,8 @@ def generate_rise5_html():
 
     # 3. 加载这些股票的K线
     codes = df["code"].unique().tolist()
-    ph = ",".join([f"'{c}'" for c in codes])
-    k_sql = f"""
-        SELECT dt, code,
-               price_open AS Open, price_close AS Close,
-               price_highest AS High, price_lowest AS Low,
-               trade_amount AS Volume, rise
-        FROM stock_detail
-        WHERE code IN ({ph})
-        ORDER BY code, dt
-    """
-    df_k = pd.read_sql(k_sql, engine)
-    df_k["dt"] = pd.to_datetime(df_k["dt"])
-
     # 保留最近3个月K线
-    end_dt = df_k["dt"].max()
-    start_dt = end_dt - pd.DateOffset(months=3)
-    df_k = df_k[df_k["dt"] >= start_dt].copy()
+    df_k = kline_store.load_recent_kline(codes, months=3)
 
     # 平盘K线变红
     df_k.loc[df_k["Close"] == df_k["Open"], "Close"] += 0.0001
@@ -130,21 +66,9 @@ def generate_rise5_html():
     price_map = last_df["Close"].round(2).to_dict()
     rise_map = last_df["rise"].round(2).to_dict()
 
-    # 4. 多线程绘图
+    # 4. 多进程绘图
     print("🖼️ 开始绘制K线...")
-    img_map = {}
-
-    def plot_one(code):
-        d = df_k[df_k["code"] == code].copy()
-        if len(d) < 5:
-            return code, ""
-        d.set_index("dt", inplace=True)
-        return code, fast_plot(d)
-
-    with ThreadPoolExecutor(max_workers=6) as executor:
-        res = list(executor.map(plot_one, codes))
-    for c, i in res:
-        img_map[c] = i
+    img_map = kline_chart.render_charts(df_k, codes, html_dir=html_dir)
 
     # 5. 按行业分组（按股票数从多到少）
     df["industry"] = df["industry"].fillna("未分类")
@@ -153,7 +77,7 @@ def generate_rise5_html():
 
     # 6. 生成HTML（完全沿用你的样式）
     print("🌍 生成HTML...")
-    html = '''
+    html_head = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -219,45 +143,41 @@ def generate_rise5_html():
                 <div class="tabs">
     '''
 
-    # 行业TAB
-    for i, ind in enumerate(industries):
-        active = "active" if i == 0 else ""
-        html += f'<button class="tab {active}" onclick="setTab({i})">{ind}({ind_cnt[ind]})</button>'
-    html += '</div></div>'
-
-    # 行业卡片
-    for i, ind in enumerate(industries):
-        active = "active" if i == 0 else ""
-        html += f'<div class="tab-content {active}">'
-        sub_df = df[df["industry"] == ind]
-        for _, r in sub_df.iterrows():
-            code = r["code"]
-            img = img_map.get(code, "")
-            if not img:
-                continue
-
-            price = price_map.get(code, "")
-            rise_val = rise_map.get(code, 0)
-            rise5_val = round(r["rise_5"], 2)
-
-            price_str = f"({price}元)" if price else ""
-            rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
-            rise_str = f'<span class="{rise_cls}">{rise_val:+.2f}%</span>'
-
-            # ====================== ✅ 这里已强化：显示 5/10/15 日涨幅，全部红色 ======================
-            html += f'''
-            <div class="card">
-                <div class="stock-title">{code} {r["stock_name"]}<span class="price">{price_str}</span>{rise_str}</div>
-                <div class="sub" style="color:red; font-weight:bold;">
-                    5日涨幅: {r["rise_5"]:.2f}% ｜ 10日涨幅: {r["rise_10"]:.2f}% ｜ 15日涨幅: {r["rise_15"]:.2f}%
+    industry_rows = dashboard_html.group_records(df, "industry")
+
+    def iter_cards():
+        # 行业TAB
+        for i, ind in enumerate(industries):
+            active = "active" if i == 0 else ""
+            yield f'<button class="tab {active}" onclick="setTab({i})">{ind}({ind_cnt[ind]})</button>'
+        yield '</div></div>'
+
+        # 行业卡片
+        for i, ind in enumerate(industries):
+            active = "active" if i == 0 else ""
+            yield f'<div class="tab-content {active}">'
+            for r in industry_rows.get(ind, []):
+                code = r["code"]
+                img = img_map.get(code, "")
+                if not img:
+                    continue
+
+                price_rise = dashboard_html.price_rise_html(price_map.get(code, ""), rise_map.get(code, 0))
+
+                # ====================== ✅ 这里已强化：显示 5/10/15 日涨幅，全部红色 ======================
+                yield f'''
+                <div class="card">
+                    <div class="stock-title">{code} {r["stock_name"]}{price_rise}</div>
+                    <div class="sub" style="color:red; font-weight:bold;">
+                        5日涨幅: {r["rise_5"]:.2f}% ｜ 10日涨幅: {r["rise_10"]:.2f}% ｜ 15日涨幅: {r["rise_15"]:.2f}%
+                    </div>
+                    <div class="sub">{r["industry_detail"]}</div>
+                    {dashboard_html.chart_html(img)}
                 </div>
-                <div class="sub">{r["industry_detail"]}</div>
-                <img src="{img}">
-            </div>
-            '''
-        html += "</div>"
+                '''
+            yield "</div>"
 
-    html += '''
+    html_tail = '''
         <script>
             function changeColumns(col) {
                 let grids = document.querySelectorAll('.tab-content');
@@ -278,9 +198,8 @@ def generate_rise5_html():
     </body></html>
     '''
 
-    filename = f"../html/{datetime.now().strftime('%Y-%m-%d')}_5日涨幅超15%股票.html"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(html)
+    filename = os.path.join(html_dir, f"{datetime.now().strftime('%Y-%m-%d')}_5日涨幅超15%股票.html")
+    dashboard_html.write_html(filename, html_head, iter_cards(), dashboard_html.chart_script(img_map), html_tail)
     print(f"✅ 完成！文件已生成：{filename}")
 
 if __name__ == "__main__":
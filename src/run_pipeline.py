@@ -0,0 +1,110 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 04:20
+@Desc    : 收盘后流水线
+           原来按「导入 xlsx → stock_detail → dim_stock_tag → 连涨 / 连跌规则表 → 各看板 → 飞书通知」手工逐个执行；
+           现在由 utils/dag.py 按依赖调度：stock_detail 与 dim_stock_tag 都只依赖 xlsx，同时导入；
+           连涨 / 连跌特征表在 stock_detail 之后计算，与不依赖规则表的看板并行；
+           看板之间互斥执行（共用绘图进程池），重建同一张规则表的看板另外按表加锁，互不阻塞上下游；xlsx 没变、代码没变、上游没重跑的任务直接跳过
+           运行状态与每个任务的耗时记录在 data/pipeline（state.json / runs.jsonl）
+用法（在仓库根目录执行）：
+    python -m src.run_pipeline              增量执行（输入没变的任务跳过）
+    python -m src.run_pipeline force        全部重跑
+    python -m src.run_pipeline <xlsx 路径>   指定当日行情 xlsx
+"""
+import os
+import sys
+from datetime import datetime
+
+from src import run_screens
+from src.etl import bulk_loader, insert_mysql_stock_detail, streak_rules
+from src.utils import constants, dag, kline_store
+
+STATE_PATH = os.path.join(constants.pipeline_dir, "state.json")
+
+
+def _import_task(func, xlsx_path, dt):
+    def task():
+        if not os.path.exists(xlsx_path):
+            raise FileNotFoundError(f"找不到当日行情文件：{xlsx_path}")
+        func(xlsx_path, dt, constants.db_config)
+    return task
+
+
+def _streak_features_task(engine):
+    # 只在 stock_detail 重跑后才会执行（输入没变时 dag 直接跳过），当天数据可能已被修正，强制重算
+    def task():
+        with engine.connect() as conn:
+            streak_rules.refresh_features(conn, kline_store.latest_dt(), force=True)
+    return task
+
+
+def _screen_task(name, screen, engine):
+    # 依赖规则表的看板排在 streak_features 之后（失败时看板被 BLOCKED），特征表已是最新，不再逐个看板检查签名
+    def task():
+        cost, ok = run_screens.run_screen(name, screen, kline_store.latest_dt(), engine, refresh=False)
+        if not ok:
+            raise RuntimeError(f"{name} 生成失败")
+    return task
+
+
+def _screen_inputs(screen):
+    """看板的输入：最新交易日 + 看板脚本本身（改了代码要重新生成）"""
+    module_file = sys.modules[screen["func"].__module__].__file__
+    return lambda: [kline_store.latest_dt(), dag.file_signature(module_file)]
+
+
+def _notice(results):
+    from src.utils import feishu
+
+    screen_results = {n[len("screen:"):]: r["status"] for n, r in results.items() if n.startswith("screen:")}
+    failed = [n for n, status in screen_results.items() if status in (dag.FAILED, dag.BLOCKED)]
+    msg = f"交易日 {kline_store.latest_dt()}：{len(screen_results) - len(failed)}/{len(screen_results)} 个看板已生成"
+    if failed:
+        msg += f"\n失败：{', '.join(failed)}"
+    if not feishu.send_message("收盘看板更新", msg):
+        raise RuntimeError("飞书通知发送失败")
+
+
+def build_tasks(xlsx_path=None, dt=None, engine=None):
+    """组装当日流水线的任务声明"""
+    xlsx_path = xlsx_path or constants.eod_xlsx_path
+    dt = dt or datetime.now().strftime("%Y-%m-%d")
+    engine = engine or bulk_loader.create_bulk_engine()
+    xlsx_inputs = lambda: [dt, dag.file_signature(xlsx_path)]
+
+    tasks = {
+        # 入库后同步本地 K 线存储、日频特征存储，并评估各看板历史入选表现（见 insert_mysql_stock_detail）
+        "stock_detail": {"func": _import_task(insert_mysql_stock_detail.import_xls_to_stock_detail_tmp, xlsx_path, dt),
+                         "deps": [], "inputs": xlsx_inputs},
+        "dim_stock_tag": {"func": _import_task(insert_mysql_stock_detail.import_xls_to_dim_stock_tag, xlsx_path, dt),
+                          "deps": [], "inputs": xlsx_inputs},
+        "streak_features": {"func": _streak_features_task(engine), "deps": ["stock_detail"],
+                            "inputs": lambda: [kline_store.latest_dt()]},
+    }
+
+    screens = run_screens.load_screens()
+    for name, screen in screens.items():
+        deps = ["stock_detail", "dim_stock_tag"]
+        if screen["rules"]:
+            deps.append("streak_features")
+        # 共用同一张规则表（参数不同）的看板按表加锁，避免规则表被对方覆盖；
+        # 用锁而不是依赖，一个看板失败不会连带阻塞另一个
+        locks = ["render"] + [f"table:{table}" for table in screen["rules"]]
+        tasks[f"screen:{name}"] = {"func": _screen_task(name, screen, engine), "deps": deps,
+                                   "inputs": _screen_inputs(screen), "lock": locks}
+
+    tasks["feishu_notice"] = {"func": _notice, "deps": [f"screen:{n}" for n in screens],
+                              "inputs": lambda: [kline_store.latest_dt()],
+                              "allow_failed_deps": True, "pass_results": True}
+    return tasks
+
+
+def run(xlsx_path=None, force=False):
+    return dag.run(build_tasks(xlsx_path), STATE_PATH, force=force)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    run(next((a for a in args if a != "force"), None), force="force" in args)
@@ -0,0 +1,126 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 03:30
+@Desc    : 每日看板统一调度（单进程）
+           原来每晚依次运行十几个看板脚本，每个脚本都单独起一个 Python 进程、导入 pandas / matplotlib / mplfinance，
+           各自查一遍最新交易日、读一遍同一段 K 线；现在一个进程导入全部看板模块（@screen_registry.register 完成注册），
+           K 线快照只读一次，连涨 / 连跌特征表在后台线程里计算、与不依赖规则表的看板同时进行，
+           依赖规则表的看板在生成前重建自己的规则表（只是对特征表的过滤），K 线图共用同一个常驻进程池和图片缓存；
+           看板本身仍逐个生成、没有并发：各看板剩下的工作是 pandas 计算（持有 GIL，线程并发几乎没有收益），
+           画图已经在共享进程池里并行，多个看板同时提交只会互相抢同一批 worker；
+           共用规则表的看板（如 stock_2days_up / stock_2days_up_options）也必须先后执行；
+           输出目录通过 html_dir 参数显式传给各看板，不再切换工作目录（run_pipeline.py 按 DAG 调度时同样适用）
+用法（在仓库根目录执行）：
+    python -m src.run_screens                                  全部看板
+    python -m src.run_screens k_line_M_style stock_2days_up    只跑指定看板
+"""
+import importlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.etl import bulk_loader, streak_rules
+from src.utils import constants, kline_store, screen_registry
+
+# 参与调度的看板模块（导入即注册）；k_line_custom_stock_list 的股票列表需手工维护，不参与每日调度
+SCREEN_MODULES = [
+    "src.k_line_rule.k_line_2days_up_html",
+    "src.k_line_rule.k_line_2days_up_html_options",
+    "src.k_line_rule.k_line_3days_up_html",
+    "src.k_line_rule.k_line_3days_down_html",
+    "src.k_line_rule.k_line_rule_stock_hot_top100",
+    "src.k_line_rule_main.k_line_1days_up_html_options",
+    "src.k_line_rule_main.k_line_1days_down_html",
+    "src.k_line_rule_main.k_line_M_style",
+    "src.k_line_rule_main.k_line_N_style",
+    "src.k_line_rule_main.k_line_rule_core",
+    "src.k_line_rule_main.k_line_rule_rise_5_upper_15%",
+    "src.k_line_rule_main.k_line_rule_rise_one_day_bs",
+    "src.k_line_rule_douyin_作手老严.k_line_rule_3_times",
+]
+
+
+def load_screens():
+    for module in SCREEN_MODULES:
+        importlib.import_module(module)
+    return screen_registry.SCREENS
+
+
+def _refresh_features(engine, today):
+    with engine.connect() as conn:
+        streak_rules.refresh_features(conn, today)
+
+
+def run_screen(name, screen, today, engine, html_dir=constants.html_dir, refresh=True):
+    """
+    生成单个看板：先重建依赖的规则表，再调用生成函数
+    :param html_dir: 看板 HTML（及 asset 图片）的输出目录，显式传给生成函数，不依赖当前工作目录
+    :param refresh: 重建规则表前是否检查 / 重算特征表，调用方已刷新过当天特征表时传 False
+    :return: (耗时秒数, 是否成功)
+    """
+    start = time.time()
+    try:
+        print(f"\n▶️  {name}")
+        if screen["rules"]:
+            streak_rules.run_rules(today, screen["rules"], engine=engine, screen=name, refresh=refresh)
+        os.makedirs(html_dir, exist_ok=True)
+        screen["func"](**screen_registry.resolve_params(screen["params"], today), html_dir=html_dir)
+        ok = True
+    except Exception as e:
+        print(f"❌ {name} 生成失败：{str(e)[:200]}")
+        ok = False
+    return time.time() - start, ok
+
+
+def run(names=None, engine=None):
+    """
+    :param names: 只跑这些看板，默认全部已注册的看板
+    :return: {看板标识: (耗时秒数, 是否成功)}
+    """
+    start = time.time()
+    screens = load_screens()
+    names = list(names or screens)
+    unknown = [n for n in names if n not in screens]
+    if unknown:
+        raise ValueError(f"未注册的看板：{unknown}，可选：{list(screens)}")
+
+    today = kline_store.latest_dt()
+    if today is None:
+        print(f"❌ 本地 K 线存储为空（{constants.kline_store_dir}），请先导入 stock_detail 或执行 utils/kline_store.py 回填")
+        return {}
+    months = max(screens[n]["kline_months"] for n in names)
+    kline_store.preload(kline_store.months_before(today, months))
+    engine = engine or bulk_loader.create_bulk_engine()
+
+    # 不依赖规则表的看板先跑，同时后台线程计算当天的连涨 / 连跌特征表
+    independent = [n for n in names if not screens[n]["rules"]]
+    dependent = [n for n in names if screens[n]["rules"]]
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            feature_future = pool.submit(_refresh_features, engine, today) if dependent else None
+            for name in independent:
+                results[name] = run_screen(name, screens[name], today, engine)
+            refresh = False
+            if feature_future is not None:
+                try:
+                    feature_future.result()
+                except Exception as e:
+                    # 各规则看板的 run_rules 再尝试计算一次（第一个算成功后，其余看板按签名复用）
+                    print(f"⚠️  连涨 / 连跌特征表计算失败：{str(e)[:200]}")
+                    refresh = True
+            for name in dependent:
+                results[name] = run_screen(name, screens[name], today, engine, refresh=refresh)
+    finally:
+        kline_store.release()
+
+    print(f"\n📊 看板调度完成（{today}），总耗时 {time.time() - start:.2f}s：")
+    for name, (cost, ok) in sorted(results.items(), key=lambda kv: -kv[1][0]):
+        print(f"  {'✅' if ok else '❌'} {name:<32} {cost:6.2f}s")
+    return results
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:] or None)
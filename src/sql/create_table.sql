@@ -1,8 +1,10 @@
--- 股票行业维表
+-- 股票行业维表（code 为 6 位纯数字代码，与 stock_detail.code 直接等值关联）
 CREATE TABLE `dim_stock_tag` (
-  `code` varchar(20) DEFAULT NULL COMMENT '股票代码',
+  `code` varchar(6) NOT NULL COMMENT '股票代码（6 位数字）',
+  `exchange` varchar(2) DEFAULT NULL COMMENT '交易所 SH/SZ/BJ',
   `industry` varchar(100) DEFAULT NULL COMMENT '所属行业',
-  `industry_detail` varchar(100) DEFAULT NULL COMMENT '细分行业'
+  `industry_detail` varchar(100) DEFAULT NULL COMMENT '细分行业',
+  PRIMARY KEY (`code`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- 板块详情表（日级别收盘后）
@@ -198,4 +200,17 @@ from (
     from stock_detail
     where dt='2026-06-03' and stock_name not like '%ST%'
 ) b on stock_code=code
-order by seq;
\ No newline at end of file
+order by seq;
+
+
+
+-- ====================== 结构变更 ======================
+-- 之后的表结构变更统一放在 sql/migrations（V<版本号>__<说明>.sql / .py），由 etl/migrate.py 按版本执行并记录到 schema_migrations：
+--   V001 dim_stock_tag 代码规范化（code=6 位数字 + exchange，code 主键）
+--   V002 stock_detail：dt 改 DATE，主键 (code, dt)，索引 (dt, code)，按月 RANGE COLUMNS(dt) 分区
+--   V003 stock_streak_feature：连涨 / 连跌规则共享特征表（etl/streak_rules.py 每个交易日计算一次）
+--   V004 screen_pick / screen_pick_eval：各看板每日入选记录及后续 1/3/5/10 日收益、回撤（etl/screen_eval.py）
+--   V005 stock_detail_data_delta：盘中快照增量存储，只写有变化的股票 + 定期关键帧（etl/snapshot_store.py）
+--   V006 stock_streak_feature 增加 src_signature：按特征窗口数据签名判断特征是否需要重算
+--   V007 screen_pick_eval 增加 entry_dt（停牌顺延买入 / 无法评估），max_drawdown_10d 改为峰谷回撤
+-- 执行：python -m src.etl.migrate（已手工执行过某些变更的库先 python -m src.etl.migrate baseline <版本号>）
@@ -43,7 +43,7 @@ final_result as (
         dst.industry_detail
     from step3 s3
     left join dim_stock_tag dst
-        on s3.code = replace(replace(lower(dst.code), 'sz', ''), 'sh', '')
+        on s3.code = dst.code
 )
 select * from final_result
 order by number_of_consecutive_days desc;
\ No newline at end of file
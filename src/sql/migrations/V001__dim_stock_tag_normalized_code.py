@@ -0,0 +1,34 @@
+"""
+dim_stock_tag 代码规范化：SZ000001 / 000001.SZ → code=000001 + exchange=SZ，code 设为主键
+（与 create_table.sql 中的同名变更一致；已手工执行过的库用 migrate baseline 1 跳过）
+"""
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    has_exchange = conn.execute(text(
+        "select count(*) from information_schema.columns "
+        "where table_schema = database() and table_name = 'dim_stock_tag' and column_name = 'exchange'"
+    )).scalar()
+    if not has_exchange:
+        conn.execute(text(
+            "alter table dim_stock_tag add exchange varchar(2) default null comment '交易所 SH/SZ/BJ' after code"
+        ))
+
+    conn.execute(text(
+        "update dim_stock_tag set exchange = upper(left(code, 2)), code = right(code, 6) "
+        "where code regexp '^[A-Za-z]{2}[0-9]{6}$'"
+    ))
+    conn.execute(text(
+        "update dim_stock_tag set exchange = upper(right(code, 2)), code = left(code, 6) "
+        "where code regexp '^[0-9]{6}[.][A-Za-z]{2}$'"
+    ))
+    conn.execute(text("delete from dim_stock_tag where code is null or code not regexp '^[0-9]{6}$'"))
+
+    has_pk = conn.execute(text(
+        "select count(*) from information_schema.table_constraints "
+        "where table_schema = database() and table_name = 'dim_stock_tag' and constraint_type = 'PRIMARY KEY'"
+    )).scalar()
+    if not has_pk:
+        conn.execute(text("alter table dim_stock_tag modify code varchar(6) not null comment '股票代码（6 位数字）'"))
+        conn.execute(text("alter table dim_stock_tag add primary key (code)"))
@@ -0,0 +1,88 @@
+"""
+stock_detail 重建：
+1. dt 由 varchar(10) 改为 DATE，code 非空
+2. 主键 (code, dt)：个股 K 线按 code + dt 范围读取，聚簇顺序即 order by code, dt
+3. 二级索引 (dt, code)：单日 / 区间截面筛选
+4. 按月 RANGE COLUMNS(dt) 分区：按日期过滤时只扫描命中的月份
+导入前先检查：dt / code 为空、dt 无法转成日期、(code, 日期) 重复的行数，任一不为 0 直接中止（需先人工清理），
+检查通过后整表导入（普通 insert，出错即中止，不会静默丢行），再原子 rename，原表保留为 stock_detail_bak_v002
+"""
+from datetime import date
+
+from sqlalchemy import text
+
+from src.etl import migrate
+
+COLUMNS = [
+    'dt', 'code', 'stock_name', 'price_open', 'price_close', 'price_highest', 'price_lowest',
+    'trade', 'trade_amount', 'amplitude', 'rise', 'amount_increase_decrease', 'turnover_rate',
+    'rise_5', 'rise_10', 'rise_15',
+    'total_market_capitalization', 'trading_market_capitalization', 'ratio'
+]
+
+CREATE_SQL = """
+CREATE TABLE `stock_detail_new` (
+  `dt` date NOT NULL COMMENT '交易日',
+  `code` varchar(6) NOT NULL COMMENT '股票代码',
+  `stock_name` varchar(100) DEFAULT NULL COMMENT '股票名称',
+  `price_open` double DEFAULT NULL COMMENT '开盘价',
+  `price_close` double DEFAULT NULL COMMENT '收盘价',
+  `price_highest` double DEFAULT NULL COMMENT '最高价',
+  `price_lowest` double DEFAULT NULL COMMENT '最低价',
+  `trade` double DEFAULT NULL COMMENT '成交量(总手)',
+  `trade_amount` double DEFAULT NULL COMMENT '成交额',
+  `amplitude` double DEFAULT NULL COMMENT '振幅',
+  `rise` double DEFAULT NULL COMMENT '收盘涨幅',
+  `amount_increase_decrease` double DEFAULT NULL COMMENT '涨跌额',
+  `turnover_rate` double DEFAULT NULL COMMENT '换手率',
+  `rise_5` double DEFAULT NULL COMMENT '5日涨幅',
+  `rise_10` double DEFAULT NULL COMMENT '10日涨幅',
+  `rise_15` double DEFAULT NULL COMMENT '15日涨幅',
+  `total_market_capitalization` bigint DEFAULT 0 COMMENT '总市值',
+  `trading_market_capitalization` bigint DEFAULT 0 COMMENT '流动市值',
+  `ratio` double DEFAULT NULL COMMENT '量比',
+  PRIMARY KEY (`code`, `dt`),
+  KEY `idx_dt_code` (`dt`, `code`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+PARTITION BY RANGE COLUMNS(`dt`) (
+    {partitions}
+)
+"""
+
+
+# 导入前的数据检查：(说明, 统计 SQL)，结果必须为 0
+PRECHECKS = [
+    ("dt / code 为空", "select count(*) from stock_detail where dt is null or code is null"),
+    ("dt 无法转成日期", "select count(*) from stock_detail where dt is not null and cast(dt as date) is null"),
+    ("(code, dt) 重复",
+     "select count(*) from (select code, cast(dt as date) as d from stock_detail "
+     "where dt is not null and code is not null group by code, d having count(*) > 1) t"),
+]
+
+
+def precheck(conn):
+    """新主键 (code, dt) 放不下的行：有任何一类不为 0 就中止迁移，不做静默转换或去重"""
+    problems = []
+    for title, sql in PRECHECKS:
+        n = conn.execute(text(sql)).scalar()
+        if n:
+            problems.append(f"{title}：{n}")
+    if problems:
+        raise RuntimeError(f"stock_detail 数据检查未通过（{'；'.join(problems)}），请先清理后再执行迁移")
+
+
+def upgrade(conn):
+    precheck(conn)
+    min_dt = conn.execute(text("select min(dt) from stock_detail where dt is not null")).scalar()
+    first_month = migrate.month_start(date.fromisoformat(str(min_dt)[:10])) if min_dt else migrate.month_start(date.today())
+    last_month = migrate.add_months(migrate.month_start(date.today()), migrate.PARTITION_MONTHS_AHEAD)
+
+    conn.execute(text("drop table if exists stock_detail_new"))
+    conn.execute(text(CREATE_SQL.format(partitions=migrate.partition_clause(first_month, last_month))))
+
+    cols = ", ".join(f"`{c}`" for c in COLUMNS)
+    select_cols = ", ".join("cast(dt as date)" if c == 'dt' else f"`{c}`" for c in COLUMNS)
+    conn.execute(text(
+        f"insert into stock_detail_new ({cols}) select {select_cols} from stock_detail"
+    ))
+    conn.execute(text("rename table stock_detail to stock_detail_bak_v002, stock_detail_new to stock_detail"))
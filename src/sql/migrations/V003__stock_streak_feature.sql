@@ -0,0 +1,21 @@
+-- 连涨 / 连跌规则共享特征表（见 src/etl/streak_rules.py）
+create table if not exists stock_streak_feature (
+    dt date not null comment '交易日',
+    code varchar(6) not null comment '股票代码',
+    stock_name varchar(100) comment '股票名称',
+    price_open double comment '当日开盘价',
+    price_close double comment '当日收盘价',
+    up_days int comment '截至当日连续收阳天数（收盘 >= 开盘），当日收阴为 0',
+    down_days int comment '截至当日连续收阴天数（收盘 < 开盘），当日收阳为 0',
+    bars int comment '特征窗口内有效 K 线根数',
+    close_5 double comment '倒数第 5 根 K 线收盘价（含当日）',
+    close_10 double comment '倒数第 10 根 K 线收盘价（含当日）',
+    close_20 double comment '倒数第 20 根 K 线收盘价（含当日）',
+    rise_5d double comment '近 5 根 K 线涨幅，当日收盘 / close_5 - 1',
+    rise_10d double comment '近 10 根 K 线涨幅，当日收盘 / close_10 - 1',
+    rise_20d double comment '近 20 根 K 线涨幅，当日收盘 / close_20 - 1',
+    total_market_capitalization bigint comment '当日总市值',
+    trading_market_capitalization bigint comment '当日流动市值',
+    updated_at datetime comment '计算时间',
+    primary key (dt, code)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
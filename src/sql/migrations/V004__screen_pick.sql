@@ -0,0 +1,26 @@
+-- 各看板每日入选记录及其后续表现（见 src/etl/screen_eval.py）
+create table if not exists screen_pick (
+    dt date not null comment '入选交易日',
+    screen varchar(64) not null comment '看板 / 规则标识',
+    code varchar(6) not null comment '股票代码',
+    stock_name varchar(100) comment '股票名称',
+    created_at datetime comment '记录时间',
+    primary key (screen, dt, code),
+    key idx_dt (dt)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+create table if not exists screen_pick_eval (
+    dt date not null comment '入选交易日',
+    screen varchar(64) not null comment '看板 / 规则标识',
+    code varchar(6) not null comment '股票代码',
+    price_close double comment '入选日收盘价（买入价）',
+    ret_1d double comment '持有 1 个交易日收益（小数）',
+    ret_3d double comment '持有 3 个交易日收益（小数）',
+    ret_5d double comment '持有 5 个交易日收益（小数）',
+    ret_10d double comment '持有 10 个交易日收益（小数）',
+    max_drawdown_10d double comment '入选后 10 个交易日内最低价相对买入价的最大回撤（<= 0）',
+    bars_after int comment '入选后已有的 K 线根数，达到 10 后不再重算',
+    updated_at datetime comment '计算时间',
+    primary key (screen, dt, code),
+    key idx_dt (dt)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,50 @@
+-- 盘中快照增量存储（见 src/etl/snapshot_store.py）：每轮只写相对上一轮有字段变化的股票，
+-- 每隔一段时间写一轮全市场关键帧（is_keyframe = 1），任意时刻的全市场状态 = 最近关键帧之后每只股票的最后一行
+create table if not exists stock_detail_data_delta (
+    dt date not null comment '交易日',
+    ts datetime not null comment '轮询时刻',
+    f12 varchar(6) not null comment '股票代码',
+    is_keyframe tinyint not null default 0 comment '1 = 关键帧（全市场完整快照）',
+    f1 double comment '小数位数',
+    f2 double comment '最新价',
+    f3 double comment '涨跌幅（%）',
+    f5 double comment '成交量（手）',
+    f6 double comment '成交额',
+    f8 double comment '换手率（%）',
+    f9 double comment '市盈率（动态）',
+    f10 double comment '量比',
+    f13 double comment '市场（0 深 / 1 沪）',
+    f14 varchar(100) comment '股票名称',
+    f20 double comment '总市值',
+    f21 double comment '流通市值',
+    f62 double comment '主力净流入',
+    f63 double,
+    f64 double,
+    f65 double,
+    f66 double,
+    f67 double,
+    f68 double,
+    f69 double,
+    f70 double,
+    f71 double,
+    f72 double,
+    f73 double,
+    f74 double,
+    f75 double,
+    f76 double,
+    f77 double,
+    f78 double,
+    f79 double,
+    f80 double,
+    f81 double,
+    f82 double,
+    f83 double,
+    f84 double,
+    f85 double,
+    f86 double,
+    f87 double,
+    f184 double comment '主力净占比（%）',
+    primary key (dt, ts, f12),
+    key idx_code_ts (f12, ts),
+    key idx_keyframe (dt, is_keyframe, ts)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,4 @@
+-- stock_streak_feature 记录计算时 stock_detail 特征窗口的数据签名（见 src/etl/streak_rules.py）
+-- 同一天重新导入修正后的行情时行数不变，按签名判断特征是否需要重算，不再按行数判断
+alter table stock_streak_feature
+    add column src_signature varchar(64) comment '计算时 stock_detail 特征窗口的数据签名（行数:crc32 之和）' after trading_market_capitalization;
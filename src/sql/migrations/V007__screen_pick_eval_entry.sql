@@ -0,0 +1,9 @@
+-- screen_pick_eval 记录实际买入日（见 src/etl/screen_eval.py）：入选日停牌的从复牌后第一根 K 线买入，
+-- 长期停牌 / 退市无法评估的记录 entry_dt 为空、不再重查；max_drawdown_10d 改为真正的峰谷回撤
+alter table screen_pick_eval
+    add column entry_dt date comment '实际买入日（入选日停牌时为之后第一个有行情的交易日），为空表示无法评估' after code,
+    modify column price_close double comment '买入日收盘价（买入价）',
+    modify column max_drawdown_10d double comment '买入后 10 个交易日内的最大回撤：最低价相对此前最高点（含买入价）的最大跌幅（<= 0）';
+
+-- 旧结果的回撤口径不同，清空后由 screen_eval.evaluate 按新口径全部重算（screen_pick 入选记录保留）
+delete from screen_pick_eval;
@@ -0,0 +1,108 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 21:30
+@Desc    : K 线图内容寻址磁盘缓存
+           key = hash(code, 窗口内 dt + OHLCV 原始字节, 绘图样式参数)，同一只股票同一天在
+           不同看板 / 重复运行时直接命中，不再重新绘图；容量超限按最近使用时间（mtime）淘汰
+"""
+import hashlib
+import os
+
+from src.utils import constants
+
+CACHE_DIR = constants.chart_cache_dir
+MAX_BYTES = constants.chart_cache_max_mb * 1024 * 1024
+
+# 淘汰时一次清到上限的 90%，避免每次写入都触发扫描删除
+_LOW_WATER = 0.9
+
+
+def make_key(code, *arrays, style_key=""):
+    """
+    计算缓存 key
+    :param code: 股票代码
+    :param arrays: 参与绘图的 numpy 数组（dt、OHLCV），按原始字节参与哈希
+    :param style_key: 样式 / 尺寸 / dpi 等绘图参数拼成的字符串，样式变化时自动失效
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str(code).encode())
+    h.update(style_key.encode())
+    for arr in arrays:
+        h.update(str(arr.dtype).encode())
+        h.update(str(arr.shape).encode())
+        h.update(arr.tobytes())
+    return h.hexdigest()
+
+
+def _path(key):
+    # 两级目录，避免单目录下文件过多
+    return os.path.join(CACHE_DIR, key[:2], key + ".png")
+
+
+def get(key):
+    """命中返回 PNG 字节，并刷新 mtime 作为最近使用时间；未命中返回 None"""
+    path = _path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    return data
+
+
+def put(key, data):
+    """写入缓存（先写临时文件再原子替换，多个看板同时运行也不会读到半张图）"""
+    if not data:
+        return
+    path = _path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def evict(max_bytes=None):
+    """
+    总大小超过 max_bytes 时按 mtime 从旧到新删除，直到降到上限的 90%
+    :return: 删除的文件数
+    """
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+
+    entries = []
+    total = 0
+    for sub in os.scandir(CACHE_DIR):
+        if not sub.is_dir():
+            continue
+        for entry in os.scandir(sub.path):
+            if not entry.name.endswith(".png"):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+
+    removed = 0
+    target = max_bytes * _LOW_WATER
+    for _, size, path in sorted(entries):
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
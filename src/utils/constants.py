@@ -1,3 +1,5 @@
+import os
+
 # win10 i7 12700F mysql 连接信息
 db_config = {
     'host': '127.0.0.1',
@@ -6,4 +8,34 @@ db_config = {
     'password': '000000',
     'database': 'stock',
     'charset': 'utf8mb4'
-}
\ No newline at end of file
+}
+
+# 本地列式 K 线存储目录（Parquet，按月分区），由 etl/insert_mysql_stock_detail.py 同步
+kline_store_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'kline_store')
+
+# 日频技术特征存储目录（MA / 量均 / N 日涨幅 / 连涨连跌 / ATR，Parquet 按月分区），由 utils/feature_store.py 每日增量更新
+feature_store_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'feature_store')
+
+# 回测结果输出目录（逐日入选明细 + 按日汇总 CSV），由 src/backtest 写出
+backtest_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'backtest')
+
+# 收盘后流水线（run_pipeline.py）：同花顺导出的当日行情 xlsx 路径、运行状态与耗时记录目录
+eod_xlsx_path = 'C:\\Users\\HR\\Desktop\\工作簿1.xlsx'
+pipeline_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'pipeline')
+
+# 盘中分钟 K 线存储目录（1 / 5 / 15 分钟 OHLCV，每个交易日一个 Parquet 文件），由 utils/minute_bars.py 在盘中轮询时增量生成
+minute_bar_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'minute_bars')
+
+# 各看板 HTML 的输出目录（src/html，原来各脚本在自己目录下运行、写到 ../html），K 线图片资源放在其下 assets/<日期>/
+html_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'html')
+
+# K 线图磁盘缓存目录及容量上限（MB），超过上限按最近使用时间淘汰
+chart_cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'data', 'chart_cache')
+chart_cache_max_mb = 1024
+
+# 看板 K 线图输出方式：inline 以 base64 内嵌进 HTML（默认，单文件自包含、可直接转发）；
+# asset 写成 html/assets/<日期>/ 下的独立图片文件（懒加载，同一天各看板共用，HTML 不能单独转发）；
+# canvas 只输出 OHLCV 数据，由浏览器绘制（生成最快、文件最小）
+chart_output_mode = 'inline'
+# asset 模式图片目录保留天数：更早、且已没有任何看板 HTML 引用的日期目录在生成看板时清理
+chart_asset_keep_days = 7
@@ -0,0 +1,196 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 04:00
+@Desc    : 本地 DAG 调度器（线程池，单进程）
+           任务声明依赖和输入指纹，依赖都完成后即可执行，互不依赖的任务并发；
+           输入指纹与上次成功运行时相同、且上游任务都没有重新运行时跳过；
+           声明了同一把 lock 的任务互斥（例如共用绘图进程池的看板，或重建同一张规则表的看板）；
+           每次运行的状态、耗时写到 state 文件和运行日志，结束时打印耗时排行和关键路径
+任务声明：
+    {name: {"func": 无参可调用对象,
+            "deps": [上游任务名],
+            "inputs": 返回输入描述（可 JSON 序列化）的无参可调用对象，None 表示每次都执行,
+            "lock": 互斥锁名，或多个锁名的列表（可选，需同时拿到全部锁才执行）,
+            "allow_failed_deps": 上游失败时是否照常执行（可选，例如最后发通知）,
+            "pass_results": 为 True 时以 func(已完成任务的结果) 调用（可选）}}
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+# 任务状态
+OK = "ok"
+SKIPPED = "skipped"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+def topo_order(tasks):
+    """按依赖排序（同层保持声明顺序），有环或依赖不存在时报错"""
+    for name, task in tasks.items():
+        missing = [d for d in task.get("deps", []) if d not in tasks]
+        if missing:
+            raise ValueError(f"任务 {name} 依赖不存在：{missing}")
+    order, done = [], set()
+    while len(order) < len(tasks):
+        ready = [n for n in tasks if n not in done and all(d in done for d in tasks[n].get("deps", []))]
+        if not ready:
+            raise ValueError(f"任务依赖存在环：{[n for n in tasks if n not in done]}")
+        order.extend(ready)
+        done.update(ready)
+    return order
+
+
+def file_signature(path):
+    """文件输入的指纹：路径 + 大小 + 修改时间；文件不存在时为 None"""
+    if not os.path.exists(path):
+        return None
+    st = os.stat(path)
+    return [path, st.st_size, int(st.st_mtime)]
+
+
+def _fingerprint(task):
+    if task.get("inputs") is None:
+        return None
+    raw = json.dumps(task["inputs"](), sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _locks(task):
+    lock = task.get("lock")
+    if not lock:
+        return set()
+    return {lock} if isinstance(lock, str) else set(lock)
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def critical_path(tasks, results):
+    """按本次实际耗时计算关键路径（跳过的任务耗时记 0）：返回 (任务链, 总耗时)"""
+    best = {}
+    for name in topo_order(tasks):
+        deps = tasks[name].get("deps", [])
+        prev = max(deps, key=lambda d: best[d][1], default=None)
+        base_path, base_cost = best[prev] if prev else ([], 0.0)
+        best[name] = (base_path + [name], base_cost + results.get(name, {}).get("seconds", 0.0))
+    return max(best.values(), key=lambda x: x[1], default=([], 0.0))
+
+
+def run(tasks, state_path, force=False, max_workers=4, log_path=None):
+    """
+    执行 DAG
+    :param tasks: 任务声明，见模块说明
+    :param state_path: 上次运行状态（指纹 / 状态 / 耗时）的 JSON 文件
+    :param force: True 时忽略指纹全部重跑
+    :param log_path: 每次运行追加一行 JSON 的耗时日志，默认与 state 同目录的 runs.jsonl
+    :return: {任务名: {"status", "seconds"}}
+    """
+    order = topo_order(tasks)
+    state = _load_state(state_path)
+    results = {}
+    pending = list(order)
+    running = {}
+    busy_locks = set()
+    run_start = time.time()
+
+    def finish(name, status, seconds=0.0, fingerprint=None):
+        results[name] = {"status": status, "seconds": round(seconds, 3)}
+        if status == OK:
+            state[name] = {"fingerprint": fingerprint, "status": OK, "seconds": round(seconds, 3),
+                           "finished_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        elif status == FAILED:
+            state[name] = {"fingerprint": None, "status": FAILED, "seconds": round(seconds, 3),
+                           "finished_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            # 反复扫描，直到本轮没有任务可以再提交 / 跳过
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in list(pending):
+                    task = tasks[name]
+                    deps = task.get("deps", [])
+                    if not all(d in results for d in deps):
+                        continue
+                    failed_deps = [d for d in deps if results[d]["status"] in (FAILED, BLOCKED)]
+                    if failed_deps and not task.get("allow_failed_deps"):
+                        print(f"⛔ {name} 未执行：上游 {failed_deps} 失败")
+                        finish(name, BLOCKED)
+                        pending.remove(name)
+                        progressed = True
+                        continue
+                    locks = _locks(task)
+                    if locks & busy_locks:
+                        continue
+                    try:
+                        fingerprint = _fingerprint(task)
+                    except Exception as e:
+                        print(f"❌ {name} 输入检查失败：{str(e)[:200]}")
+                        finish(name, FAILED)
+                        pending.remove(name)
+                        progressed = True
+                        continue
+                    upstream_ran = any(results[d]["status"] != SKIPPED for d in deps)
+                    last = state.get(name, {})
+                    if (not force and not upstream_ran and fingerprint is not None
+                            and last.get("status") == OK and last.get("fingerprint") == fingerprint):
+                        print(f"⏭️  {name} 输入未变化，跳过")
+                        finish(name, SKIPPED)
+                        pending.remove(name)
+                        progressed = True
+                        continue
+                    print(f"▶️  {name} 开始")
+                    args = (dict(results),) if task.get("pass_results") else ()
+                    running[pool.submit(task["func"], *args)] = (name, fingerprint, time.time())
+                    busy_locks |= locks
+                    pending.remove(name)
+                    progressed = True
+
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, fingerprint, start = running.pop(future)
+                busy_locks -= _locks(tasks[name])
+                cost = time.time() - start
+                try:
+                    future.result()
+                    print(f"✅ {name} 完成，耗时 {cost:.2f}s")
+                    finish(name, OK, cost, fingerprint)
+                except Exception as e:
+                    print(f"❌ {name} 失败（{cost:.2f}s）：{str(e)[:200]}")
+                    finish(name, FAILED, cost)
+            _save_state(state_path, state)
+
+    _save_state(state_path, state)
+    total = time.time() - run_start
+    log_path = log_path or os.path.join(os.path.dirname(state_path), "runs.jsonl")
+    with open(log_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"run_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "seconds": round(total, 3),
+                            "tasks": results}, ensure_ascii=False) + "\n")
+
+    icons = {OK: "✅", SKIPPED: "⏭️ ", FAILED: "❌", BLOCKED: "⛔"}
+    print(f"\n📊 流水线完成，总耗时 {total:.2f}s：")
+    for name, r in sorted(results.items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"  {icons[r['status']]} {name:<36} {r['seconds']:8.2f}s")
+    path, cost = critical_path(tasks, results)
+    print(f"🧭 关键路径（{cost:.2f}s）：{' → '.join(path)}")
+    return results
@@ -0,0 +1,81 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 23:30
+@Desc    : 看板 HTML 流式写出（模板片段 + 生成器）
+           各 k_line_rule* 看板原来在 iterrows 循环里 html += f'''...''' 拼整页字符串，
+           卡片里内嵌 base64 图片，每次 += 都可能复制已拼好的整页，耗时随卡片数平方增长、峰值内存是整页的数倍；
+           现在各看板按页面顺序 yield 片段，write_html 逐段写进文件缓冲区，内存里只有当前这一张卡片
+"""
+import os
+
+from src.utils import kline_canvas
+
+# 文件写缓冲区大小，攒满后整块落盘
+BUFFER_SIZE = 1 << 20
+
+
+def write_html(path, *parts):
+    """
+    按顺序把片段流式写入 HTML 文件
+    先写临时文件再原子替换，浏览器里打开着的旧看板不会读到半页
+    :param path: 输出文件路径
+    :param parts: 字符串，或产出字符串的可迭代对象（生成器）
+    :return: 输出文件路径
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", buffering=BUFFER_SIZE) as f:
+            for part in parts:
+                if isinstance(part, str):
+                    f.write(part)
+                else:
+                    for chunk in part:
+                        f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def iter_records(df):
+    """逐行产出 {列名: 值}，代替 iterrows（iterrows 每行都要构造一个 Series）"""
+    columns = list(df.columns)
+    for values in zip(*(df[c].tolist() for c in columns)):
+        yield dict(zip(columns, values))
+
+
+def group_records(df, key):
+    """
+    一次遍历按 key 分组，代替在循环里反复 df[df[key] == v] 全表过滤
+    :return: {key 值: [record, ...]}，组内保持原有行顺序
+    """
+    groups = {}
+    for r in iter_records(df):
+        groups.setdefault(r[key], []).append(r)
+    return groups
+
+
+def price_rise_html(price, rise_val, unit="元"):
+    """卡片标题里的 (最新价) + 当日涨幅，涨红跌绿"""
+    price_str = f"({price}{unit})" if price else ""
+    rise_cls = "rise-red" if rise_val >= 0 else "rise-green"
+    return f'<span class="price">{price_str}</span><span class="{rise_cls}">{rise_val:+.2f}%</span>'
+
+
+def chart_html(src):
+    """
+    卡片里的 K 线图：render_charts 返回的地址是 canvas 数据时输出 <canvas>，否则输出懒加载的 <img>
+    """
+    if kline_canvas.is_canvas(src):
+        return kline_canvas.canvas_html(src)
+    return f'<img src="{src}" loading="lazy" decoding="async">'
+
+
+def chart_script(img_map):
+    """页面里有 canvas 图时返回内嵌的渲染 JS（放在所有卡片之后），否则返回空串"""
+    if any(kline_canvas.is_canvas(src) for src in img_map.values()):
+        return kline_canvas.RENDER_JS
+    return ""
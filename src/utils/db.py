@@ -0,0 +1,122 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 05:00
+@Desc    : 统一的 MySQL 访问层（进程级共享连接池）
+           原来有三种连法：utils/mysql.connect() 导入时直连 pymysql、各看板模块各自 create_engine、
+           ETL 函数每次调用都 create_engine(pool_size=10)；run_screens / run_pipeline 在一个进程里跑十几个看板时，
+           每个看板都要新建引擎、重新握手。现在整个进程共用 get_engine() 返回的同一个引擎：
+           pre_ping 检测失效连接、pool_recycle 定期回收（MySQL 默认 8 小时断开空闲连接），
+           大结果集用服务端游标（stream_results）分块读取，不在客户端一次性缓冲全部行
+           本模块顶层只用相对导入，以 src.utils.db 或 utils.db（src 目录下直接运行的旧脚本，如 sp2.py）导入都可以；
+           write_dataframe 例外，它依赖 src.etl.bulk_loader，只能在 src 包布局下使用（在仓库根目录 python -m src.xxx 运行）
+"""
+import threading
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from . import constants
+
+# 连接池参数：看板 / ETL 并发都不高，10 + 10 足够
+POOL_SIZE = 10
+MAX_OVERFLOW = 10
+POOL_RECYCLE = 3600
+
+# 服务端游标分块读取的默认行数
+STREAM_CHUNK_ROWS = 100000
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def engine_url(db_config=None):
+    db_config = db_config or constants.db_config
+    return (
+        f"mysql+pymysql://{db_config['user']}:{db_config['password']}@"
+        f"{db_config['host']}:{db_config['port']}/{db_config['database']}?charset=utf8mb4"
+    )
+
+
+def create(db_config=None, **kwargs):
+    """
+    新建一个独立的连接池引擎（连非默认库等场景），一般用 get_engine()
+    默认开启 local_infile，bulk_loader.load_dataframe 才能走 LOAD DATA
+    """
+    kwargs.setdefault("pool_size", POOL_SIZE)
+    kwargs.setdefault("max_overflow", MAX_OVERFLOW)
+    kwargs.setdefault("pool_recycle", POOL_RECYCLE)
+    kwargs.setdefault("pool_pre_ping", True)
+    connect_args = kwargs.pop("connect_args", {})
+    connect_args.setdefault("local_infile", True)
+    return create_engine(engine_url(db_config), connect_args=connect_args, **kwargs)
+
+
+def get_engine():
+    """进程级共享引擎，首次调用时创建（线程安全）"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create()
+    return _engine
+
+
+def dispose():
+    """关闭连接池里的全部连接（进程退出前 / fork 子进程前调用）"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+
+def raw_connection():
+    """
+    从连接池借一个 DBAPI（pymysql）连接，用法与 pymysql.connect() 返回的连接相同：
+    cursor() / commit() / rollback()，close() 时归还连接池而不是断开
+    """
+    return get_engine().raw_connection()
+
+
+def _sql(sql):
+    return text(sql) if isinstance(sql, str) else sql
+
+
+def read_sql(sql, params=None, engine=None, **kwargs):
+    """普通查询（结果集不大），sql 可以是字符串（:name 占位）或 text()"""
+    return pd.read_sql(_sql(sql), engine or get_engine(), params=params, **kwargs)
+
+
+def iter_sql(sql, params=None, chunksize=STREAM_CHUNK_ROWS, engine=None):
+    """
+    大结果集分块读取：服务端游标逐批取行，每次产出一个 DataFrame
+    全部块读完前连接一直占用，调用方应尽快消费，不要在循环里再查同一个连接
+    """
+    with (engine or get_engine()).connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+        for chunk in pd.read_sql(_sql(sql), conn, params=params, chunksize=chunksize):
+            yield chunk
+
+
+def read_sql_stream(sql, params=None, chunksize=STREAM_CHUNK_ROWS, engine=None):
+    """大结果集一次性读成 DataFrame：走服务端游标，客户端不再先缓冲一份全部原始行"""
+    chunks = list(iter_sql(sql, params, chunksize, engine))
+    if not chunks:
+        return read_sql(sql, params, engine)
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def write_dataframe(df, table, delete_sql=None, params=None, engine=None):
+    """
+    DataFrame 批量写入（LOAD DATA，失败自动退回多行 INSERT），可先在同一事务里删除旧数据
+    需要以 src 包方式运行（依赖 src.etl.bulk_loader）
+    :param delete_sql: 写入前执行的删除语句（例如按 dt 删除当天旧分区），与写入在同一事务
+    :return: 写入行数
+    """
+    from src.etl import bulk_loader
+
+    with (engine or get_engine()).begin() as conn:
+        if delete_sql:
+            conn.execute(_sql(delete_sql), params or {})
+        return bulk_loader.load_dataframe(conn, df, table)
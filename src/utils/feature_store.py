@@ -0,0 +1,307 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 00:40
+@Desc    : 日频技术特征存储 stock_feature_daily（Parquet，按月分区，月内按 code, dt 有序）
+           各筛选原来每次都从原始 K 线重算滚动指标（3 倍量的 rolling(5) 量均、回测里的前 5 日均量、SQL 窗口函数算 10 日涨幅）；
+           现在每个交易日只用「昨天的状态 + 今天一根 K 线」递推出当天特征，每天的计算量只与股票数有关、与历史长度无关，
+           筛选直接对预计算好的列做过滤
+           状态（每只股票最近 20 根收盘价、5 根成交额、连涨 / 连跌天数、ATR、K 线根数）单独存一个文件，
+           同时保留上一交易日的状态，当天重复入库时可以从上一交易日重算
+用法：
+    python -m src.utils.feature_store              增量更新到本地 K 线存储的最新交易日（缺几天补几天）
+    python -m src.utils.feature_store rebuild      按本地 K 线存储全部历史重建
+"""
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.utils import constants, kline_store
+
+STORE_DIR = constants.feature_store_dir
+TABLE_NAME = "stock_feature_daily"
+
+# 均线 / N 日涨幅的窗口（N 日涨幅 = 当日收盘 / N 个交易日前收盘 - 1）
+MA_WINDOWS = (5, 10, 20)
+RISE_WINDOWS = (5, 10, 20)
+VOL_MA_WINDOW = 5
+ATR_PERIOD = 14
+
+# 状态里保留的历史根数：收盘价要覆盖 max(MA, N 日涨幅) 的窗口，成交额要覆盖「前 5 日均量」
+_CLOSE_LAGS = max(max(MA_WINDOWS), max(RISE_WINDOWS))
+_VOL_LAGS = VOL_MA_WINDOW
+_CLOSE_COLS = [f"close_{i}" for i in range(_CLOSE_LAGS)]
+_VOL_COLS = [f"vol_{i}" for i in range(_VOL_LAGS)]
+STATE_COLUMNS = ['code', 'last_dt'] + _CLOSE_COLS + _VOL_COLS + ['up_days', 'down_days', 'atr14', 'bars']
+
+# 特征字段
+#   volume: 当日成交额（stock_detail.trade_amount）
+#   vol_ma5: 含当日的 5 日均量；vol_ma5_prev: 不含当日的前 5 日均量（放量倍数的分母）
+#   rise_Nd: 小数，0.1 = 10%，不足 N+1 根 K 线为空
+#   up_days / down_days: 截至当日连续收阳（收盘 >= 开盘）/ 收阴天数，与 etl/streak_rules.py 口径一致
+#   atr14: Wilder ATR，前 14 根用已有 TR 的算术平均起步
+#   bars: 已累计的有效 K 线根数（不足窗口的均线 / 涨幅为空）
+FEATURE_COLUMNS = (
+    ['dt', 'code', 'stock_name', 'close', 'volume']
+    + [f"ma{w}" for w in MA_WINDOWS]
+    + ['vol_ma5', 'vol_ma5_prev']
+    + [f"rise_{w}d" for w in RISE_WINDOWS]
+    + ['up_days', 'down_days', 'atr14', 'bars']
+)
+_INT_COLUMNS = ['up_days', 'down_days', 'bars']
+
+# 从 K 线存储读取的列（读出后已重命名为 Open/Close/High/Low/Volume）
+_BAR_COLUMNS = ['dt', 'code', 'stock_name', 'price_open', 'price_close', 'price_highest', 'price_lowest', 'trade_amount']
+
+_STATE_FILE = "state.parquet"
+_STATE_PREV_FILE = "state_prev.parquet"
+
+
+def _month_path(month):
+    return os.path.join(STORE_DIR, f"{TABLE_NAME}_{month}.parquet")
+
+
+def list_months():
+    """返回已落盘的月份分区（升序，yyyy-MM）"""
+    if not os.path.isdir(STORE_DIR):
+        return []
+    prefix = f"{TABLE_NAME}_"
+    return sorted(name[len(prefix):-len(".parquet")] for name in os.listdir(STORE_DIR)
+                  if name.startswith(prefix) and name.endswith(".parquet"))
+
+
+def latest_dt():
+    """特征存储已计算到的交易日（以状态文件为准）"""
+    return _as_of(_load_state(_STATE_FILE))
+
+
+# -------------------- 状态 --------------------
+def _empty_state():
+    return pd.DataFrame(columns=STATE_COLUMNS).set_index('code')
+
+
+def _load_state(file_name):
+    path = os.path.join(STORE_DIR, file_name)
+    if not os.path.exists(path):
+        return _empty_state()
+    return pq.read_table(path).to_pandas().set_index('code')
+
+
+def _save_state(file_name, state):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    path = os.path.join(STORE_DIR, file_name)
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(state.reset_index(), preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _as_of(state):
+    """状态对应的交易日：每个交易日都有股票有行情，取各股票最后一根 K 线日期的最大值即可"""
+    return None if state.empty else str(state['last_dt'].max())
+
+
+# -------------------- 单日递推 --------------------
+def _step(state, bars, dt):
+    """
+    用昨天的状态 + 今天的 K 线递推出今天的特征和新状态，全程按股票向量化
+    :param state: 截至上一交易日的状态，index 为 code
+    :param bars: 当天 K 线（code 唯一、价格非空），列 code, stock_name, Open, Close, High, Low, Volume
+    :param dt: 交易日 yyyy-MM-dd
+    :return: (当天特征 DataFrame, 新状态)
+    """
+    bars = bars.set_index('code')
+    prev = state.reindex(bars.index)
+    close = bars['Close'].to_numpy(dtype='float64')
+    open_ = bars['Open'].to_numpy(dtype='float64')
+    high = bars['High'].to_numpy(dtype='float64')
+    low = bars['Low'].to_numpy(dtype='float64')
+    volume = bars['Volume'].to_numpy(dtype='float64')
+
+    # 新上市 / 首次出现的股票没有状态：历史收盘价、成交额为空，计数从 0 开始
+    n_bars = prev['bars'].fillna(0).to_numpy(dtype='int64') + 1
+    closes = np.column_stack([close, prev[_CLOSE_COLS].to_numpy(dtype='float64')])
+    vols = np.column_stack([volume, prev[_VOL_COLS].to_numpy(dtype='float64')])
+
+    # 历史不足窗口时对应位置是 NaN，均值 / 涨幅自然为空
+    feat = {
+        'dt': pd.Timestamp(dt).date(),
+        'code': bars.index.to_numpy(),
+        'stock_name': bars['stock_name'].to_numpy(),
+        'close': close,
+        'volume': volume,
+    }
+    for w in MA_WINDOWS:
+        feat[f"ma{w}"] = closes[:, :w].mean(axis=1)
+    feat['vol_ma5'] = vols[:, :VOL_MA_WINDOW].mean(axis=1)
+    feat['vol_ma5_prev'] = vols[:, 1:VOL_MA_WINDOW + 1].mean(axis=1)
+    for w in RISE_WINDOWS:
+        base = closes[:, w]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            feat[f"rise_{w}d"] = np.where(base > 0, close / base - 1, np.nan)
+
+    is_up = close >= open_
+    up_days = np.where(is_up, prev['up_days'].fillna(0).to_numpy(dtype='int64') + 1, 0)
+    down_days = np.where(is_up, 0, prev['down_days'].fillna(0).to_numpy(dtype='int64') + 1)
+
+    # TR = max(最高 - 最低, |最高 - 昨收|, |最低 - 昨收|)，没有昨收时 fmax 忽略 NaN，退化为最高 - 最低
+    prev_close = closes[:, 1]
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    prev_atr = prev['atr14'].fillna(0).to_numpy(dtype='float64')
+    atr = prev_atr + (tr - prev_atr) / np.minimum(n_bars, ATR_PERIOD)
+
+    feat.update({'up_days': up_days, 'down_days': down_days, 'atr14': atr, 'bars': n_bars})
+    df_feat = pd.DataFrame(feat, columns=FEATURE_COLUMNS)
+
+    new_rows = pd.DataFrame(
+        np.column_stack([closes[:, :_CLOSE_LAGS], vols[:, :_VOL_LAGS]]),
+        index=bars.index, columns=_CLOSE_COLS + _VOL_COLS
+    )
+    new_rows.insert(0, 'last_dt', dt)
+    new_rows['up_days'] = up_days
+    new_rows['down_days'] = down_days
+    new_rows['atr14'] = atr
+    new_rows['bars'] = n_bars
+    # 当天停牌的股票保留原状态
+    kept = state[~state.index.isin(bars.index)]
+    new_state = pd.concat([kept, new_rows]) if len(kept) else new_rows
+    new_state.index.name = 'code'
+    return df_feat, new_state[STATE_COLUMNS[1:]]
+
+
+# -------------------- 落盘 --------------------
+def _write_month(month, df):
+    """把若干交易日的特征写进月分区（覆盖这些交易日的旧数据），先写临时文件再原子替换"""
+    path = _month_path(month)
+    if os.path.exists(path):
+        old_df = pq.read_table(path).to_pandas()
+        old_df = old_df[~old_df['dt'].isin(set(df['dt']))]
+        df = pd.concat([old_df, df], ignore_index=True)
+    df = df.sort_values(['code', 'dt']).reset_index(drop=True)
+    df[_INT_COLUMNS] = df[_INT_COLUMNS].astype('int32')
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _replay(state, dts):
+    """
+    从 state 出发按交易日顺序递推 dts，逐月读 K 线、逐月落盘特征，最后保存状态
+    :return: 写入的特征行数
+    """
+    start = time.time()
+    prev_state = state
+    rows = 0
+    for month in sorted({d[:7] for d in dts}):
+        month_dts = [d for d in dts if d[:7] == month]
+        df_k = kline_store.load_kline(month_dts[0], month_dts[-1], columns=_BAR_COLUMNS)
+        df_k = df_k.dropna(subset=['Open', 'Close', 'High', 'Low']).drop_duplicates(['dt', 'code'], keep='last')
+        days = {dt.strftime("%Y-%m-%d"): g for dt, g in df_k.groupby('dt', sort=True)}
+        frames = []
+        for d in month_dts:
+            if d not in days:
+                continue
+            prev_state = state
+            df_feat, state = _step(state, days[d], d)
+            frames.append(df_feat)
+        if frames:
+            df_month = pd.concat(frames, ignore_index=True)
+            _write_month(month, df_month)
+            rows += len(df_month)
+    _save_state(_STATE_PREV_FILE, prev_state)
+    _save_state(_STATE_FILE, state)
+    print(f"✅ {TABLE_NAME} 更新完成：{dts[0]} ~ {dts[-1]} 共 {len(dts)} 个交易日、{rows} 行，"
+          f"耗时 {time.time() - start:.2f}s")
+    return rows
+
+
+def rebuild(end_dt=None):
+    """清空特征存储，按本地 K 线存储全部历史（截至 end_dt）重新递推"""
+    dts = [d for d in kline_store.list_dts() if end_dt is None or d <= str(end_dt)[:10]]
+    if os.path.isdir(STORE_DIR):
+        shutil.rmtree(STORE_DIR)
+    if not dts:
+        print("❌ 本地 K 线存储为空，先执行 utils/kline_store.py 回填")
+        return 0
+    print(f"🔁 重建 {TABLE_NAME}：{dts[0]} ~ {dts[-1]}")
+    return _replay(_empty_state(), dts)
+
+
+def update(dt=None):
+    """
+    增量更新到 dt（默认本地 K 线存储的最新交易日）
+    - 状态已在上一交易日：只算 dt 一天
+    - 中间缺了几天：按顺序补齐
+    - dt 当天已算过（重新入库）：从上一交易日的状态重算当天
+    - 没有状态或 dt 早于已计算的日期（历史数据被改写）：全量重建
+    :return: 写入的特征行数
+    """
+    dt = str(dt or kline_store.latest_dt())[:10]
+    state = _load_state(_STATE_FILE)
+    as_of = _as_of(state)
+    if as_of == dt:
+        state = _load_state(_STATE_PREV_FILE)
+        as_of = _as_of(state)
+    if as_of is None:
+        return rebuild(dt)
+    if as_of > dt:
+        return rebuild()
+
+    dts = [d for d in kline_store.list_dts() if as_of < d <= dt]
+    if not dts:
+        print(f"♻️  {TABLE_NAME} 已是最新（{as_of}）")
+        return 0
+    return _replay(state, dts)
+
+
+# -------------------- 读取 --------------------
+def load_features(start_dt, end_dt=None, codes=None, columns=None, exclude_st=False):
+    """
+    读取 [start_dt, end_dt] 区间的特征，按 code, dt 排序
+    :param columns: 读取的特征列，默认 FEATURE_COLUMNS
+    :param exclude_st: 是否剔除 ST（等价于 upper(stock_name) not like '%ST%'）
+    :return: DataFrame，dt 为 datetime
+    """
+    start_dt = str(start_dt)[:10]
+    end_dt = str(end_dt)[:10] if end_dt is not None else None
+    columns = list(columns or FEATURE_COLUMNS)
+    for must in ('code', 'dt'):
+        if must not in columns:
+            columns.insert(0, must)
+    read_columns = list(columns)
+    if exclude_st and 'stock_name' not in read_columns:
+        read_columns.append('stock_name')
+
+    months = [m for m in list_months() if m >= start_dt[:7] and (end_dt is None or m <= end_dt[:7])]
+    if not months:
+        return pd.DataFrame(columns=columns)
+
+    table = pa.concat_tables([
+        pq.read_table(_month_path(m), columns=read_columns, memory_map=True) for m in months
+    ])
+    mask = pc.greater_equal(table['dt'], pa.scalar(pd.Timestamp(start_dt).date()))
+    if end_dt is not None:
+        mask = pc.and_(mask, pc.less_equal(table['dt'], pa.scalar(pd.Timestamp(end_dt).date())))
+    if codes is not None:
+        mask = pc.and_(mask, pc.is_in(table['code'], value_set=pa.array([str(c) for c in codes])))
+    if exclude_st:
+        mask = pc.and_(mask, pc.invert(pc.match_substring(pc.utf8_upper(table['stock_name']), 'ST')))
+    df = table.filter(mask).select(columns).to_pandas(date_as_object=False)
+    # 月内已按 code, dt 有序，跨月时归并一次
+    if len(months) > 1:
+        df = df.sort_values(['code', 'dt'], kind='stable').reset_index(drop=True)
+    return df
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        rebuild()
+    else:
+        update()
@@ -4,8 +4,11 @@ import json
 # 你的飞书机器人Webhook URL
 WEBHOOK_URL = 'https://open.feishu.cn/open-apis/bot/v2/hook/fd513b57-0502-43f6-b08e-2f5d7ed3b171'
 
+# 复用 HTTPS 连接，盘中提醒连续发送时不用每次重新握手
+_session = requests.Session()
 
-def send_message(title, msg):
+
+def send_message(title, msg, timeout=10):
     headers = {
         'Content-Type': 'application/json'
     }
@@ -29,12 +32,14 @@ def send_message(title, msg):
         }
     }
 
-    response = requests.post(WEBHOOK_URL, headers=headers, data=json.dumps(message))
+    response = _session.post(WEBHOOK_URL, headers=headers, data=json.dumps(message), timeout=timeout)
 
     if response.status_code == 200:
         print("Message sent successfully!")
+        return True
     else:
         print(f"Failed to send message. Status code: {response.status_code}, Response: {response.text}")
+        return False
 
 
 if __name__ == "__main__":
@@ -0,0 +1,301 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 07:50
+@Desc    : 盘中提醒引擎
+           get_detail_data.py 里原来只留了 Thread(target=do_stock).start() 之类的注释钩子，没有真正的规则，
+           feishu.send_message 是同步请求，放在轮询线程里发一次就要卡住几百毫秒；
+           现在各规则用 @register 注册，每轮只拿快照增量存储（etl/snapshot_store.py）返回的有变化的股票，
+           和引擎里保存的这些股票上一轮的值一起交给规则，规则对整列做向量化比较，只在"跨过阈值"的那一轮命中；
+           命中结果按 (规则, 股票, key) 去重（冷却时间内或当天已提醒过的不再发），
+           本轮全部提醒合并成一条飞书消息交给后台线程发送，轮询线程不等待网络
+           第一轮（启动 / 盘中重启）只记录状态不提醒，避免把已经满足条件的股票一次性全部推送
+用法：
+    alerts = AlertEngine()
+    alerts.on_poll(changed, poll_ts)     # 轮询线程里调用，返回本轮新产生的提醒
+    alerts.close()                       # 收盘后发完剩余提醒再退出
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.utils import feishu, kline_pattern, kline_store
+
+# 规则用到的快照字段：最新价、涨跌幅、成交额、量比、主力净流入
+ALERT_FIELDS = ['f2', 'f3', 'f6', 'f10', 'f62']
+
+# 一条飞书消息最多列出的提醒条数，超出的只给出总数
+MAX_MESSAGE_LINES = 30
+
+# 发送队列最多积压的消息数（飞书不可用时丢弃最旧的）
+MAX_PENDING_MESSAGES = 100
+
+# 单条消息发送失败后的重试次数
+MAX_SEND_RETRIES = 2
+
+# 规则名 → 声明
+RULES = {}
+
+
+def register(name, title, cooldown_seconds=None, params=None):
+    """
+    注册盘中提醒规则
+    规则函数签名 func(cur, prev, engine, **params)：
+        cur / prev 为本轮有变化的股票的当前值 / 上一轮值（index 为 f12，列为 ALERT_FIELDS，上一轮没有的为 NaN），
+        返回命中的股票 DataFrame（index 为 f12，detail 列为提醒内容，可选 key 列用于区分同一股票的不同档位）
+    :param title: 提醒里显示的规则名称
+    :param cooldown_seconds: 同一股票同一 key 两次提醒的最小间隔，None 表示当天只提醒一次
+    :param params: 规则函数的关键字参数
+    """
+    def decorator(func):
+        if name in RULES:
+            raise ValueError(f"提醒规则重复：{name}")
+        RULES[name] = {
+            "func": func,
+            "title": title,
+            "cooldown_seconds": cooldown_seconds,
+            "params": params or {},
+        }
+        return func
+    return decorator
+
+
+def _hits(codes, mask, detail, key=None):
+    idx = np.flatnonzero(mask)
+    hits = pd.DataFrame({"detail": [detail(i) for i in idx]}, index=codes[idx])
+    if key is not None:
+        hits["key"] = key[idx]
+    return hits
+
+
+def load_necklines(months=6):
+    """
+    用截至上一交易日的日 K 线识别 N 颈线位（规则同 k_line_N_style.detect_n_neckline_pattern），
+    返回命中股票的颈线价 Series（index 为代码），启动时算一次，盘中只做比较
+    """
+    last_dt = kline_store.latest_dt()
+    if last_dt is None:
+        return pd.Series(dtype='float64')
+    df_all = kline_store.load_kline(kline_store.months_before(last_dt, months),
+                                    columns=['dt', 'code', 'stock_name', 'price_highest', 'price_lowest', 'price_close'],
+                                    exclude_st=True)
+    df_res, _ = kline_pattern.detect_n_neckline_batch(df_all)
+    df_res = df_res[df_res["is_hit"]]
+    return pd.Series(df_res["neck_price"].to_numpy(), index=df_res["code"].astype(str), dtype='float64')
+
+
+# -------------------- 规则 --------------------
+@register("neckline_break", "跌破 N 颈线", params={"pct": 0.02})
+def neckline_break(cur, prev, engine, pct):
+    """N 颈线位股票盘中价格跌破颈线 pct 以上（上一轮还在其上或刚出现）"""
+    neck = engine.necklines.reindex(cur.index).to_numpy(dtype='float64')
+    level = neck * (1 - pct)
+    price, last = cur['f2'].to_numpy(), prev['f2'].to_numpy()
+    mask = (price < level) & ~(last < level)
+    return _hits(cur.index, mask,
+                 lambda i: f"现价 {price[i]:.2f}（{cur['f3'].iat[i]:+.2f}%），颈线 {neck[i]:.2f}")
+
+
+@register("volume_ratio_spike", "量比异动", cooldown_seconds=30 * 60, params={"threshold": 5.0, "min_amount": 2e7})
+def volume_ratio_spike(cur, prev, engine, threshold, min_amount):
+    """量比 f10 上穿 threshold，且成交额不低于 min_amount（过滤开盘几分钟的小额放量）"""
+    ratio, last = cur['f10'].to_numpy(), prev['f10'].to_numpy()
+    mask = (ratio >= threshold) & ~(last >= threshold) & (cur['f6'].to_numpy() >= min_amount)
+    return _hits(cur.index, mask,
+                 lambda i: f"量比 {ratio[i]:.2f}，现价 {cur['f2'].iat[i]:.2f}（{cur['f3'].iat[i]:+.2f}%）")
+
+
+@register("main_inflow", "主力净流入", params={"levels": (1e8, 3e8, 5e8)})
+def main_inflow(cur, prev, engine, levels):
+    """主力净流入 f62 向上突破 levels 中的某一档（每档当天提醒一次）"""
+    levels = np.asarray(levels, dtype='float64')
+    inflow = cur['f62'].to_numpy()
+    # NaN 视为没有达到任何一档
+    level = np.searchsorted(levels, np.nan_to_num(inflow, nan=-np.inf), side='right')
+    last_level = np.searchsorted(levels, np.nan_to_num(prev['f62'].to_numpy(), nan=-np.inf), side='right')
+    return _hits(cur.index, level > last_level,
+                 lambda i: f"净流入 {inflow[i] / 1e8:.2f} 亿，突破 {levels[level[i] - 1] / 1e8:g} 亿，"
+                           f"现价 {cur['f2'].iat[i]:.2f}（{cur['f3'].iat[i]:+.2f}%）",
+                 key=level)
+
+
+# -------------------- 引擎 --------------------
+class AlertEngine:
+    def __init__(self, rules=None, dispatcher=None, necklines=None):
+        """
+        :param rules: 启用的规则名，默认全部已注册规则
+        :param dispatcher: 提醒发送器（需提供 submit / close），默认 FeishuDispatcher
+        :param necklines: N 颈线价 Series，默认启动时用 load_necklines() 计算
+        """
+        self.rules = {name: RULES[name] for name in (rules or RULES)}
+        self.dispatcher = dispatcher if dispatcher is not None else FeishuDispatcher()
+        if necklines is None and "neckline_break" in self.rules:
+            try:
+                necklines = load_necklines()
+                print(f"📐 盘中提醒：{len(necklines)} 只股票处于 N 颈线位")
+            except Exception as e:
+                print(f"⚠️  N 颈线位加载失败，跌破颈线提醒不生效：{str(e)[:200]}")
+        self.necklines = necklines if necklines is not None else pd.Series(dtype='float64')
+        self._dt = None
+        self._index = pd.Index([], dtype=object)
+        self._values = np.empty((0, len(ALERT_FIELDS)))
+        self._primed = False
+        self._sent = {}
+        self.total = 0
+        self.last_eval_ms = None
+
+    def _reset(self, dt):
+        self._dt = dt
+        self._index = pd.Index([], dtype=object)
+        self._values = np.empty((0, len(ALERT_FIELDS)))
+        self._primed = False
+        self._sent = {}
+
+    def _positions(self, codes):
+        """代码 → 状态数组行号，新出现的股票追加到末尾"""
+        pos = self._index.get_indexer(codes)
+        new = pos < 0
+        if new.any():
+            self._index = self._index.append(pd.Index(codes[new], dtype=object))
+            self._values = np.vstack([self._values, np.full((int(new.sum()), len(ALERT_FIELDS)), np.nan)])
+            pos = self._index.get_indexer(codes)
+        return pos
+
+    def _dedupe(self, name, rule, hits, ts):
+        cooldown = rule["cooldown_seconds"]
+        keys = hits["key"].tolist() if "key" in hits.columns else [None] * len(hits)
+        fresh = []
+        for code, key in zip(hits.index, keys):
+            last = self._sent.get((name, code, key))
+            if last is not None and (cooldown is None or (ts - last).total_seconds() < cooldown):
+                fresh.append(False)
+                continue
+            self._sent[(name, code, key)] = ts
+            fresh.append(True)
+        return hits[np.array(fresh, dtype=bool)]
+
+    def on_poll(self, changed, ts=None):
+        """
+        处理一轮快照增量，命中的提醒立即交给后台线程发送
+        :param changed: 本轮有变化的股票（SnapshotDeltaStore.submit 的返回值，index 为 f12）
+        :param ts: 轮询时刻
+        :return: 本轮新产生的提醒列表
+        """
+        received = time.time()
+        ts = pd.Timestamp(ts or pd.Timestamp.now()).floor('s')
+        if self._dt != ts.date():
+            self._reset(ts.date())
+        if changed is None or changed.empty:
+            return []
+
+        codes = changed.index.astype(str)
+        cur_values = changed.reindex(columns=ALERT_FIELDS).to_numpy(dtype='float64')
+        pos = self._positions(codes)
+        prev_values = self._values[pos]
+        self._values[pos] = cur_values
+        if not self._primed:
+            self._primed = True
+            return []
+
+        cur = pd.DataFrame(cur_values, index=codes, columns=ALERT_FIELDS)
+        prev = pd.DataFrame(prev_values, index=codes, columns=ALERT_FIELDS)
+        names = changed['f14'] if 'f14' in changed.columns else pd.Series('', index=changed.index)
+        names = pd.Series(names.to_numpy(), index=codes)
+        alerts = []
+        for name, rule in self.rules.items():
+            try:
+                hits = rule["func"](cur, prev, self, **rule["params"])
+            except Exception as e:
+                print(f"⚠️  提醒规则 {name} 执行失败：{str(e)[:200]}")
+                continue
+            if hits.empty:
+                continue
+            hits = self._dedupe(name, rule, hits, ts)
+            for code, detail in zip(hits.index, hits["detail"]):
+                alerts.append({"ts": ts, "rule": name, "title": rule["title"], "code": code,
+                               "stock_name": names.get(code, ''), "detail": detail})
+
+        self.last_eval_ms = (time.time() - received) * 1000
+        if alerts:
+            self.total += len(alerts)
+            self.dispatcher.submit(alerts, received)
+        return alerts
+
+    def close(self):
+        self.dispatcher.close()
+        print(f"🔔 盘中提醒结束：共 {self.total} 条")
+
+
+# -------------------- 发送 --------------------
+def format_message(alerts):
+    """一轮提醒合并成一条消息：(标题, 正文)"""
+    ts = alerts[0]["ts"]
+    title = f"盘中提醒 {ts:%H:%M:%S}（{len(alerts)} 条）"
+    lines = [f"【{a['title']}】{a['code']} {a['stock_name']}：{a['detail']}" for a in alerts[:MAX_MESSAGE_LINES]]
+    if len(alerts) > MAX_MESSAGE_LINES:
+        lines.append(f"…… 另有 {len(alerts) - MAX_MESSAGE_LINES} 条")
+    return title, "\n".join(lines)
+
+
+class FeishuDispatcher:
+    """后台线程发送飞书消息，submit 不等待网络；send 可替换（测试 / 其它渠道）"""
+
+    def __init__(self, send=None, max_pending=MAX_PENDING_MESSAGES):
+        self.send = send or feishu.send_message
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.last_latency = None
+        self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, alerts, received=None):
+        """
+        :param alerts: 一轮的提醒列表
+        :param received: 收到这轮快照的时刻（time.time()），用于统计从轮询到发出的延迟
+        """
+        if self._closed or not alerts:
+            return
+        item = (received or time.time(), alerts)
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                    print(f"⚠️  提醒发送积压，丢弃最旧的一条消息（累计丢弃 {self.dropped} 条）")
+                except queue.Empty:
+                    pass
+
+    def close(self, timeout=30):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _deliver(self, received, alerts):
+        title, msg = format_message(alerts)
+        for attempt in range(1, MAX_SEND_RETRIES + 2):
+            try:
+                if self.send(title, msg) is not False:
+                    self.sent += 1
+                    self.last_latency = time.time() - received
+                    return
+            except Exception as e:
+                print(f"⚠️  提醒发送失败（第 {attempt} 次）：{str(e)[:200]}")
+            time.sleep(min(attempt, 3))
+        print(f"❌ 提醒发送重试 {MAX_SEND_RETRIES} 次仍失败，丢弃 {len(alerts)} 条提醒")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._deliver(*item)
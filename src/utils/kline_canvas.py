@@ -0,0 +1,147 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 23:45
+@Desc    : K 线图浏览器端 canvas 渲染
+           3 个月 K 线只有约 60 根 × 5 个数，没必要在服务端跑一遍 matplotlib 再传 ~80KB 的 PNG；
+           这里把每只股票的 日期(Int32 yyyymmdd) + OHLCV(Float32, 按根排列) 编成 base64 放在 <canvas> 的 data 属性里，
+           页面内嵌一段 JS 在卡片进入可视区域时画出蜡烛图 + 成交量，配色与 kline_chart.make_style 一致（涨红跌绿）
+"""
+import base64
+
+import numpy as np
+
+# render_charts 在 canvas 模式下返回的图片地址前缀，dashboard_html.chart_html 据此输出 <canvas>
+PREFIX = "kline:"
+
+# 与 mplfinance 的 'r' / 'g' 一致
+UP_COLOR = "#ff0000"
+DOWN_COLOR = "#008000"
+
+RENDER_JS = '''
+<script>
+(function () {
+    var UP = "%(up)s", DOWN = "%(down)s";
+
+    function decode(b64, Type) {
+        var s = atob(b64), u = new Uint8Array(s.length);
+        for (var i = 0; i < s.length; i++) u[i] = s.charCodeAt(i);
+        return new Type(u.buffer);
+    }
+
+    function draw(cv) {
+        if (!cv._k) cv._k = {d: decode(cv.dataset.d, Int32Array), k: decode(cv.dataset.k, Float32Array)};
+        var d = cv._k.d, k = cv._k.k, n = d.length;
+        var w = cv.clientWidth, h = cv.clientHeight, r = window.devicePixelRatio || 1;
+        if (!w || !h || !n) return;
+        cv.width = Math.round(w * r);
+        cv.height = Math.round(h * r);
+        var c = cv.getContext("2d");
+        c.setTransform(r, 0, 0, r, 0, 0);
+
+        var padL = 4, padR = 46, padT = 6, padB = 18, gap = 6;
+        var plotW = w - padL - padR, priceH = (h - padT - padB - gap) * 0.72;
+        var volTop = padT + priceH + gap, volH = h - padB - volTop;
+        var lo = Infinity, hi = -Infinity, vmax = 0, i;
+        for (i = 0; i < n; i++) {
+            hi = Math.max(hi, k[i * 5 + 1]);
+            lo = Math.min(lo, k[i * 5 + 2]);
+            vmax = Math.max(vmax, k[i * 5 + 4]);
+        }
+        if (hi === lo) { hi += 1; lo -= 1; }
+        var step = plotW / n, bw = Math.max(1, step * 0.7);
+        function y(p) { return padT + (hi - p) / (hi - lo) * priceH; }
+
+        // 坐标轴：价格刻度在右侧，日期在底部
+        c.font = "10px Microsoft YaHei";
+        c.fillStyle = "#555";
+        c.strokeStyle = "#ccc";
+        c.lineWidth = 1;
+        c.strokeRect(padL + 0.5, padT + 0.5, plotW, priceH);
+        c.strokeRect(padL + 0.5, volTop + 0.5, plotW, volH);
+        c.textBaseline = "middle";
+        for (i = 0; i <= 4; i++) {
+            var p = lo + (hi - lo) * i / 4;
+            c.fillText(p.toFixed(2), padL + plotW + 4, y(p));
+        }
+        c.textBaseline = "top";
+        var every = Math.max(1, Math.ceil(n / 5));
+        for (i = 0; i < n; i += every) {
+            var s = String(d[i]);
+            c.fillText(s.slice(4, 6) + "-" + s.slice(6, 8), padL + i * step, h - padB + 4);
+        }
+
+        // 蜡烛 + 成交量：收盘 >= 开盘为涨（红），否则为跌（绿）
+        for (i = 0; i < n; i++) {
+            var o = k[i * 5], hh = k[i * 5 + 1], l = k[i * 5 + 2], cl = k[i * 5 + 3], v = k[i * 5 + 4];
+            var x = padL + i * step + step / 2;
+            c.fillStyle = c.strokeStyle = cl >= o ? UP : DOWN;
+            c.beginPath();
+            c.moveTo(Math.round(x) + 0.5, y(hh));
+            c.lineTo(Math.round(x) + 0.5, y(l));
+            c.stroke();
+            var top = y(Math.max(o, cl));
+            c.fillRect(x - bw / 2, top, bw, Math.max(1, y(Math.min(o, cl)) - top));
+            if (vmax > 0) {
+                var vh = v / vmax * volH;
+                c.fillRect(x - bw / 2, volTop + volH - vh, bw, vh);
+            }
+        }
+        cv._w = w;
+    }
+
+    var canvases = document.querySelectorAll("canvas.kline");
+    // 只画进入可视区域的图，隐藏 Tab 里的图切换过去时才画
+    var io = "IntersectionObserver" in window ? new IntersectionObserver(function (entries) {
+        entries.forEach(function (e) {
+            if (e.isIntersecting) { io.unobserve(e.target); draw(e.target); }
+        });
+    }, {rootMargin: "300px"}) : null;
+    canvases.forEach(function (cv) { io ? io.observe(cv) : draw(cv); });
+
+    // 切换列数 / 窗口缩放后，已画过的图按新宽度重画
+    var timer = null;
+    function redraw() {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            canvases.forEach(function (cv) { if (cv._w && cv._w !== cv.clientWidth) draw(cv); });
+        }, 100);
+    }
+    window.addEventListener("resize", redraw);
+    document.addEventListener("click", redraw);
+})();
+</script>
+''' % {"up": UP_COLOR, "down": DOWN_COLOR}
+
+
+def _yyyymmdd(dts):
+    """int64 纳秒时间戳 → Int32 yyyymmdd"""
+    days = dts.view("datetime64[ns]").astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    year = months.astype("datetime64[Y]").astype(np.int32) + 1970
+    month = months.astype(np.int32) % 12 + 1
+    day = (days - months).astype(np.int32) + 1
+    return (year * 10000 + month * 100 + day).astype("<i4")
+
+
+def encode(dts, ohlcv):
+    """
+    单只股票的 K 线编码成 canvas 模式的图片地址
+    :param dts: int64 纳秒时间戳
+    :param ohlcv: float64，5 x N（Open/High/Low/Close/Volume）
+    :return: "kline:<日期 base64>:<OHLCV base64>"
+    """
+    d = base64.b64encode(_yyyymmdd(dts).tobytes()).decode()
+    k = base64.b64encode(np.ascontiguousarray(ohlcv.T, dtype="<f4").tobytes()).decode()
+    return f"{PREFIX}{d}:{k}"
+
+
+def is_canvas(src):
+    return src.startswith(PREFIX)
+
+
+def canvas_html(src):
+    """<canvas> 标签，宽度随卡片自适应，高宽比与 PNG 图接近"""
+    d, k = src[len(PREFIX):].split(":", 1)
+    return (f'<canvas class="kline" data-d="{d}" data-k="{k}" '
+            f'style="display:block;width:100%;aspect-ratio:20/11;margin-top:10px"></canvas>')
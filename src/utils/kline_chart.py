@@ -0,0 +1,337 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 21:00
+@Desc    : K 线图多进程渲染服务（mplfinance → PNG → base64）
+           matplotlib 绘图是纯 CPU 计算且持有 GIL，线程池几乎没有加速效果；
+           这里改为常驻进程池，每个 worker 启动时只初始化一次字体 / A股配色，
+           主进程按 code 切好 OHLCV 数组后只把数组发给 worker，worker 只回传 PNG 字节；
+           渲染结果按内容哈希写入 chart_cache，同一窗口的图在各看板间复用；
+           asset 模式下图片写成 html/assets/<日期>/ 下的独立 WebP/PNG 文件，HTML 只引用相对路径并懒加载；
+           canvas 模式不在服务端绘图，只输出紧凑的 OHLCV 数据，由浏览器画（见 kline_canvas）
+"""
+import atexit
+import base64
+import multiprocessing
+import os
+import shutil
+import threading
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from src.utils import chart_cache, constants, kline_canvas, kline_pattern
+
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# 绘图参数，同时参与缓存 key 计算：改动任一参数（或配色）后旧缓存自动失效
+FIGRATIO = (10, 5)
+FIGSCALE = 0.7
+DPI = 80
+STYLE_KEY = f"candle|vol|up=r|down=g|grid=|figratio={FIGRATIO}|figscale={FIGSCALE}|dpi={DPI}|font=Microsoft YaHei"
+
+# 各看板 HTML 的默认输出目录（绝对路径，与当前工作目录无关），图片资源放在其下 assets/<日期>/
+HTML_DIR = constants.html_dir
+ASSET_SUBDIR = "assets"
+# asset 模式的 WebP 质量，80 肉眼看不出差别
+WEBP_QUALITY = 80
+
+# 每个进程内的绘图样式，由 _init_plot 初始化
+_s_style = None
+# 常驻进程池，第一次渲染时创建，进程退出时关闭
+_executor = None
+_executor_workers = 0
+# 进程池的创建 / 替换 / 提交都在锁内：调度器里多个线程（特征表计算、DAG 任务）可能同时渲染
+_executor_lock = threading.Lock()
+
+
+def make_style():
+    """A股风格：涨红跌绿"""
+    import mplfinance as mpf
+
+    mc = mpf.make_marketcolors(
+        up='r',
+        down='g',
+        edge='inherit',
+        wick='inherit',
+        volume='inherit'
+    )
+    return mpf.make_mpf_style(marketcolors=mc, gridstyle='')
+
+
+def _init_plot():
+    """屏蔽警告 + 加速配置，worker 进程启动时执行一次"""
+    global _s_style
+    if _s_style is not None:
+        return
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    warnings.filterwarnings("ignore")
+    plt.set_loglevel("error")
+    plt.rcParams['figure.max_open_warning'] = 0
+    plt.rcParams['font.sans-serif'] = ['Microsoft YaHei']
+    plt.rcParams['axes.unicode_minus'] = False
+    _s_style = make_style()
+
+
+def _render_png(payload):
+    """
+    worker 内执行：OHLCV 数组 → PNG 字节
+    :param payload: (code, dt[int64 ns], ohlcv[float64, 5 x N])
+    """
+    import matplotlib.pyplot as plt
+    import mplfinance as mpf
+
+    _init_plot()
+    code, dts, ohlcv = payload
+    try:
+        df = pd.DataFrame(ohlcv.T, columns=OHLCV_COLUMNS, index=pd.DatetimeIndex(dts.view("datetime64[ns]")))
+        fig, ax = mpf.plot(
+            df, type="candle", volume=True, style=_s_style,
+            figratio=FIGRATIO, figscale=FIGSCALE,
+            returnfig=True
+        )
+        buf = BytesIO()
+        fig.savefig(buf, format="png", bbox_inches="tight", dpi=DPI)
+        plt.close(fig)
+        return code, buf.getvalue()
+    except Exception:
+        return code, b""
+
+
+def _to_data_uri(png):
+    if not png:
+        return ""
+    return "data:image/png;base64," + base64.b64encode(png).decode()
+
+
+def fast_plot(df):
+    """单张图在当前进程内绘制，df 需以 dt 为索引并含 Open/High/Low/Close/Volume"""
+    dts = pd.DatetimeIndex(df.index).asi8
+    ohlcv = df[OHLCV_COLUMNS].to_numpy(dtype=np.float64).T
+    return _to_data_uri(_render_png(("", dts, ohlcv))[1])
+
+
+def _to_webp(png):
+    """PNG → WebP（Pillow 不支持 WebP 时返回 None，调用方退回 PNG）"""
+    try:
+        from PIL import Image, features
+        if not features.check("webp"):
+            return None
+        buf = BytesIO()
+        Image.open(BytesIO(png)).save(buf, format="WEBP", quality=WEBP_QUALITY, method=4)
+        return buf.getvalue()
+    except Exception:
+        return None
+
+
+def _find_asset(asset_dir, key):
+    """当天已有同 key 的图片文件（其它看板写过）时返回文件名"""
+    for ext in (".webp", ".png"):
+        if os.path.exists(os.path.join(asset_dir, key + ext)):
+            return key + ext
+    return None
+
+
+def _write_asset(asset_dir, key, png):
+    """写入图片文件，返回文件名；同一 key 已存在则直接复用"""
+    name = _find_asset(asset_dir, key)
+    if name:
+        return name
+    data = _to_webp(png)
+    name = key + (".webp" if data else ".png")
+    path = os.path.join(asset_dir, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data or png)
+    os.replace(tmp_path, path)
+    return name
+
+
+def _referenced_days(html_dir, days):
+    """
+    days 中仍被看板 HTML 引用的日期：引用 assets/<日期>/ 的 HTML 都是当天生成的，
+    只需读修改时间在这些日期的 HTML 文件（之后重新生成的会改为引用新日期的目录）
+    """
+    asset_root = os.path.abspath(os.path.join(html_dir, ASSET_SUBDIR))
+    referenced = set()
+    for dirpath, dirnames, filenames in os.walk(html_dir):
+        if os.path.abspath(dirpath) == asset_root:
+            dirnames.clear()
+            continue
+        for name in filenames:
+            if not name.endswith(".html"):
+                continue
+            path = os.path.join(dirpath, name)
+            day = datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d")
+            if day not in days or day in referenced:
+                continue
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                if f"{ASSET_SUBDIR}/{day}/" in f.read():
+                    referenced.add(day)
+    return referenced
+
+
+def prune_assets(html_dir=HTML_DIR, keep_days=None):
+    """
+    删除超过 keep_days 天、且已没有看板 HTML 引用的 assets/<日期> 目录，返回删除的目录数
+    按日期保留的看板（如 <日期>_M顶….html）还在时，它引用的图片目录一起保留，旧看板打开不会缺图
+    """
+    keep_days = constants.chart_asset_keep_days if keep_days is None else keep_days
+    root = os.path.join(html_dir, ASSET_SUBDIR)
+    if not os.path.isdir(root):
+        return 0
+    cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    # 目录名就是 YYYY-MM-DD，字符串比较即日期比较
+    expired = {entry.name: entry.path for entry in os.scandir(root)
+               if entry.is_dir() and len(entry.name) == 10 and entry.name < cutoff}
+    if not expired:
+        return 0
+    referenced = _referenced_days(html_dir, set(expired))
+    removed = 0
+    for day, path in expired.items():
+        if day not in referenced:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def _mp_context():
+    """
+    worker 不从父进程 fork：调度时父进程里还有其它线程在跑（特征表计算、DAG 任务），
+    fork 会把这些线程持有的锁原样复制进子进程；优先 forkserver，不支持的平台（Windows）用 spawn
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_executor(max_workers):
+    """调用方需持有 _executor_lock"""
+    global _executor, _executor_workers
+    if _executor is not None and _executor_workers != max_workers:
+        # 不等待：其它调用方已提交的任务照常完成，只是不再接收新任务
+        _executor.shutdown(wait=False)
+        _executor = None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_plot, mp_context=_mp_context())
+        _executor_workers = max_workers
+    return _executor
+
+
+def _pool_map(func, payloads, max_workers, chunksize):
+    """在锁内取进程池并一次性提交全部任务（executor.map 立即提交），结果在锁外按顺序读取"""
+    with _executor_lock:
+        return _get_executor(max_workers).map(func, payloads, chunksize=chunksize)
+
+
+def shutdown():
+    """关闭常驻进程池（进程退出时自动调用）"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
+
+
+atexit.register(shutdown)
+
+
+def _build_payloads(df_k, codes, min_bars):
+    """按 code 切片，只取出画图需要的 dt + OHLCV 数组"""
+    df_k = df_k[df_k["code"].isin(set(codes))]
+    df_k = df_k.sort_values(["code", "dt"], kind="mergesort").reset_index(drop=True)
+    dts = pd.to_datetime(df_k["dt"]).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    ohlcv = df_k[OHLCV_COLUMNS].to_numpy(dtype=np.float64).T
+
+    payloads = []
+    for code, s, e in zip(*kline_pattern.code_slices(df_k)):
+        if e - s < min_bars:
+            continue
+        # 切片后 copy，避免把整块市场数组序列化给 worker
+        payloads.append((code, dts[s:e].copy(), np.ascontiguousarray(ohlcv[:, s:e])))
+    return payloads
+
+
+def render_charts(df_k, codes, min_bars=5, max_workers=None, use_cache=True, mode=None, html_dir=HTML_DIR):
+    """
+    批量渲染 K 线图，先查磁盘缓存，只有未命中的才进入进程池绘制
+    :param df_k: K 线（含 code, dt, Open, High, Low, Close, Volume），通常来自 kline_store.load_*
+    :param codes: 需要画图的股票代码
+    :param min_bars: 少于这么多根 K 线的不画，返回空串
+    :param max_workers: 进程数，默认 CPU 核数
+    :param use_cache: 是否读写磁盘缓存
+    :param mode: asset 写独立图片文件 / inline 内嵌 base64 / canvas 浏览器端绘制，默认取 constants.chart_output_mode
+    :param html_dir: 看板 HTML 所在目录，asset 模式的图片写到其下 assets/<日期>/
+    :return: {code: 图片地址}，asset 模式为相对 html_dir 的路径，inline 模式为 "data:image/png;base64,..."，
+             canvas 模式为 "kline:..." 数据（交给 dashboard_html.chart_html 输出）；绘图失败 / 无数据的为 ""
+    """
+    mode = mode or constants.chart_output_mode
+    codes = list(dict.fromkeys(codes))
+    img_map = {code: "" for code in codes}
+    payloads = _build_payloads(df_k, codes, min_bars)
+    if not payloads:
+        return img_map
+
+    if mode == "canvas":
+        for code, dts, ohlcv in payloads:
+            img_map[code] = kline_canvas.encode(dts, ohlcv)
+        return img_map
+
+    asset_dir = None
+    if mode == "asset":
+        day = datetime.now().strftime("%Y-%m-%d")
+        asset_dir = os.path.join(html_dir, ASSET_SUBDIR, day)
+        os.makedirs(asset_dir, exist_ok=True)
+        asset_url = f"{ASSET_SUBDIR}/{day}/"
+
+    def output(key, png):
+        if asset_dir is None:
+            return _to_data_uri(png)
+        return asset_url + _write_asset(asset_dir, key, png) if png else ""
+
+    keys = {}
+    if use_cache or asset_dir:
+        todo = []
+        for payload in payloads:
+            code, dts, ohlcv = payload
+            key = chart_cache.make_key(code, dts, ohlcv, style_key=STYLE_KEY)
+            keys[code] = key
+            # 当天其它看板已经写出过同一张图，直接引用
+            name = _find_asset(asset_dir, key) if asset_dir else None
+            if name:
+                img_map[code] = asset_url + name
+                continue
+            png = chart_cache.get(key) if use_cache else None
+            if png:
+                img_map[code] = output(key, png)
+            else:
+                todo.append(payload)
+        print(f"🗂️ K 线图缓存命中 {len(payloads) - len(todo)}/{len(payloads)}")
+        payloads = todo
+
+    if payloads:
+        max_workers = max_workers or os.cpu_count() or 1
+        if max_workers == 1 or len(payloads) <= 2:
+            # 图很少时不值得拉起进程池
+            results = map(_render_png, payloads)
+        else:
+            # 小批量分发，减少进程间往返次数，同时保证各 worker 负载均衡
+            chunksize = max(1, len(payloads) // (max_workers * 4))
+            results = _pool_map(_render_png, payloads, max_workers, chunksize)
+
+        for code, png in results:
+            img_map[code] = output(keys.get(code), png)
+            if use_cache and png:
+                chart_cache.put(keys[code], png)
+
+        if use_cache:
+            chart_cache.evict()
+    if asset_dir:
+        prune_assets(html_dir)
+    return img_map
@@ -0,0 +1,163 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 20:30
+@Desc    : 全市场批量形态识别（M 顶 / N 颈线）
+           全市场 K 线只分组一次：按 code 切成连续区间后直接在 numpy 数组上寻峰，
+           不再对每只股票做 df_all[df_all["code"] == code] 的整表扫描
+"""
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks
+
+MISS = (False, 0, 0, 0)
+
+
+def code_slices(df_all):
+    """
+    把按 code, dt 排好序的全市场 K 线切成每只股票的连续区间
+    :return: (codes, starts, ends)，df_all.iloc[starts[i]:ends[i]] 即 codes[i] 的全部 K 线
+    """
+    code_arr = df_all["code"].to_numpy()
+    if len(code_arr) == 0:
+        return np.array([], dtype=object), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    # 相邻行 code 变化处即为新区间起点
+    change = np.flatnonzero(code_arr[1:] != code_arr[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [len(code_arr)]))
+    return code_arr[starts], starts, ends
+
+
+def _sorted_market(df_all):
+    if df_all["code"].is_monotonic_increasing:
+        return df_all.reset_index(drop=True)
+    return df_all.sort_values(["code", "dt"], kind="mergesort").reset_index(drop=True)
+
+
+def _double_top(highs):
+    """
+    寻找最近的两个显著波峰，并校验 M 顶的公共条件
+    返回 (p1_idx, p2_idx)，不满足时返回 None
+    """
+    total_len = len(highs)
+
+    # 1. 寻峰 (6个月数据下，最小间距设为 7 天，显著性 1.5%)
+    peaks, _ = find_peaks(highs, distance=7, prominence=highs.max() * 0.015)
+    if len(peaks) < 2:
+        return None
+
+    # 取最后两个显著波峰 (T1: 左顶, T2: 右顶)
+    p1_idx, p2_idx = peaks[-2], peaks[-1]
+
+    # 右顶 (T2) 必须是最近形成的（发生在最后 7 个交易日内）
+    if (total_len - 1 - p2_idx) > 7:
+        return None
+
+    # 两顶时间间隔合适（8 ~ 90 个交易日）
+    if not (8 <= p2_idx - p1_idx <= 90):
+        return None
+
+    # 两顶高度接近（价差在 3% 以内）
+    t1_high, t2_high = highs[p1_idx], highs[p2_idx]
+    if abs(t1_high - t2_high) / max(t1_high, t2_high) > 0.03:
+        return None
+
+    return p1_idx, p2_idx
+
+
+def m_pattern_arrays(highs, volumes, closes):
+    """
+    M 顶识别（数组版），与 k_line_M_style.detect_m_pattern 规则一致
+    返回: (bool, left_peak_price, right_peak_price, neckline_price)
+    """
+    if len(highs) < 60:
+        return MISS
+
+    tops = _double_top(highs)
+    if tops is None:
+        return MISS
+    p1_idx, p2_idx = tops
+
+    # 颈线位（两顶之间的最低点）
+    neckline = np.min(highs[p1_idx:p2_idx])
+
+    # 量价背离（右顶成交量不能明显超越左顶）
+    if volumes[p2_idx] > volumes[p1_idx] * 1.15:
+        return MISS
+
+    # 最近 3 天至少有 1 天收盘价处于 [颈线 * 0.92, 颈线 * 1.01] 临界区
+    if any(0.92 * neckline <= c <= 1.01 * neckline for c in closes[-3:]):
+        return True, round(highs[p1_idx], 2), round(highs[p2_idx], 2), round(neckline, 2)
+
+    return MISS
+
+
+def n_neckline_arrays(highs, lows, closes):
+    """
+    N 颈线位识别（数组版），与 k_line_N_style.detect_n_neckline_pattern 规则一致
+    返回: (bool, left_peak_price, right_peak_price, neckline_price)
+    """
+    if len(highs) < 60:
+        return MISS
+
+    tops = _double_top(highs)
+    if tops is None:
+        return MISS
+    p1_idx, p2_idx = tops
+
+    # N 颈线位（两顶之间的最低价格）
+    neckline = np.min(lows[p1_idx:p2_idx])
+
+    # 近 3 天至少有一天的收盘价或最低价在 [颈线 * 0.98, 颈线 * 1.03]
+    at_neckline = any(
+        (0.98 * neckline <= c <= 1.03 * neckline) or (0.98 * neckline <= l <= 1.03 * neckline)
+        for c, l in zip(closes[-3:], lows[-3:])
+    )
+    if at_neckline:
+        return True, round(highs[p1_idx], 2), round(highs[p2_idx], 2), round(neckline, 2)
+
+    return MISS
+
+
+def _detect_batch(df_all, detect_fn, columns):
+    df_all = _sorted_market(df_all)
+    arrays = [df_all[c].to_numpy(dtype=np.float64) for c in columns]
+    codes, starts, ends = code_slices(df_all)
+
+    # 不足 60 根 K 线的直接判否，不进入寻峰
+    enough = (ends - starts) >= 60
+    hits = np.zeros(len(codes), dtype=bool)
+    t1 = np.zeros(len(codes))
+    t2 = np.zeros(len(codes))
+    neck = np.zeros(len(codes))
+    for i in np.flatnonzero(enough):
+        s, e = starts[i], ends[i]
+        hits[i], t1[i], t2[i], neck[i] = detect_fn(*(a[s:e] for a in arrays))
+
+    return pd.DataFrame({
+        "code": codes,
+        "is_hit": hits,
+        "t1_price": t1,
+        "t2_price": t2,
+        "neck_price": neck,
+        "last_idx": ends - 1
+    }), df_all
+
+
+def detect_m_pattern_batch(df_all):
+    """
+    全市场 M 顶批量识别
+    :param df_all: 全市场 K 线（含 code, dt, High, Volume, Close），按 code, dt 排序
+    :return: (结果 DataFrame[code, is_hit, t1_price, t2_price, neck_price, last_idx], 排序后的 df_all)
+             last_idx 为该股最后一根 K 线在返回的 df_all 中的行号
+    """
+    return _detect_batch(df_all, m_pattern_arrays, ["High", "Volume", "Close"])
+
+
+def detect_n_neckline_batch(df_all):
+    """
+    全市场 N 颈线位批量识别
+    :param df_all: 全市场 K 线（含 code, dt, High, Low, Close），按 code, dt 排序
+    :return: 同 detect_m_pattern_batch
+    """
+    return _detect_batch(df_all, n_neckline_arrays, ["High", "Low", "Close"])
@@ -0,0 +1,270 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 20:00
+@Desc    : 本地列式 K 线存储（Parquet，按月分区，月内按 code, dt 有序）
+           各看板不再每次从 MySQL stock_detail 拉 3~6 个月全市场 K 线，统一走本模块的 load_* 接口；
+           数据由 etl/insert_mysql_stock_detail.py 每日入库后同步写入当天数据
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.utils import constants, db
+
+STORE_DIR = constants.kline_store_dir
+
+# 落盘字段：与 stock_detail 表结构保持一致
+STORE_COLUMNS = [
+    'dt', 'code', 'stock_name', 'price_open', 'price_close',
+    'price_highest', 'price_lowest', 'trade', 'trade_amount',
+    'amplitude', 'rise', 'amount_increase_decrease', 'turnover_rate',
+    'rise_5', 'rise_10', 'rise_15',
+    'total_market_capitalization', 'trading_market_capitalization', 'ratio'
+]
+
+# 看板统一使用的 K 线列名（mplfinance 需要 Open/High/Low/Close/Volume）
+KLINE_RENAME = {
+    'price_open': 'Open',
+    'price_close': 'Close',
+    'price_highest': 'High',
+    'price_lowest': 'Low',
+    'trade_amount': 'Volume'
+}
+
+# 默认读取的列，对应各看板 SQL 里的 dt, code, stock_name, Open, Close, High, Low, Volume, rise
+KLINE_COLUMNS = ['dt', 'code', 'stock_name', 'price_open', 'price_close',
+                 'price_highest', 'price_lowest', 'trade_amount', 'rise']
+
+# 进程内共享的 K 线快照：preload 之后 load_* / latest_dt 直接从内存过滤，同一进程里的多个看板不再重复读盘
+_shared = {}
+
+
+def _month_path(month):
+    return os.path.join(STORE_DIR, f"stock_detail_{month}.parquet")
+
+
+def list_months():
+    """返回本地已落盘的月份分区（升序，yyyy-MM）"""
+    if not os.path.isdir(STORE_DIR):
+        return []
+    months = [name[len("stock_detail_"):-len(".parquet")] for name in os.listdir(STORE_DIR)
+              if name.startswith("stock_detail_") and name.endswith(".parquet")]
+    return sorted(months)
+
+
+def list_dts():
+    """返回本地已落盘的全部交易日（升序，yyyy-MM-dd），只读 dt 一列"""
+    dts = set()
+    for month in list_months():
+        col = pq.read_table(_month_path(month), columns=['dt'], memory_map=True)['dt']
+        dts.update(d.strftime("%Y-%m-%d") for d in pc.unique(col).to_pylist())
+    return sorted(dts)
+
+
+def latest_dt():
+    """本地存储中的最新交易日，替代各看板的 SELECT MAX(dt) FROM stock_detail"""
+    if _shared:
+        return _shared['latest_dt']
+    months = list_months()
+    if not months:
+        return None
+    col = pq.read_table(_month_path(months[-1]), columns=['dt'], memory_map=True)['dt']
+    return pc.max(col).as_py().strftime("%Y-%m-%d")
+
+
+def months_before(dt, months):
+    """与 MySQL date_sub(dt, interval N month) 一致的日期回退"""
+    return (pd.to_datetime(dt) - pd.DateOffset(months=months)).strftime("%Y-%m-%d")
+
+
+def preload(start_dt):
+    """
+    把 start_dt 所在月份起的全部分区读进内存，之后起始日期不早于 start_dt 的 load_* 都从这份快照过滤
+    由 run_screens.py 在一个进程里跑全部看板前调用一次
+    """
+    start_dt = str(start_dt)[:10]
+    months = [m for m in list_months() if m >= start_dt[:7]]
+    if not months:
+        return 0
+    table = pa.concat_tables([pq.read_table(_month_path(m), memory_map=True) for m in months])
+    latest = pc.max(table['dt']).as_py().strftime("%Y-%m-%d")
+    _shared.update(start_dt=start_dt, table=table, latest_dt=latest)
+    print(f"📦 K 线快照已载入内存：{start_dt} ~ {latest}，{table.num_rows} 行")
+    return table.num_rows
+
+
+def release():
+    """释放内存快照，之后的 load_* 重新读盘"""
+    _shared.clear()
+
+
+def _normalize(df):
+    """整理成落盘格式：固定列顺序，dt 为 date 类型，数值列统一 double"""
+    df = df.copy()
+    for col in STORE_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df = df[STORE_COLUMNS]
+    df['dt'] = pd.to_datetime(df['dt'].astype(str).str[:10]).dt.date
+    df['code'] = df['code'].astype(str)
+    df['stock_name'] = df['stock_name'].astype(str)
+    num_cols = [c for c in STORE_COLUMNS if c not in ('dt', 'code', 'stock_name')]
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors='coerce').astype('float64')
+    return df
+
+
+def _write_month(month, df):
+    # 先写临时文件再原子替换，其它进程读取时不会读到半个文件
+    df = df.sort_values(['code', 'dt']).reset_index(drop=True)
+    path = _month_path(month)
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_partition(dt, df):
+    """
+    写入（覆盖）某个交易日的数据
+    按月分区存放：月内每天 5000 行左右，一个月一个文件，读 6 个月只需打开 7 个文件
+    :param dt: 交易日 yyyy-MM-dd
+    :param df: 当天 stock_detail 全部行
+    """
+    dt = str(dt)[:10]
+    day_df = _normalize(df.assign(dt=dt))
+    month = dt[:7]
+    path = _month_path(month)
+    if os.path.exists(path):
+        old_df = pq.read_table(path).to_pandas()
+        old_df = old_df[old_df['dt'] != day_df['dt'].iloc[0]] if len(day_df) else old_df
+        day_df = pd.concat([old_df, day_df], ignore_index=True)
+    _write_month(month, day_df)
+    return len(df)
+
+
+def load_kline(start_dt, end_dt=None, codes=None, columns=None, exclude_st=False):
+    """
+    读取 [start_dt, end_dt] 区间的 K 线，按 code, dt 排序
+    分区文件以 memory_map 方式打开，多个进程同时读取时共享系统页缓存，不产生额外拷贝
+    :param start_dt: 起始日期（含）
+    :param end_dt: 截止日期（含），默认到最新
+    :param codes: 只取这些股票代码，默认全市场
+    :param columns: 读取的 stock_detail 原始列，默认 KLINE_COLUMNS
+    :param exclude_st: 是否剔除 ST（等价于 upper(stock_name) not like '%ST%'）
+    :return: DataFrame，价格/成交额列已重命名为 Open/Close/High/Low/Volume，dt 为 datetime
+    """
+    start_dt = str(start_dt)[:10]
+    end_dt = str(end_dt)[:10] if end_dt is not None else None
+    columns = list(columns or KLINE_COLUMNS)
+    for must in ('code', 'dt'):
+        if must not in columns:
+            columns.insert(0, must)
+    read_columns = list(columns)
+    if exclude_st and 'stock_name' not in read_columns:
+        read_columns.append('stock_name')
+
+    months = [m for m in list_months() if m >= start_dt[:7] and (end_dt is None or m <= end_dt[:7])]
+    if not months:
+        return pd.DataFrame(columns=[KLINE_RENAME.get(c, c) for c in columns])
+
+    if _shared and start_dt >= _shared['start_dt']:
+        table = _shared['table'].select(read_columns)
+    else:
+        table = pa.concat_tables([
+            pq.read_table(_month_path(m), columns=read_columns, memory_map=True) for m in months
+        ])
+    mask = pc.greater_equal(table['dt'], pa.scalar(pd.Timestamp(start_dt).date()))
+    if end_dt is not None:
+        mask = pc.and_(mask, pc.less_equal(table['dt'], pa.scalar(pd.Timestamp(end_dt).date())))
+    if codes is not None:
+        mask = pc.and_(mask, pc.is_in(table['code'], value_set=pa.array([str(c) for c in codes])))
+    if exclude_st:
+        mask = pc.and_(mask, pc.invert(pc.match_substring(pc.utf8_upper(table['stock_name']), 'ST')))
+    table = table.filter(mask)
+
+    # 每个月文件内部已按 code, dt 有序，这里只需把多个月按 code 归并；用整数键排序比字符串排序快得多
+    code_key = table['code'].to_numpy(zero_copy_only=False)
+    try:
+        code_key = code_key.astype('int64')
+    except ValueError:
+        pass
+    order = np.lexsort((table['dt'].to_numpy(), code_key))
+    table = table.take(order).select(columns)
+
+    df = table.to_pandas(date_as_object=False)
+    return df.rename(columns=KLINE_RENAME)
+
+
+def load_recent_kline(codes=None, months=3, end_dt=None, exclude_st=False, columns=None):
+    """读取截至 end_dt（默认最新交易日）往前 N 个月的 K 线，各看板画图窗口统一用这个"""
+    end_dt = end_dt or latest_dt()
+    if end_dt is None:
+        return load_kline('9999-12-31', columns=columns)
+    return load_kline(months_before(end_dt, months), end_dt, codes=codes, columns=columns, exclude_st=exclude_st)
+
+
+def _merge_month(month, month_df):
+    path = _month_path(month)
+    if os.path.exists(path):
+        old_df = pq.read_table(path).to_pandas()
+        old_df = old_df[~old_df['dt'].isin(set(month_df['dt']))]
+        month_df = pd.concat([old_df, month_df], ignore_index=True)
+    _write_month(month, month_df)
+
+
+def sync_from_mysql(engine, start_dt, end_dt=None, overwrite=False):
+    """
+    从 MySQL stock_detail 回填本地存储（首次初始化 / 修数用）
+    区间内一次查询，服务端游标按 dt 顺序分块读取，读完一个月就合并落盘，内存里最多只有一个月的数据
+    :param overwrite: False 时跳过本地已存在的分区
+    """
+    start_dt = str(start_dt)[:10]
+    cond = "dt >= :start_dt" + (" and dt <= :end_dt" if end_dt else "")
+    params = {"start_dt": start_dt}
+    if end_dt:
+        params["end_dt"] = str(end_dt)[:10]
+
+    print(f"📥 从 stock_detail 回填本地 K 线存储：{start_dt} ~ {end_dt or '最新'}")
+    exists = set(list_dts())
+    sql = f"select {', '.join(STORE_COLUMNS)} from stock_detail where {cond} order by dt"
+    read, written = 0, 0
+    pending = []
+    for chunk in db.iter_sql(sql, params, engine=engine):
+        read += len(chunk)
+        chunk = _normalize(chunk)
+        if not overwrite:
+            chunk = chunk[~chunk['dt'].astype(str).isin(exists)]
+        if chunk.empty:
+            continue
+        pending.append(chunk)
+        # 按 dt 有序：最后一行所在月之前的月份都已读完，整体写入，避免逐天重写月文件
+        last_month = str(chunk['dt'].iloc[-1])[:7]
+        buf = pd.concat(pending, ignore_index=True)
+        months = buf['dt'].astype(str).str[:7]
+        for month, month_df in buf[months < last_month].groupby(months[months < last_month]):
+            _merge_month(month, month_df)
+            written += month_df['dt'].nunique()
+        pending = [buf[months == last_month]]
+
+    if pending:
+        buf = pd.concat(pending, ignore_index=True)
+        months = buf['dt'].astype(str).str[:7]
+        for month, month_df in buf.groupby(months):
+            _merge_month(month, month_df)
+            written += month_df['dt'].nunique()
+    if not read:
+        print("❌ stock_detail 区间内无数据")
+        return 0
+    print(f"✅ 本地 K 线存储回填完成，写入 {written} 个交易日")
+    return written
+
+
+if __name__ == "__main__":
+    engine = db.get_engine()
+    # 首次使用：回填近一年的数据
+    sync_from_mysql(engine, months_before(pd.Timestamp.now(), 12))
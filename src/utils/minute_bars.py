@@ -0,0 +1,332 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 07:20
+@Desc    : 盘中分钟 K 线（1 / 5 / 15 分钟 OHLCV）
+           盘中轮询（get_detail_data.py）已经每 30 秒拿到全市场最新价 f2、累计成交量 f5、累计成交额 f6，
+           但没有任何地方把它们聚合成 K 线，盘中图表 / 规则只能扫原始快照；
+           现在每轮只处理快照增量存储（etl/snapshot_store.py）返回的有变化的股票：按代码定位到数组槽位，
+           向量化更新各周期当前这根 K 线的高 / 低 / 收，跨入新周期的股票把上一根收盘落入已完成列表，每轮计算量只与变化的股票数有关
+           存储：盘中每分钟把新完成的 K 线追加写成一个小 Parquet 分片（minute_bars/<日期>/part-*.parquet），
+           分片攒够 COMPACT_PARTS 个合并进 closed.parquet，当前未完成的 K 线写 open.parquet；收盘后 finalize 合并成一个文件 minute_bars_<日期>.parquet（按 freq, code, bar_time 有序）
+           口径：bar_time 为区间起点；成交量 / 成交额 = 区间内累计值之差（当天第一根包含集合竞价），
+           只有在该区间内有过变化的股票才有这根 K 线
+用法：
+    python -m src.utils.minute_bars 2026-10-19      从快照增量存储重建某天的分钟 K 线
+"""
+import glob
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.utils import constants
+
+STORE_DIR = constants.minute_bar_dir
+
+# 周期（分钟）
+FREQS = (1, 5, 15)
+
+# 盘中分片落盘间隔（秒）
+FLUSH_SECONDS = 60
+
+# 盘中分片攒够这么多个就合并成 closed.parquet，盘中读取时打开的文件数保持在几十个以内
+COMPACT_PARTS = 30
+
+# 按 freq, code 有序写入、行组较小，按代码过滤时只读命中的行组
+ROW_GROUP_ROWS = 10000
+
+BAR_COLUMNS = ['freq', 'bar_time', 'code', 'open', 'high', 'low', 'close', 'volume', 'amount', 'ticks']
+
+_SCHEMA = pa.schema([
+    ('freq', pa.int8()),
+    ('bar_time', pa.timestamp('s')),
+    ('code', pa.string()),
+    ('open', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('close', pa.float64()),
+    ('volume', pa.float64()),
+    ('amount', pa.float64()),
+    ('ticks', pa.int32()),
+])
+
+
+def _day_file(dt):
+    return os.path.join(STORE_DIR, f"minute_bars_{str(dt)[:10]}.parquet")
+
+
+def _day_dir(dt):
+    return os.path.join(STORE_DIR, str(dt)[:10])
+
+
+def _write(df, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    pq.write_table(pa.Table.from_pandas(df[BAR_COLUMNS], schema=_SCHEMA, preserve_index=False), tmp_path,
+                   row_group_size=ROW_GROUP_ROWS)
+    os.replace(tmp_path, path)
+
+
+class _FreqState:
+    """某个周期下每个槽位（股票）当前这根 K 线"""
+
+    def __init__(self, capacity):
+        self.bucket = np.full(capacity, -1, dtype='int64')     # 区间起点（自 epoch 起的分钟数），-1 为还没有 K 线
+        self.open = np.full(capacity, np.nan)
+        self.high = np.full(capacity, np.nan)
+        self.low = np.full(capacity, np.nan)
+        self.close = np.full(capacity, np.nan)
+        self.vol_start = np.zeros(capacity)                     # 区间开始前的累计成交量
+        self.amt_start = np.zeros(capacity)
+        self.ticks = np.zeros(capacity, dtype='int32')
+
+    def grow(self, capacity):
+        for name, fill in (('bucket', -1), ('open', np.nan), ('high', np.nan), ('low', np.nan),
+                           ('close', np.nan), ('vol_start', 0), ('amt_start', 0), ('ticks', 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+class MinuteBarBuilder:
+    """
+    用法：
+        builder = MinuteBarBuilder('2026-10-19')
+        builder.update(changed, ts)     # 每轮轮询后调用，changed 为 SnapshotDeltaStore.submit 的返回值
+        builder.bars(5)                 # 进程内直接取 5 分钟 K 线（含未完成的当前这根）
+        builder.finalize()              # 收盘后合并成当天一个文件
+    """
+
+    def __init__(self, dt, freqs=FREQS, capacity=8192, flush_seconds=FLUSH_SECONDS):
+        self.dt = str(dt)[:10]
+        self.freqs = tuple(freqs)
+        self.flush_seconds = flush_seconds
+        self._slot_of = {}
+        self._codes = np.empty(capacity, dtype=object)
+        self._last_price = np.full(capacity, np.nan)
+        self._last_vol = np.zeros(capacity)
+        self._last_amt = np.zeros(capacity)
+        self._state = {freq: _FreqState(capacity) for freq in self.freqs}
+        # 已完成、尚未落盘 / 已落盘的 K 线分块
+        self._pending = []
+        self._closed = []
+        self._last_flush = None
+        self._parts = 0
+
+    # -------------------- 增量更新 --------------------
+    def _slots(self, codes):
+        slots = np.empty(len(codes), dtype='int64')
+        for i, code in enumerate(codes):
+            slot = self._slot_of.get(code)
+            if slot is None:
+                slot = len(self._slot_of)
+                if slot >= len(self._codes):
+                    self._grow(len(self._codes) * 2)
+                self._slot_of[code] = slot
+                self._codes[slot] = code
+            slots[i] = slot
+        return slots
+
+    def _grow(self, capacity):
+        codes = np.empty(capacity, dtype=object)
+        codes[:len(self._codes)] = self._codes
+        self._codes = codes
+        for name, fill in (('_last_price', np.nan), ('_last_vol', 0), ('_last_amt', 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype='float64')
+            new[:len(old)] = old
+            setattr(self, name, new)
+        for st in self._state.values():
+            st.grow(capacity)
+
+    def _bars_of(self, freq, slots):
+        st = self._state[freq]
+        return pd.DataFrame({
+            'freq': freq,
+            'bar_time': pd.to_datetime(st.bucket[slots] * 60, unit='s'),
+            'code': self._codes[slots].astype(str),
+            'open': st.open[slots],
+            'high': st.high[slots],
+            'low': st.low[slots],
+            'close': st.close[slots],
+            'volume': self._last_vol[slots] - st.vol_start[slots],
+            'amount': self._last_amt[slots] - st.amt_start[slots],
+            'ticks': st.ticks[slots],
+        })
+
+    def update(self, changed, ts):
+        """
+        :param changed: 本轮有变化的股票，index 为代码（f12），至少含 f2 / f5 / f6
+                        关键帧轮次会带上全市场的行，价格和累计量都没变的在这里剔除，不生成 K 线
+        :param ts: 轮询时刻
+        :return: 本轮处理的股票数
+        """
+        ts = pd.Timestamp(ts)
+        price = changed['f2'].to_numpy(dtype='float64')
+        valid = np.isfinite(price) & (price > 0)
+        slots = self._slots(changed.index.to_numpy()[valid].astype(str))
+        price = price[valid]
+        vol = changed['f5'].to_numpy(dtype='float64')[valid]
+        amt = changed['f6'].to_numpy(dtype='float64')[valid]
+        moved = ((price != self._last_price[slots])
+                 | ~((vol == self._last_vol[slots]) | np.isnan(vol))
+                 | ~((amt == self._last_amt[slots]) | np.isnan(amt)))
+        slots, price, vol, amt = slots[moved], price[moved], vol[moved], amt[moved]
+        minute = ts.value // 60_000_000_000
+
+        for freq in self.freqs:
+            st = self._state[freq]
+            bucket = minute - minute % freq
+            cur = st.bucket[slots]
+            roll = cur != bucket
+            # 跨入新周期：上一根 K 线完成（此时 _last_vol 还是上一轮的值，正好是上一根的收盘累计量）
+            done = slots[roll & (cur >= 0)]
+            if len(done):
+                self._pending.append(self._bars_of(freq, done))
+            new, keep = slots[roll], slots[~roll]
+            st.bucket[new] = bucket
+            st.open[new] = st.high[new] = st.low[new] = st.close[new] = price[roll]
+            st.vol_start[new] = self._last_vol[new]
+            st.amt_start[new] = self._last_amt[new]
+            st.ticks[new] = 0
+            st.high[keep] = np.maximum(st.high[keep], price[~roll])
+            st.low[keep] = np.minimum(st.low[keep], price[~roll])
+            st.close[keep] = price[~roll]
+            st.ticks[slots] += 1
+
+        self._last_price[slots] = price
+        self._last_vol[slots] = np.where(np.isnan(vol), self._last_vol[slots], vol)
+        self._last_amt[slots] = np.where(np.isnan(amt), self._last_amt[slots], amt)
+
+        if self._last_flush is None or (ts - self._last_flush).total_seconds() >= self.flush_seconds:
+            self.flush()
+            self._last_flush = ts
+        return len(slots)
+
+    # -------------------- 读取 / 落盘 --------------------
+    def _open_bars(self):
+        frames = []
+        for freq in self.freqs:
+            slots = np.flatnonzero(self._state[freq].bucket[:len(self._slot_of)] >= 0)
+            if len(slots):
+                frames.append(self._bars_of(freq, slots))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=BAR_COLUMNS)
+
+    def bars(self, freq, include_open=True):
+        """进程内读取某个周期的 K 线（按 code, bar_time 有序）"""
+        frames = [b[b['freq'] == freq] for b in self._closed + self._pending]
+        if include_open:
+            frames.append(self._open_bars().query("freq == @freq"))
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=BAR_COLUMNS)
+        return pd.concat(frames, ignore_index=True).sort_values(['code', 'bar_time']).reset_index(drop=True)
+
+    def flush(self):
+        """新完成的 K 线追加写成一个分片，当前未完成的 K 线覆盖写 open.parquet"""
+        day_dir = _day_dir(self.dt)
+        if self._pending:
+            done = pd.concat(self._pending, ignore_index=True)
+            _write(done, os.path.join(day_dir, f"part-{self._parts:05d}.parquet"))
+            self._parts += 1
+            self._closed.append(done)
+            self._pending = []
+            if self._parts >= COMPACT_PARTS:
+                self._compact()
+        _write(self._open_bars(), os.path.join(day_dir, "open.parquet"))
+
+    def _compact(self):
+        """已完成的 K 线整体重写成 closed.parquet，删除分片"""
+        day_dir = _day_dir(self.dt)
+        df = pd.concat(self._closed, ignore_index=True).sort_values(['freq', 'code', 'bar_time'])
+        df = df.reset_index(drop=True)
+        _write(df, os.path.join(day_dir, "closed.parquet"))
+        for path in glob.glob(os.path.join(day_dir, "part-*.parquet")):
+            os.remove(path)
+        self._closed = [df]
+        self._parts = 0
+
+    def finalize(self):
+        """收盘后：全部 K 线合并成当天一个文件（按 freq, code, bar_time 有序），删除盘中分片"""
+        start = time.time()
+        frames = [f for f in self._closed + self._pending + [self._open_bars()] if not f.empty]
+        if not frames:
+            print(f"❌ {self.dt} 没有分钟 K 线")
+            return 0
+        df = pd.concat(frames, ignore_index=True).sort_values(['freq', 'code', 'bar_time']).reset_index(drop=True)
+        _write(df, _day_file(self.dt))
+        shutil.rmtree(_day_dir(self.dt), ignore_errors=True)
+        # 未完成的 K 线已并入当天文件，之后不再单独输出
+        self._closed, self._pending = [df], []
+        for st in self._state.values():
+            st.bucket[:] = -1
+        print(f"✅ {self.dt} 分钟 K 线落盘 {len(df)} 根，耗时 {time.time() - start:.2f}s")
+        return len(df)
+
+
+def load_bars(dt, freq=1, codes=None, columns=None):
+    """
+    读取某天某个周期的分钟 K 线（盘中读分片 + 当前未完成的 K 线，收盘后读合并文件）
+    :return: DataFrame，按 code, bar_time 有序
+    """
+    filters = [('freq', '=', int(freq))]
+    if codes is not None:
+        filters.append(('code', 'in', [str(c) for c in codes]))
+    columns = list(columns or BAR_COLUMNS)
+    read_cols = list(dict.fromkeys(columns + ['code', 'bar_time', 'ticks']))
+
+    path = _day_file(dt)
+    if os.path.exists(path):
+        df = pq.read_table(path, columns=read_cols, filters=filters).to_pandas()
+    else:
+        for attempt in range(3):
+            files = sorted(glob.glob(os.path.join(_day_dir(dt), "*.parquet")))
+            if not files:
+                return pd.DataFrame(columns=columns)
+            try:
+                df = pq.ParquetDataset(files, filters=filters).read(columns=read_cols).to_pandas()
+                break
+            except (FileNotFoundError, OSError):
+                # 读取期间分片正好被合并删除，重新列一次文件
+                if attempt == 2:
+                    raise
+                time.sleep(0.05)
+        # 分片 / 合并文件与 open.parquet 交替写入的瞬间同一根 K 线可能出现两次，保留成交笔数多的（已完成的）
+        df = df.sort_values('ticks', kind='stable').drop_duplicates(['code', 'bar_time'], keep='last')
+    return df.sort_values(['code', 'bar_time']).reset_index(drop=True)[columns]
+
+
+def replay(dt, finalize=True, engine=None):
+    """
+    从快照增量存储（stock_detail_data_delta）回放某天的全部轮询，重建分钟 K 线
+    盘中程序重启时用 finalize=False 接着当天已有的数据继续累积
+    :return: MinuteBarBuilder
+    """
+    from src.etl import snapshot_store
+
+    start = time.time()
+    dt = str(dt)[:10]
+    shutil.rmtree(_day_dir(dt), ignore_errors=True)
+    builder = MinuteBarBuilder(dt, flush_seconds=float('inf'))
+    polls = 0
+    for ts, changed in snapshot_store.iter_polls(dt, engine=engine):
+        builder.update(changed, ts)
+        polls += 1
+    builder.flush_seconds = FLUSH_SECONDS
+    if finalize:
+        builder.finalize()
+    elif polls:
+        builder.flush()
+    print(f"♻️  {dt} 回放 {polls} 轮快照，耗时 {time.time() - start:.2f}s")
+    return builder
+
+
+if __name__ == "__main__":
+    replay(sys.argv[1] if len(sys.argv) > 1 else pd.Timestamp.now().strftime("%Y-%m-%d"))
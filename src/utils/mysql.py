@@ -1,14 +1,12 @@
-import pymysql
+from . import db
 
 
 def connect():
-    cnx = pymysql.connect(host="127.0.0.1",
-                          port=3306,
-                          user="root",
-                          password="000000",
-                          database='stock'
-                         )
-    return cnx
+    """
+    从进程级共享连接池借一个 pymysql 连接（见 utils/db.py），用法不变：cursor() / commit() / close()
+    close() 时归还连接池，连接信息统一取 constants.db_config
+    """
+    return db.raw_connection()
 
 # cnx = connect()
 # # Get a cursor
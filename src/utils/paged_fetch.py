@@ -0,0 +1,58 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 06:10
+@Desc    : 分页接口并发抓取
+           原来逐页串行，每次请求前固定 sleep 2~5 秒、每页之后再 sleep 3~7 秒，总耗时由叠加的 sleep 决定；
+           现在各页并发发出，节奏交给 rate_limit 的限流器（同时在途请求数上限 + 令牌桶保证相邻请求的最小间隔，
+           被 403/429 拦截时整体退避降速），总耗时只受限流速率约束；结果按页码顺序合并
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils import rate_limit
+
+
+def fetch_page(limiter, fetch, page_num, max_retry=5):
+    """
+    在限流器的名额内抓取一页，失败按指数退避重试
+    :param fetch: fetch(page_num) -> 该页数据，异常视为失败
+    :return: 该页数据，重试用尽返回 None
+    """
+    for attempt in range(1, max_retry + 1):
+        with limiter.slot() as issued_at:
+            try:
+                data = fetch(page_num)
+                limiter.on_success()
+                return data
+            except Exception as e:
+                error = e
+                throttled = rate_limit.is_throttled(e)
+        # 放开名额后再等待，不占着并发名额睡眠
+        if throttled:
+            pause = limiter.on_throttle(issued_at)
+            print(f"⚠️  第{page_num}页被限流，整体暂停约 {pause:.1f}s 并降速到 {limiter.rate:.2f} 次/秒")
+        else:
+            delay = min(2 ** attempt, 10) * random.uniform(0.5, 1.0)
+            print(f"⚠️  第{page_num}页失败：{str(error)[:80]}，{delay:.1f}s 后重试第{attempt}次")
+            time.sleep(delay)
+    print(f"❌ 第{page_num}页请求失败（已重试{max_retry}次），跳过")
+    return None
+
+
+def fetch_pages(fetch, page_nums, limiter, max_retry=5):
+    """
+    并发抓取多页，返回与 page_nums 顺序一致的结果列表（失败的页为 None）
+    线程数等于限流器的并发上限，真正的节奏由 limiter.slot() 控制
+    """
+    page_nums = list(page_nums)
+    if not page_nums:
+        return []
+    start = time.time()
+    workers = min(len(page_nums), limiter.max_concurrency)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda p: fetch_page(limiter, fetch, p, max_retry), page_nums))
+    failed = sum(r is None for r in results)
+    print(f"⚡ 并发抓取 {len(page_nums)} 页完成（失败 {failed} 页），耗时 {time.time() - start:.2f}s")
+    return results
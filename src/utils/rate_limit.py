@@ -0,0 +1,165 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/18
+@Time    : 22:00
+@Desc    : 抓取限流：令牌桶 + 单 host 并发上限 + 403/429 自适应退避
+           被风控时速率减半并整体暂停一段时间（指数退避），连续成功后再逐步恢复到设定速率，
+           在不触发反爬的前提下尽量用满允许的吞吐
+"""
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+THROTTLE_STATUS = (403, 429)
+
+# 没有 response 对象时只认 requests 的 HTTPError 文案（"429 Client Error: Too Many Requests for url: ..."），
+# 不能按 "403" / "429" 子串匹配：异常信息里的股票代码（600403、000429）和 URL 参数都可能含这几个数字
+THROTTLE_PATTERN = re.compile(r"\b(?:403|429) Client Error\b|\bToo Many Requests\b|\bForbidden\b")
+
+
+def is_throttled(exc):
+    """判断异常是否为风控拦截（HTTP 403 / 429）：优先看 response.status_code，没有时才看异常文案"""
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is not None:
+        return status in THROTTLE_STATUS
+    return bool(THROTTLE_PATTERN.search(str(exc)))
+
+
+class TokenBucket:
+    """线程安全的令牌桶：每秒补充 rate 个令牌，最多积攒 capacity 个"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self._fixed_capacity = capacity
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+            # 未指定容量时容量跟随速率，降速后不会因为攒下的令牌再来一波突发
+            if not self._fixed_capacity:
+                self.capacity = max(1.0, self.rate)
+                self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self, tokens=1.0):
+        """阻塞直到拿到令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter:
+    """
+    单个 host 的限流器
+    :param rate: 目标速率（次/秒），也是自适应恢复的上限
+    :param max_concurrency: 同一 host 同时在途的请求数上限
+    :param min_rate: 退避时速率下限
+    :param burst: 令牌桶容量，默认等于 rate
+    :param backoff_base: 首次被拦截后的暂停秒数，连续拦截时翻倍
+    :param backoff_max: 单次暂停上限（秒）
+    :param recover_after: 连续成功多少次后速率上调一档
+    """
+
+    def __init__(self, rate, max_concurrency=4, min_rate=0.2, burst=None,
+                 backoff_base=2.0, backoff_max=60.0, recover_after=50):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.recover_after = recover_after
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._pause_until = 0.0
+        self._last_cut = 0.0
+        self._streak = 0
+        self._throttle_count = 0
+        self.throttled_total = 0
+
+    @property
+    def rate(self):
+        return self.bucket.rate
+
+    def _wait_pause(self):
+        while True:
+            with self._lock:
+                wait = self._pause_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    @contextmanager
+    def slot(self):
+        """占用一个并发名额 + 一个令牌，期间发出一次请求；yield 请求发出时刻，供 on_throttle 判断"""
+        with self._slots:
+            self._wait_pause()
+            self.bucket.acquire()
+            yield time.monotonic()
+
+    def on_success(self):
+        with self._lock:
+            self._throttle_count = 0
+            self._streak += 1
+            if self._streak < self.recover_after or self.bucket.rate >= self.max_rate:
+                return
+            self._streak = 0
+            new_rate = min(self.max_rate, self.bucket.rate * 1.25)
+        self.bucket.set_rate(new_rate)
+
+    def on_throttle(self, issued_at=None):
+        """
+        被 403/429 拦截：速率减半，并让所有线程一起暂停（指数退避 + 抖动）
+        :param issued_at: 该请求的发出时刻（slot() 的返回值）；上一次降速之前就已发出的请求
+                          被拦截不再重复降速，避免一波并发请求同时 429 时速率被连续砍到底
+        :return: 本次暂停秒数
+        """
+        with self._lock:
+            self._streak = 0
+            self.throttled_total += 1
+            if issued_at is not None and issued_at < self._last_cut:
+                return max(0.0, self._pause_until - time.monotonic())
+            self._last_cut = time.monotonic()
+            backoff = min(self.backoff_max, self.backoff_base * (2 ** self._throttle_count))
+            self._throttle_count += 1
+            self._pause_until = max(self._pause_until, time.monotonic() + backoff * random.uniform(1.0, 1.5))
+            new_rate = max(self.min_rate, self.bucket.rate * 0.5)
+        self.bucket.set_rate(new_rate)
+        return backoff
+
+
+# host → (限流器, 创建时的参数)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def host_limiter(host, **kwargs):
+    """
+    按 host 共享限流器：同一进程内访问同一 host 的抓取任务共用速率和并发名额
+    :param kwargs: AdaptiveRateLimiter 的参数，只在第一次创建时生效；之后的调用不传参数（取已有的），
+                   或传入与第一次完全相同的参数，参数不同时抛 ValueError，避免调用方悄悄用上别人的限速
+    """
+    with _limiters_lock:
+        if host not in _limiters:
+            _limiters[host] = (AdaptiveRateLimiter(**kwargs), kwargs)
+        limiter, created_with = _limiters[host]
+        if kwargs and kwargs != created_with:
+            raise ValueError(f"{host} 的限流器已按 {created_with} 创建，与本次参数 {kwargs} 不一致")
+        return limiter
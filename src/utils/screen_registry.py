@@ -0,0 +1,41 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 03:10
+@Desc    : 看板注册表
+           各看板在生成函数上用 @register 声明自己的标识、依赖的连涨 / 连跌规则表（etl/streak_rules.py）、
+           需要的 K 线月数和调用参数，run_screens.py 据此在一个进程里统一调度：
+           K 线只读一次、规则表在看板生成前按需重建，不再每个看板单独起一个 Python 进程
+           单独运行脚本（python k_line_xxx.py）时行为不变，装饰器不改变函数本身
+"""
+
+# 调用参数里的占位符，调度时替换成当天交易日（yyyy-MM-dd）
+TODAY = "<today>"
+
+# 看板标识 → 声明
+SCREENS = {}
+
+
+def register(name, rules=None, kline_months=3, params=None):
+    """
+    注册看板生成函数
+    :param name: 看板标识（与 screen_eval 的入选记录标识一致）
+    :param rules: 生成前需要重建的规则表 {规则表: 覆盖参数}，格式同 streak_rules.run_rules
+    :param kline_months: 需要的最近 K 线月数，调度器按所有看板的最大值预读
+    :param params: 生成函数的关键字参数，值为 TODAY 时替换为当天交易日
+    """
+    def decorator(func):
+        if name in SCREENS:
+            raise ValueError(f"看板标识重复：{name}")
+        SCREENS[name] = {
+            "func": func,
+            "rules": rules or {},
+            "kline_months": kline_months,
+            "params": params or {},
+        }
+        return func
+    return decorator
+
+
+def resolve_params(params, today):
+    return {k: today if v == TODAY else v for k, v in params.items()}
@@ -0,0 +1,182 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 09:30
+@Desc    : get_stock_detail_from_akshare 并发抓取：指向本地模拟风控的 HTTP 服务
+           前 N 次请求返回 429，之后返回数据；验证退避、重试、CSV 和断点清单
+运行：
+    python -m pytest -q tests
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+import requests
+
+pytest.importorskip("akshare")
+
+from src import get_stock_detail_from_akshare as fetcher_module  # noqa: E402
+from src.utils import rate_limit  # noqa: E402
+
+START, END = "2026-01-05", "2026-01-09"
+
+
+def _days(start, end):
+    d, end = datetime.strptime(start, "%Y-%m-%d"), datetime.strptime(end, "%Y-%m-%d")
+    while d <= end:
+        if d.weekday() < 5:
+            yield d.strftime("%Y-%m-%d")
+        d += timedelta(days=1)
+
+
+class StubServer:
+    """
+    模拟东方财富历史行情接口：GET /hist?code=&start=&end=，返回中文列名的行情 JSON
+    :param throttle_first: 前多少次请求（不分股票）返回 429
+    :param listed_from: {code: 上市日}，之前的日期没有数据
+    :param soft_empty: 这些股票的第一次请求返回空表（软限流）
+    """
+
+    def __init__(self, throttle_first=0, listed_from=None, soft_empty=()):
+        self.throttle_left = throttle_first
+        self.listed_from = listed_from or {}
+        self.soft_empty = set(soft_empty)
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+                status, body = stub.respond(q["code"], q["start"], q["end"])
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.host = f"127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def respond(self, code, start, end):
+        with self._lock:
+            self.requests.append((code, start, end))
+            if self.throttle_left > 0:
+                self.throttle_left -= 1
+                return 429, {"msg": "Too Many Requests"}
+            if code in self.soft_empty:
+                self.soft_empty.discard(code)
+                return 200, []
+        rows = [{"日期": d, "开盘": 10.0, "收盘": 10.5, "最高": 11.0, "最低": 9.8, "成交量": 1000}
+                for d in _days(start, end) if d >= self.listed_from.get(code, "")]
+        return 200, rows
+
+    def fetch(self, stock_code, start_date, end_date):
+        resp = requests.get(f"http://{self.host}/hist",
+                            params={"code": stock_code, "start": start_date, "end": end_date}, timeout=5)
+        resp.raise_for_status()
+        return pd.DataFrame(resp.json())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    # 只去掉空表重试前的随机等待；限流器本身的退避用下面的小参数，仍然真实生效
+    monkeypatch.setattr(fetcher_module, "random", SimpleNamespace(uniform=lambda a, b: 0.0))
+
+
+def _fetcher(tmp_path, stub, stocks):
+    fetcher = fetcher_module.AKShareStockDataFetcher(
+        output_dir=str(tmp_path), fetch_fn=stub.fetch, host=stub.host, max_workers=4, rate_per_sec=50.0)
+    # 退避时间缩短到毫秒级，逻辑与线上一致
+    fetcher.limiter = rate_limit.AdaptiveRateLimiter(rate=50.0, max_concurrency=4, min_rate=1.0,
+                                                     backoff_base=0.02, backoff_max=0.1)
+    fetcher.get_all_a_stock_list = lambda: [{"stock_code": c, "stock_name": f"股票{c}"} for c in stocks]
+    return fetcher
+
+
+def _read_csv(tmp_path):
+    return pd.read_csv(tmp_path / f"stock_detail_{START}_{END}.csv", dtype={"stock_code": str})
+
+
+def _manifest(fetcher):
+    with open(fetcher.manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_backs_off_on_429_and_fetches_every_code(tmp_path, no_sleep):
+    stocks = ["000001", "000002", "600000", "300001"]
+    with StubServer(throttle_first=2) as stub:
+        fetcher = _fetcher(tmp_path, stub, stocks)
+        fetcher.batch_fetch_and_save(START, END, save_per_n_stocks=2, incremental=False)
+
+    assert fetcher.limiter.throttled_total == 2
+    # 两次 429 里至少有一次降速（同一波并发请求被拦截只降一次）
+    assert fetcher.limiter.rate < 50.0
+    assert len(stub.requests) == len(stocks) + 2
+
+    df = _read_csv(tmp_path)
+    assert sorted(df["stock_code"].unique()) == sorted(stocks)
+    assert len(df) == len(stocks) * 5
+
+    manifest = _manifest(fetcher)
+    assert set(manifest) == set(stocks)
+    for code in stocks:
+        entry = manifest[code]
+        assert entry["status"] == "done"
+        assert (entry["fetched_from"], entry["fetched_to"], entry["last_dt"]) == (START, END, END)
+
+
+def test_soft_empty_and_unlisted_are_told_apart(tmp_path, no_sleep):
+    with StubServer(listed_from={"000002": "2026-03-02"}, soft_empty={"000001"}) as stub:
+        fetcher = _fetcher(tmp_path, stub, ["000001", "000002"])
+        fetcher.batch_fetch_and_save(START, END, incremental=False)
+
+    manifest = _manifest(fetcher)
+    # 第一次空表是软限流，重试后拿到数据
+    assert manifest["000001"]["status"] == "done"
+    # 区间内空表，往前 / 往后看到了区间外的数据：确认当时未上市，视为已覆盖
+    assert manifest["000002"]["status"] == "empty"
+    assert (manifest["000002"]["fetched_from"], manifest["000002"]["fetched_to"]) == (START, END)
+    df = _read_csv(tmp_path)
+    assert set(df["stock_code"]) == {"000001"}
+
+
+def test_failed_codes_are_retried_and_done_codes_skipped(tmp_path, no_sleep):
+    stocks = ["000001", "600000"]
+    # 429 次数超过单只股票的重试次数，第一次运行必然有股票失败
+    with StubServer(throttle_first=3) as stub:
+        fetcher = _fetcher(tmp_path, stub, stocks)
+        fetcher.max_workers = 1
+        fetcher.batch_fetch_and_save(START, END, incremental=False)
+    first = _manifest(fetcher)
+    failed = [c for c in stocks if first[c]["status"] == "failed"]
+    assert failed == ["000001"]
+    assert first["000001"]["fetched_to"] is None
+
+    with StubServer() as stub:
+        fetcher = _fetcher(tmp_path, stub, stocks)
+        fetcher.batch_fetch_and_save(START, END, incremental=False)
+    # 断点续传：只重抓上次失败的股票
+    assert [r[0] for r in stub.requests] == ["000001"]
+    assert _manifest(fetcher)["000001"]["status"] == "done"
+    df = _read_csv(tmp_path)
+    assert sorted(df["stock_code"].unique()) == sorted(stocks)
+    assert len(df) == len(stocks) * 5
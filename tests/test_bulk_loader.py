@@ -0,0 +1,59 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 10:00
+@Desc    : etl/bulk_loader 的 LOAD DATA 临时 TSV：文本里的制表符 / 换行 / 反斜杠 / NULL 按 MySQL 默认转义规则往返
+运行：
+    python -m pytest -q tests
+"""
+import numpy as np
+import pandas as pd
+
+from src.etl import bulk_loader
+
+# MySQL LOAD DATA 默认 ESCAPED BY '\\' 时的转义序列
+_MYSQL_UNESCAPE = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+
+def _mysql_read_tsv(path):
+    """按 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'（默认转义）解析，\\N 为 NULL"""
+    with open(path, encoding="utf-8", newline="") as f:
+        data = f.read()
+    rows, row, field, raw, i = [], [], [], [], 0
+    while i < len(data):
+        c = data[i]
+        if c == "\\" and i + 1 < len(data):
+            nxt = data[i + 1]
+            field.append(_MYSQL_UNESCAPE.get(nxt, nxt))
+            raw.append(c + nxt)
+            i += 2
+            continue
+        if c in "\t\n":
+            row.append(None if "".join(raw) == "\\N" else "".join(field))
+            field, raw = [], []
+            if c == "\n":
+                rows.append(row)
+                row = []
+        else:
+            field.append(c)
+            raw.append(c)
+        i += 1
+    return rows
+
+
+def test_tsv_round_trips_special_text(tmp_path):
+    names = ["平安\t银行", "多行\n名称", "C:\\path\\N", "\\N", 'say "hi"', None, "回车\r结尾"]
+    df = pd.DataFrame({
+        "code": [f"{i:06d}" for i in range(len(names))],
+        "stock_name": names,
+        "price_close": [1.5, np.nan, 2.0, 3.25, 4.0, 5.0, 6.0],
+    })
+    path = tmp_path / "t.tsv"
+    bulk_loader._write_tsv(df, path)
+
+    rows = _mysql_read_tsv(path)
+    assert len(rows) == len(df)
+    assert [r[1] for r in rows] == names
+    assert [r[0] for r in rows] == df["code"].tolist()
+    assert rows[1][2] is None
+    assert float(rows[3][2]) == 3.25
@@ -0,0 +1,102 @@
+"""
+@Author  : zoudexiag
+@Date    : 2026/10/19
+@Time    : 09:00
+@Desc    : utils/rate_limit 自适应限流：注入 429 / 普通错误驱动 AdaptiveRateLimiter
+运行：
+    python -m pytest -q tests
+"""
+import pytest
+import requests
+
+from src.utils import paged_fetch, rate_limit
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response.url = "https://push2.eastmoney.com/api/qt/clist/get?fs=m:1&_=600403"
+    return requests.HTTPError(f"{status} Client Error: for url: {response.url}", response=response)
+
+
+def _limiter(rate=100.0):
+    return rate_limit.AdaptiveRateLimiter(rate=rate, max_concurrency=2, min_rate=1.0,
+                                          backoff_base=0.01, backoff_max=0.05, recover_after=3)
+
+
+def test_is_throttled_uses_status_code():
+    assert rate_limit.is_throttled(_http_error(429))
+    assert rate_limit.is_throttled(_http_error(403))
+    # URL 里带 600403，但状态码是 500，不算风控
+    assert not rate_limit.is_throttled(_http_error(500))
+
+
+def test_is_throttled_ignores_codes_in_message():
+    for msg in (
+        "HTTPSConnectionPool(host='push2.eastmoney.com'): Max retries exceeded with url: /api?_=429871",
+        "股票 600403 数据解析失败",
+        "Connection aborted: 000429",
+    ):
+        assert not rate_limit.is_throttled(requests.ConnectionError(msg))
+    assert rate_limit.is_throttled(Exception("429 Client Error: Too Many Requests for url: https://x"))
+    assert rate_limit.is_throttled(Exception("403 Client Error: Forbidden for url: https://x"))
+
+
+def test_throttle_halves_rate_and_recovers(monkeypatch):
+    monkeypatch.setattr(paged_fetch.time, "sleep", lambda s: None)
+    limiter = _limiter()
+    outcomes = iter([_http_error(429), _http_error(429), "ok"])
+
+    def fetch(page_num):
+        item = next(outcomes)
+        if isinstance(item, Exception):
+            raise item
+        return page_num
+
+    assert paged_fetch.fetch_page(limiter, fetch, 7) == 7
+    assert limiter.throttled_total == 2
+    assert limiter.rate == 25.0
+
+    # 连续成功 recover_after 次后上调一档，最多回到设定速率
+    for _ in range(3 * 20):
+        with limiter.slot():
+            pass
+        limiter.on_success()
+    assert limiter.rate == 100.0
+
+
+def test_plain_errors_do_not_throttle(monkeypatch):
+    monkeypatch.setattr(paged_fetch.time, "sleep", lambda s: None)
+    limiter = _limiter()
+    calls = []
+
+    def fetch(page_num):
+        calls.append(page_num)
+        raise requests.ConnectionError(f"Max retries exceeded with url: /api?pn={page_num}&_=429403")
+
+    assert paged_fetch.fetch_page(limiter, fetch, 1, max_retry=3) is None
+    assert len(calls) == 3
+    assert limiter.throttled_total == 0
+    assert limiter.rate == 100.0
+
+
+def test_concurrent_burst_of_429_cuts_once():
+    limiter = _limiter()
+    # 同一波已发出的请求一起被 429，只降速一次
+    with limiter.slot() as first:
+        pass
+    with limiter.slot() as second:
+        pass
+    limiter.on_throttle(first)
+    limiter.on_throttle(second)
+    assert limiter.throttled_total == 2
+    assert limiter.rate == 50.0
+
+
+def test_host_limiter_rejects_conflicting_settings():
+    host = "test.host_limiter.local"
+    limiter = rate_limit.host_limiter(host, rate=5.0, max_concurrency=2)
+    assert rate_limit.host_limiter(host, rate=5.0, max_concurrency=2) is limiter
+    assert rate_limit.host_limiter(host) is limiter
+    with pytest.raises(ValueError):
+        rate_limit.host_limiter(host, rate=10.0, max_concurrency=2)